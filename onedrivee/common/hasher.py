@@ -1,4 +1,7 @@
+import base64
+import binascii
 import hashlib
+import string
 import zlib
 import sys
 
@@ -21,6 +24,21 @@ def hash_value(file_path, block_size=1048576, algorithm=None):
             algorithm.update(data)
     return algorithm.hexdigest().upper()
 
+class Crc32:
+    """
+    An incremental CRC32 calculator with the interface of hashlib objects. Its hexdigest() equals crc32_value().
+    """
+
+    def __init__(self):
+        self._crc = 0
+
+    def update(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigest(self):
+        return format(self._crc & 0xFFFFFFFF, '08x').upper()
+
+
 def crc32_value(file_path, block_size=1048576):
     """
     Calculate the CRC32 value of the data of the specified file.
@@ -39,3 +57,22 @@ def crc32_value(file_path, block_size=1048576):
                 break
             crc = zlib.crc32(data, crc)
     return format(crc & 0xFFFFFFFF, '08x').upper()
+
+
+def crc32_matches(crc32_hash, remote_crc32_hash):
+    """
+    Compare a value returned by crc32_value() with a CRC32 value reported by OneDrive. The latter is in little
+    endian and may be encoded in either hex or base64.
+    :param str crc32_hash: Value returned by crc32_value().
+    :param str remote_crc32_hash: Value of the crc32Hash property of a remote file.
+    :return True | False: True if the two values represent the same checksum.
+    """
+    if len(remote_crc32_hash) == 8 and all(c in string.hexdigits for c in remote_crc32_hash):
+        remote_bytes = binascii.unhexlify(remote_crc32_hash)
+    else:
+        try:
+            remote_bytes = base64.b64decode(remote_crc32_hash.encode('ascii'))
+        except (ValueError, binascii.Error):
+            return False
+    local_bytes = binascii.unhexlify(crc32_hash)
+    return remote_bytes == local_bytes or remote_bytes[::-1] == local_bytes
@@ -0,0 +1,312 @@
+"""
+Watch directory trees with the inotify system calls of Linux, called through ctypes. Events are read from the kernel
+in batches and reported with the path of the directory they happened in.
+
+The watch table keeps, for each watch descriptor, only the descriptor of the parent directory and the name of the
+directory, so that a tree of many directories costs little memory and a directory moved within the tree keeps correct
+paths for its whole subtree by updating one entry.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+from onedrivee.common import logger_factory
+
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# Names of event flags in the order inotifywait prints them, e.g., "CREATE,ISDIR".
+EVENT_NAMES = collections.OrderedDict([
+    (IN_ACCESS, 'ACCESS'), (IN_MODIFY, 'MODIFY'), (IN_ATTRIB, 'ATTRIB'), (IN_CLOSE_WRITE, 'CLOSE_WRITE'),
+    (IN_CLOSE_NOWRITE, 'CLOSE_NOWRITE'), (IN_OPEN, 'OPEN'), (IN_MOVED_FROM, 'MOVED_FROM'), (IN_MOVED_TO, 'MOVED_TO'),
+    (IN_CREATE, 'CREATE'), (IN_DELETE, 'DELETE'), (IN_DELETE_SELF, 'DELETE_SELF'), (IN_MOVE_SELF, 'MOVE_SELF'),
+    (IN_UNMOUNT, 'UNMOUNT'), (IN_Q_OVERFLOW, 'Q_OVERFLOW'), (IN_IGNORED, 'IGNORED'), (IN_ISDIR, 'ISDIR')])
+
+DEFAULT_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+
+_EVENT_HEADER = struct.Struct('iIII')
+# Room for about a thousand events with short names per read.
+_READ_SIZE = 64 * 1024
+
+# An event as reported to the caller. Path is that of the directory the event happened in, and name that of the entry
+# in it. Cookie pairs a MOVED_FROM event with its MOVED_TO one, and is 0 for other events.
+Event = collections.namedtuple('Event', ('mask', 'cookie', 'path', 'name'))
+
+
+def mask_to_str(mask):
+    """
+    :param int mask:
+    :return str: Names of the flags in the mask, e.g., "CREATE,ISDIR".
+    """
+    return ','.join(name for flag, name in EVENT_NAMES.items() if mask & flag)
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError(errno.ENOSYS, 'inotify is not supported by the C library.')
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class InotifyWatcher:
+    logger = logger_factory.get_logger('InotifyWatcher')
+    # The MOVED_TO event of a move may come in a later read than its MOVED_FROM one. Wait this long for it before taking
+    # a directory as moved out of the watched trees.
+    MOVE_PAIRING_SECONDS = 1
+
+    def __init__(self, mask=DEFAULT_MASK):
+        """
+        :param int mask: Events to watch for. Watches are added to new directories of a watched tree as they appear,
+        so IN_CREATE and IN_MOVED_TO are always included.
+        """
+        self._libc = _load_libc()
+        self._report_mask = mask
+        self.mask = mask | IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_ONLYDIR | IN_DONT_FOLLOW
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self._wake_r, self._wake_w = os.pipe()
+        # Watch descriptor -> (parent watch descriptor or None for a root, name or path of the root).
+        self._watches = {}
+        # (parent watch descriptor, name) -> watch descriptor.
+        self._wd_by_entry = {}
+        # Cookie -> (descriptor of the directory moved from, time to stop waiting for the MOVED_TO event of the cookie).
+        self._moved_from = {}
+        self._closed = False
+        self._reading = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._watches)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def get_path(self, wd):
+        """
+        :param int wd:
+        :return str | None: Path of the directory watched by the descriptor, or None if it is not watched.
+        """
+        names = []
+        while wd is not None:
+            entry = self._watches.get(wd)
+            if entry is None:
+                return None
+            wd, name = entry
+            names.append(name)
+        return '/'.join(reversed(names))
+
+    def _add_watch(self, path, parent_wd, name):
+        """
+        :param str path: Path of the directory.
+        :param int | None parent_wd: Descriptor of the parent directory, or None for a root.
+        :param str name: Name of the directory, or its path for a root.
+        :return int | None: The watch descriptor, or None if the directory cannot be watched.
+        """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e == errno.ENOSPC:
+                self.logger.error('Cannot watch "%s": too many watches. Raise fs.inotify.max_user_watches.', path)
+            elif e not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                self.logger.error('Cannot watch "%s": %s.', path, os.strerror(e))
+            return None
+        old_entry = self._watches.get(wd)
+        if old_entry is not None:
+            # The directory was watched already, e.g., under a name it had before a move.
+            self._wd_by_entry.pop(old_entry, None)
+        self._watches[wd] = (parent_wd, name)
+        self._wd_by_entry[(parent_wd, name)] = wd
+        return wd
+
+    def add_tree(self, path, parent_wd=None, name=None):
+        """
+        Watch a directory and all directories under it. Symbolic links are not followed.
+        :param str path: Path of the directory.
+        :param int | None parent_wd: (Optional) Descriptor of the parent directory, if it is watched.
+        :param str name: (Optional) Name of the directory in the parent directory.
+        :return [str]: Paths of the directories watched.
+        """
+        if parent_wd is None:
+            name = path.rstrip('/')
+        wd = self._add_watch(path, parent_wd, name)
+        if wd is None:
+            return []
+        added = [path]
+        pending = [(path, wd)]
+        while len(pending) > 0:
+            dir_path, dir_wd = pending.pop()
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = [ent.name for ent in it if ent.is_dir(follow_symlinks=False)]
+            except (IOError, OSError):
+                # The directory is gone or cannot be read. Its removal will be reported by its parent.
+                continue
+            for ent_name in entries:
+                ent_path = dir_path + '/' + ent_name
+                ent_wd = self._add_watch(ent_path, dir_wd, ent_name)
+                if ent_wd is not None:
+                    added.append(ent_path)
+                    pending.append((ent_path, ent_wd))
+        return added
+
+    def _remove_tree(self, wd):
+        """
+        Stop watching a directory that moved out of the watched trees, and the directories under it.
+        :param int wd:
+        """
+        children = {}
+        for child_wd, (parent_wd, name) in self._watches.items():
+            children.setdefault(parent_wd, []).append(child_wd)
+        pending = [wd]
+        while len(pending) > 0:
+            w = pending.pop()
+            pending.extend(children.get(w, ()))
+            entry = self._watches.pop(w, None)
+            if entry is not None:
+                self._wd_by_entry.pop(entry, None)
+                self._libc.inotify_rm_watch(self._fd, w)
+
+    def _forget(self, wd):
+        entry = self._watches.pop(wd, None)
+        if entry is not None and self._wd_by_entry.get(entry) == wd:
+            del self._wd_by_entry[entry]
+
+    def read_events(self, timeout=None):
+        """
+        Wait for events and read all those available with as few system calls as possible. Watches are added for
+        directories created or moved into a watched tree before their events are returned, and the paths of directories
+        moved within a tree are updated.
+        :param float | None timeout: (Optional) Seconds to wait for events. None to wait until there are some or the
+        watcher is closed.
+        :return [Event]: Events in the order they happened. An event with mask IN_Q_OVERFLOW means that the kernel
+        dropped events and the trees should be rescanned.
+        """
+        with self._lock:
+            if self._closed:
+                return []
+            self._reading = True
+        try:
+            if len(self._moved_from) > 0:
+                # Wake up in time to stop watching directories moved out of the trees.
+                remaining = max(min(deadline for _, deadline in self._moved_from.values()) - time.time(), 0)
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            ready, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+            if self._fd not in ready:
+                self._expire_moves()
+                return []
+            buf = bytearray()
+            while True:
+                try:
+                    data = os.read(self._fd, _READ_SIZE)
+                except BlockingIOError:
+                    break
+                buf += data
+                if len(data) < _READ_SIZE - 4096:
+                    # A short read means the queue was drained, up to events that would not fit in the buffer anyway.
+                    break
+            events = self._parse(buf)
+            self._expire_moves()
+            return events
+        finally:
+            with self._lock:
+                self._reading = False
+                if self._closed:
+                    self._release()
+
+    def _parse(self, buf):
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = bytes(buf[offset:offset + length]).rstrip(b'\0')
+            offset += length
+            name = os.fsdecode(name)
+            if mask & IN_Q_OVERFLOW:
+                self.logger.warning('Kernel event queue overflowed. Events were lost.')
+                events.append(Event(mask, 0, None, None))
+                continue
+            if mask & IN_IGNORED:
+                self._forget(wd)
+                continue
+            path = self.get_path(wd)
+            if path is None:
+                continue
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    moved_wd = self._wd_by_entry.get((wd, name))
+                    if moved_wd is not None:
+                        self._moved_from[cookie] = (moved_wd, time.time() + self.MOVE_PAIRING_SECONDS)
+                elif mask & IN_MOVED_TO and cookie in self._moved_from:
+                    # Moved within the watched trees. The watches follow the directories, so only fix the name.
+                    moved_wd, _ = self._moved_from.pop(cookie)
+                    self._wd_by_entry.pop(self._watches[moved_wd], None)
+                    self._watches[moved_wd] = (wd, name)
+                    self._wd_by_entry[(wd, name)] = moved_wd
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path + '/' + name, wd, name)
+            if mask & self._report_mask:
+                events.append(Event(mask, cookie, path, name))
+        return events
+
+    def _expire_moves(self):
+        """
+        Stop watching directories whose MOVED_TO event did not come in time, as they moved out of the watched trees.
+        """
+        now = time.time()
+        for cookie, (moved_wd, deadline) in list(self._moved_from.items()):
+            if deadline <= now:
+                del self._moved_from[cookie]
+                self._remove_tree(moved_wd)
+
+    def close(self):
+        """
+        Stop watching. A thread waiting in read_events() returns with no events.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._reading:
+                # The reading thread releases the descriptors when it wakes up.
+                os.write(self._wake_w, b'x')
+            else:
+                self._release()
+
+    def _release(self):
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            os.close(fd)
+        self._watches.clear()
+        self._wd_by_entry.clear()
+        self._moved_from.clear()
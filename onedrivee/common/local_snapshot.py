@@ -0,0 +1,123 @@
+"""
+Snapshots of a local tree: the inode, size and mtime of every entry, by path relative to the root. The snapshot of a
+drive taken when the program stops is compared with the tree when it starts again, so that only what changed in
+between is merged.
+"""
+
+import bisect
+import collections
+import os
+
+# Path relative to the root, e.g., '/foo/bar' -> entry.
+SnapshotEntry = collections.namedtuple('SnapshotEntry', ('is_dir', 'inode', 'size', 'mtime_ns'))
+
+# Extension of the temporary files of downloads in progress.
+TEMP_FILE_EXT = '.!od'
+
+
+def scan(local_root, path_filter=None):
+    """
+    Walk a tree with os.scandir, which stats each entry at most once. Symbolic links are not followed.
+    :param str local_root: Path to the root of the tree.
+    :param onedrivee.common.path_filter.PathFilter | None path_filter: (Optional) Entries to leave out.
+    :return dict[str, SnapshotEntry]: Entries by path relative to the root.
+    """
+    entries = {}
+    pending = ['']
+    while len(pending) > 0:
+        rel_dir_path = pending.pop()
+        try:
+            it = os.scandir(local_root + rel_dir_path)
+        except (IOError, OSError):
+            # The directory is gone or cannot be read. Leave it as it is.
+            continue
+        with it:
+            for ent in it:
+                if os.path.splitext(ent.name)[1] == TEMP_FILE_EXT:
+                    continue
+                rel_path = rel_dir_path + '/' + ent.name
+                try:
+                    is_dir = ent.is_dir(follow_symlinks=False)
+                    if path_filter is not None and path_filter.should_ignore(rel_path, is_dir):
+                        continue
+                    st = ent.stat(follow_symlinks=False)
+                except (IOError, OSError):
+                    continue
+                entries[rel_path] = SnapshotEntry(is_dir, st.st_ino, st.st_size, st.st_mtime_ns)
+                if is_dir:
+                    pending.append(rel_path)
+    return entries
+
+
+def _parent_path(rel_path):
+    return rel_path.rsplit('/', 1)[0]
+
+
+def _has_ancestor_in(rel_path, paths):
+    """
+    :param str rel_path:
+    :param set[str] | dict[str, object] paths:
+    :return True | False: Whether any directory above the path is in paths.
+    """
+    p = _parent_path(rel_path)
+    while p != '':
+        if p in paths:
+            return True
+        p = _parent_path(p)
+    return False
+
+
+def _paths_under(sorted_paths, rel_path):
+    """
+    :param [str] sorted_paths:
+    :param str rel_path:
+    :return [str]: Paths strictly under the path.
+    """
+    # '0' follows '/' in code point order, so the range covers exactly the paths starting with rel_path + '/'.
+    return sorted_paths[bisect.bisect_left(sorted_paths, rel_path + '/'):bisect.bisect_left(sorted_paths, rel_path + '0')]
+
+
+def diff(old, new):
+    """
+    Compare two snapshots of a tree.
+    :param dict[str, SnapshotEntry] old:
+    :param dict[str, SnapshotEntry] new:
+    :return ([(str, str)], set[str]): Entries moved as a whole, as pairs of old and new paths, and the directories
+    whose content changed otherwise, which should be merged. A new or deleted directory is reported by its parent
+    only.
+    """
+    old_only = {p: e for p, e in old.items() if p not in new}
+    new_only = {p: e for p, e in new.items() if p not in old}
+    new_by_inode = {(e.inode, e.is_dir): p for p, e in new_only.items()}
+    sorted_old_paths = sorted(old)
+    # Old path -> new path of entries moved as a whole.
+    moves = {}
+    for old_path in sorted(old_only):
+        e = old_only[old_path]
+        new_path = new_by_inode.get((e.inode, e.is_dir))
+        if new_path is None or _has_ancestor_in(old_path, moves):
+            continue
+        if e.is_dir and any(new.get(new_path + p[len(old_path):]) != old[p]
+                            for p in _paths_under(sorted_old_paths, old_path)):
+            # The content changed as well. Merge both sides instead.
+            continue
+        if not e.is_dir and new_only[new_path][1:] != e[1:]:
+            # The file was written after the move.
+            continue
+        moves[old_path] = new_path
+    moved_to = set(moves.values())
+    changed = []
+    for p in old_only:
+        if p not in moves and not _has_ancestor_in(p, moves):
+            changed.append(p)
+    for p in new_only:
+        if p not in moved_to and not _has_ancestor_in(p, moved_to):
+            changed.append(p)
+    for p, e in new.items():
+        old_entry = old.get(p)
+        if old_entry is not None and not e.is_dir and old_entry != e:
+            changed.append(p)
+    # Entries under a new or deleted directory are covered by the merge of the parent of that directory.
+    appeared_or_gone = set(p for p in changed if p in old_only or p in new_only)
+    dirty_dirs = set(_parent_path(p) for p in changed if not _has_ancestor_in(p, appeared_or_gone))
+    return sorted(moves.items()), dirty_dirs
@@ -0,0 +1,127 @@
+class _Node:
+    __slots__ = ('children', 'value', 'has_value', 'count')
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+        self.has_value = False
+        # Number of values in the subtree rooted at this node, itself included.
+        self.count = 0
+
+
+class PathTrie:
+    """
+    A dict-like map from slash-separated paths to values. Besides lookups by path, it answers whether there is any
+    value under or above a path in O(depth), and lists the values under a path in O(depth + matches). Unlike string
+    prefix matching, "/a/foo" is never considered above "/a/foobar".
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    @staticmethod
+    def _split(path):
+        return path.rstrip('/').split('/')
+
+    def _find(self, path):
+        node = self._root
+        for name in self._split(path):
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def __len__(self):
+        return self._root.count
+
+    def __contains__(self, path):
+        node = self._find(path)
+        return node is not None and node.has_value
+
+    def __getitem__(self, path):
+        node = self._find(path)
+        if node is None or not node.has_value:
+            raise KeyError(path)
+        return node.value
+
+    def get(self, path, default=None):
+        node = self._find(path)
+        if node is None or not node.has_value:
+            return default
+        return node.value
+
+    def __setitem__(self, path, value):
+        nodes = [self._root]
+        for name in self._split(path):
+            node = nodes[-1].children.get(name)
+            if node is None:
+                node = nodes[-1].children[name] = _Node()
+            nodes.append(node)
+        node = nodes[-1]
+        if not node.has_value:
+            node.has_value = True
+            for n in nodes:
+                n.count += 1
+        node.value = value
+
+    def __delitem__(self, path):
+        names = self._split(path)
+        nodes = [self._root]
+        for name in names:
+            node = nodes[-1].children.get(name)
+            if node is None:
+                raise KeyError(path)
+            nodes.append(node)
+        node = nodes[-1]
+        if not node.has_value:
+            raise KeyError(path)
+        node.has_value = False
+        node.value = None
+        for n in nodes:
+            n.count -= 1
+        # Prune the branch that no longer leads to any value.
+        for i in range(len(names), 0, -1):
+            if nodes[i].count > 0:
+                break
+            del nodes[i - 1].children[names[i - 1]]
+
+    def has_descendant(self, path):
+        """
+        :param str path:
+        :return True | False: Whether there is any value strictly under the path.
+        """
+        node = self._find(path)
+        return node is not None and node.count > (1 if node.has_value else 0)
+
+    def has_ancestor(self, path):
+        """
+        :param str path:
+        :return True | False: Whether there is any value strictly above the path.
+        """
+        node = self._root
+        names = self._split(path)
+        for name in names[:-1]:
+            node = node.children.get(name)
+            if node is None:
+                return False
+            if node.has_value:
+                return True
+        return False
+
+    def items_under(self, path):
+        """
+        :param str path:
+        :return [(str, T)]: Paths and values of the path itself and all paths under it.
+        """
+        node = self._find(path)
+        if node is None:
+            return []
+        ret = []
+        stack = [(path.rstrip('/'), node)]
+        while len(stack) > 0:
+            p, n = stack.pop()
+            if n.has_value:
+                ret.append((p, n.value))
+            for name, child in n.children.items():
+                stack.append((p + '/' + name, child))
+        return ret
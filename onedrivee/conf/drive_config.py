@@ -6,8 +6,11 @@ from onedrivee.common import path_filter
 
 class DriveConfig:
     DEFAULT_VALUES = {
-        'max_get_size_bytes': 1048576,
-        'max_put_size_bytes': 524288,
+        'min_get_size_bytes': 1048576,
+        'max_get_size_bytes': 67108864,
+        'min_put_size_bytes': 655360,
+        'max_put_size_bytes': 62914560,
+        'download_concurrency': 4,
         'local_root': None,
         'ignore_files': set(),
     }
@@ -41,20 +44,46 @@ class DriveConfig:
             if v2 != v:
                 cls.DEFAULT_VALUES[k] = v2
 
+    @property
+    def min_get_size_bytes(self):
+        """
+        Smallest size the download fragment size may shrink to.
+        :rtype: int
+        """
+        return self.data['min_get_size_bytes']
+
     @property
     def max_get_size_bytes(self):
         """
+        Largest size the download fragment size may grow to.
         :rtype: int
         """
         return self.data['max_get_size_bytes']
 
+    @property
+    def min_put_size_bytes(self):
+        """
+        Smallest size the upload fragment size may shrink to. Files no larger than this are uploaded in one request.
+        :rtype: int
+        """
+        return self.data['min_put_size_bytes']
+
     @property
     def max_put_size_bytes(self):
         """
+        Largest size the upload fragment size may grow to.
         :rtype: int
         """
         return self.data['max_put_size_bytes']
 
+    @property
+    def download_concurrency(self):
+        """
+        Number of ranges of a large file to download at the same time.
+        :rtype: int
+        """
+        return self.data['download_concurrency']
+
     @property
     def local_root(self):
         """
@@ -85,7 +114,8 @@ class DriveConfig:
 
     def dump(self, exact_dump=False):
         data = {}
-        for key in ['max_get_size_bytes', 'max_put_size_bytes', 'local_root']:
+        for key in ['min_get_size_bytes', 'max_get_size_bytes', 'min_put_size_bytes', 'max_put_size_bytes',
+                    'download_concurrency', 'local_root']:
             if exact_dump or getattr(self, key) != self.DEFAULT_VALUES[key]:
                 data[key] = getattr(self, key)
         ignore_files = [s for s in self.ignore_files if exact_dump or s not in self.DEFAULT_VALUES['ignore_files']]
@@ -8,9 +8,19 @@ class UserConfig:
     Global settings for a user.
     """
 
+    # Ways to run tasks: a fixed number of TaskConsumer threads, or a WorkerPoolManager.
+    TASK_ENGINES = ('threads', 'pools')
+
     DEFAULT_CONFIG = {
-        'num_consumers': 4,
-        'deep_sync_interval_seconds': 300,
+        'num_consumers': 8,
+        'task_engine': 'threads',
+        # Minimum and maximum number of workers by scheduling queue, for the 'pools' engine.
+        'worker_pool_bounds': {'change': [1, 4], 'small_transfer': [1, 8], 'transfer': [1, 4], 'merge': [1, 2]},
+        'delta_sync_interval_seconds': 300,
+        'deep_sync_interval_seconds': 86400,
+        'task_scheduling_policy': 'fair',
+        'task_pool_high_watermark': 20000,
+        'task_pool_low_watermark': 10000,
         'http_retry_after_seconds': 30,
         'default_drive_config': DriveConfig.default_config(),
         'proxies': dict()
@@ -25,7 +35,16 @@ class UserConfig:
             if k not in data:
                 data[k] = self.DEFAULT_CONFIG[k]
         self.num_consumers = data['num_consumers']
+        self.task_engine = data['task_engine']
+        if self.task_engine not in self.TASK_ENGINES:
+            # E.g., the asyncio engine of earlier versions.
+            self.task_engine = self.DEFAULT_CONFIG['task_engine']
+        self.worker_pool_bounds = data['worker_pool_bounds']
+        self.delta_sync_interval_seconds = data['delta_sync_interval_seconds']
         self.deep_sync_interval_seconds = data['deep_sync_interval_seconds']
+        self.task_scheduling_policy = data['task_scheduling_policy']
+        self.task_pool_high_watermark = data['task_pool_high_watermark']
+        self.task_pool_low_watermark = data['task_pool_low_watermark']
         self.http_retry_after_seconds = data['http_retry_after_seconds']
         self.default_drive_config = data['default_drive_config']
         self.proxies = data['proxies']
@@ -39,7 +58,13 @@ class UserConfig:
                 self.proxies = None
         data = {
             'num_consumers': self.num_consumers,
+            'task_engine': self.task_engine,
+            'worker_pool_bounds': self.worker_pool_bounds,
+            'delta_sync_interval_seconds': self.delta_sync_interval_seconds,
             'deep_sync_interval_seconds': self.deep_sync_interval_seconds,
+            'task_scheduling_policy': self.task_scheduling_policy,
+            'task_pool_high_watermark': self.task_pool_high_watermark,
+            'task_pool_low_watermark': self.task_pool_low_watermark,
             'http_retry_after_seconds': self.http_retry_after_seconds,
             'default_drive_config': self.default_drive_config.dump(exact_dump=True),
             'proxies': self.proxies
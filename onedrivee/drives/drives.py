@@ -4,13 +4,17 @@ accesses a file, and a "*item" call accesses either a directory or a file.
 https://github.com/OneDrive/onedrive-api-docs#root-resources
 """
 
+import io
 import json
+import os
 import random
 import time
+from concurrent import futures
 
 import requests
 
 from onedrivee.drives import facets
+from onedrivee.drives import fragments
 from onedrivee.drives import items
 from onedrivee.drives import options
 from onedrivee.drives import resources
@@ -86,6 +90,9 @@ class DriveObject:
     VERSION_KEY = '@version'
     VERSION_VALUE = 0
     BACK_OFF_UNIT = 5
+    STREAM_BUFFER_SIZE = 65536
+    # Size of upload fragments must be a multiple of 320 KiB.
+    PUT_FRAGMENT_UNIT = 327680
 
     logger = logger_factory.get_logger('DriveObject')
 
@@ -104,6 +111,10 @@ class DriveObject:
         else:
             self.drive_path = '/drives/' + data['id']
         self.drive_uri = root.account.client.API_URI
+        self.get_fragment_size = fragments.FragmentSizeController(
+            lambda: (self.config.min_get_size_bytes, self.config.max_get_size_bytes))
+        self.put_fragment_size = fragments.FragmentSizeController(
+            lambda: (self.config.min_put_size_bytes, self.config.max_put_size_bytes), unit=self.PUT_FRAGMENT_UNIT)
 
     @property
     def drive_id(self):
@@ -187,12 +198,14 @@ class DriveObject:
         request = self.root.account.session.get(uri)
         return items.ItemCollection(self, request.json())
 
-    def create_dir(self, name, parent_id=None, conflict_behavior=options.NameConflictBehavior.DEFAULT):
+    def create_dir(self, name, parent_id=None, conflict_behavior=options.NameConflictBehavior.DEFAULT,
+                   parent_path=None):
         """
         Create a new directory under the specified parent directory.
         :param str name: Name of the new directory.
         :param str | None parent_id: (Optional) ID of the parent directory item.
         :param str conflict_behavior: (Optional) What to do if name exists. One value from options.nameConflictBehavior.
+        :param str | None parent_path: (Optional) Path to the parent directory. Used if parent_id is None.
         :rtype: onedrivee.api.items.OneDriveItem
         """
         data = {
@@ -200,12 +213,15 @@ class DriveObject:
             'folder': {},
             '@name.conflictBehavior': conflict_behavior
         }
-        uri = self.get_item_uri(parent_id) + '/children'
+        if parent_id is None and parent_path is not None:
+            uri = self.get_item_uri(item_path=parent_path) + ':/children'
+        else:
+            uri = self.get_item_uri(parent_id) + '/children'
         request = self.root.account.session.post(uri, json=data, ok_status_code=requests.codes.created)
         return items.OneDriveItem(self, request.json())
 
     def upload_file(self, filename, data, size, parent_id=None, parent_path=None,
-                    conflict_behavior=options.NameConflictBehavior.REPLACE):
+                    conflict_behavior=options.NameConflictBehavior.REPLACE, upload_url=None, progress=None):
         """
         Upload a file object to the specified parent directory, the method of which is determined by file size.
         :param str filename: Name of the remote file.
@@ -214,17 +230,22 @@ class DriveObject:
         :param str | None parent_id: (Optional) ID of the parent directory.
         :param str | None parent_path: (Optional) Path to the parent directory.
         :param str conflict_behavior: (Optional) Specify the behavior to use if the file already exists.
+        :param str | None upload_url: (Optional) URL of an upload session to resume. Used for large files only.
+        :param (onedrivee.drives.resources.UploadSession) -> None | None progress: (Optional) Called with the upload
+        session of a large file when it is created and each time a fragment is accepted.
         :rtype: onedrivee.api.items.OneDriveItem
         """
-        if size <= self.config.max_put_size_bytes:
+        if size <= self.put_fragment_size.min_size:
             return self.put_file(filename, data, parent_id, parent_path, conflict_behavior)
         else:
-            return self.put_large_file(filename, data, size, parent_id, parent_path, conflict_behavior)
+            return self.put_large_file(filename, data, size, parent_id, parent_path, conflict_behavior,
+                                       upload_url=upload_url, progress=progress)
 
     def put_large_file(self, filename, data, size, parent_id=None, parent_path=None,
-                       conflict_behavior=options.NameConflictBehavior.REPLACE):
+                       conflict_behavior=options.NameConflictBehavior.REPLACE, upload_url=None, progress=None):
         """
-        Upload a large file by splitting it into fragments.
+        Upload a large file by splitting it into fragments. The next fragment is read from the file while the current
+        one is being sent.
         https://github.com/OneDrive/onedrive-api-docs/blob/master/items/upload_large_files.md
         :param str filename: Name of the remote file.
         :param file data: An opened file object available for reading.
@@ -232,49 +253,124 @@ class DriveObject:
         :param str | None parent_id: (Optional) ID of the parent directory.
         :param str | None parent_path: (Optional) Path to the parent directory.
         :param str conflict_behavior: (Optional) Specify the behavior to use if the file already exists.
+        :param str | None upload_url: (Optional) URL of an upload session to resume. If the session is no longer
+        valid, a new one is created.
+        :param (onedrivee.drives.resources.UploadSession) -> None | None progress: (Optional) Called with the upload
+        session when it is created and each time a fragment is accepted.
         :rtype: onedrivee.api.items.OneDriveItem
         """
-        # Create an upload session.
+        current_session = None
+        if upload_url is not None:
+            current_session = self.get_upload_session(upload_url)
+        if current_session is None:
+            current_session = self._create_upload_session(filename, parent_id, parent_path, conflict_behavior)
+            expected_ranges = [(0, size - 1)]  # Use local value rather than that given in session.
+        else:
+            expected_ranges = current_session.next_ranges
+        if progress is not None:
+            progress(current_session)
+
+        # Upload content.
+        with futures.ThreadPoolExecutor(max_workers=1) as reader:
+            ranges = self._resolve_ranges(expected_ranges, size)
+            fragment = self._next_fragment(ranges)
+            next_chunk = reader.submit(self._read_fragment, data, *fragment)
+            while fragment is not None:  # Ranges must come in order
+                f, t = fragment  # Both inclusive
+                chunk = next_chunk.result()
+                fragment = self._next_fragment(ranges)
+                if fragment is not None:
+                    next_chunk = reader.submit(self._read_fragment, data, *fragment)
+                with self.put_fragment_size.measure(t - f + 1):
+                    request = self._put_file_fragment_with_retries(current_session, chunk, f, t, size, filename)
+                if request.status_code == requests.codes.requested_range_not_satisfiable:
+                    # The server already received the range, likely before the connection was lost. Ask for what it
+                    # still expects.
+                    current_session = self.get_upload_session(current_session.upload_url)
+                    if current_session is None:
+                        raise errors.OneDriveError(request)
+                    ranges = self._resolve_ranges(current_session.next_ranges, size)
+                    fragment = self._next_fragment(ranges)
+                    next_chunk = reader.submit(self._read_fragment, data, *fragment)
+                elif progress is not None:
+                    progress(current_session)
+        return items.OneDriveItem(self, request.json())
+
+    def _create_upload_session(self, filename, parent_id, parent_path, conflict_behavior):
+        """
+        :rtype: onedrivee.drives.resources.UploadSession
+        """
         if parent_id is not None:
             parent_id += ':'
         uri = self.get_item_uri(parent_id, parent_path) + '/' + filename + ':/upload.createSession'
         payload = {'item': {'name': filename}}
         if conflict_behavior != options.NameConflictBehavior.REPLACE:
             payload['item']['@name.conflictBehavior'] = conflict_behavior
-        size_str = str(size)
         request = self.root.account.session.post(uri, json=payload)
-        current_session = resources.UploadSession(request.json())
+        return resources.UploadSession(request.json())
 
-        # Upload content.
-        expected_ranges = [(0, size - 1)]  # Use local value rather than that given in session.
-        while len(expected_ranges) > 0:  # Ranges must come in order
-            f, t = expected_ranges.pop(0)  # Both inclusive
-            if t is None or t >= size:
-                t = size - 1
-            next_cursor = f + self.config.max_put_size_bytes
-            if t >= next_cursor:
-                expected_ranges.insert(0, (next_cursor, t))
-                t = next_cursor - 1
-            data.seek(f)
-            chunk = data.read(t - f + 1)
-
-            #https://dev.onedrive.com/items/upload_large_files.htm#best-practices
-            #use Binary Exponential Back off
-            for times in range(1, 16):
-                request = self._put_file_fragment(current_session, chunk, f, t, size)
-                if request.status_code in (requests.codes.internal_server_error, requests.codes.bad_gateway,
-                        requests.codes.service_unavailable, requests.codes.gateway_timeout):
-                    sleep_time = random.randrange(2**times) * self.BACK_OFF_UNIT 
-                    self.logger.info('Server returned code %d which is assumed recoverable when upload file %s fragment. Retry in %d seconds',
-                                         request.status_code, filename, sleep_time)
-                    time.sleep(sleep_time)
-                    self.account.renew_tokens()
-                else:
-                    break
-            else:
-                raise errors.OneDriveError(request)
-        return items.OneDriveItem(self, request.json())
+    def get_upload_session(self, upload_url):
+        """
+        Query the status of an upload session.
+        :param str upload_url: URL of the upload session.
+        :return onedrivee.drives.resources.UploadSession | None: The session, or None if it cannot accept more data.
+        """
+        try:
+            request = self.root.account.session.get(upload_url)
+        except errors.OneDriveError:
+            return None
+        current_session = resources.UploadSession({'uploadUrl': upload_url})
+        current_session.update(request.json())
+        if len(current_session.next_ranges) == 0:
+            return None
+        return current_session
+
+    @staticmethod
+    def _resolve_ranges(expected_ranges, size):
+        """
+        :param [(int, int | None)] expected_ranges: Ranges of bytes to send. An open range ends at end of file.
+        :param int size: Size of the file.
+        :return [(int, int)]: The ranges with both ends inclusive.
+        """
+        return [(f, size - 1 if t is None or t >= size else t) for f, t in expected_ranges]
+
+    def _next_fragment(self, ranges):
+        """
+        Take the next fragment of the current fragment size off the ranges to send.
+        :param [(int, int)] ranges: Ranges of bytes yet to send. Updated in place.
+        :return (int, int) | None: The fragment, or None if all ranges are taken.
+        """
+        if len(ranges) == 0:
+            return None
+        f, t = ranges[0]
+        end = min(f + self.put_fragment_size.size - 1, t)
+        if end == t:
+            ranges.pop(0)
+        else:
+            ranges[0] = (end + 1, t)
+        return f, end
 
+    @staticmethod
+    def _read_fragment(data, start, end):
+        data.seek(start)
+        return data.read(end - start + 1)
+
+    def _put_file_fragment_with_retries(self, current_session, chunk, start, end, size, filename):
+        #https://dev.onedrive.com/items/upload_large_files.htm#best-practices
+        #use Binary Exponential Back off
+        for times in range(1, 16):
+            request = self._put_file_fragment(current_session, chunk, start, end, size)
+            if request.status_code in (requests.codes.internal_server_error, requests.codes.bad_gateway,
+                    requests.codes.service_unavailable, requests.codes.gateway_timeout):
+                self.put_fragment_size.record_failure()
+                sleep_time = random.randrange(2**times) * self.BACK_OFF_UNIT 
+                self.logger.info('Server returned code %d which is assumed recoverable when upload file %s fragment. Retry in %d seconds',
+                                     request.status_code, filename, sleep_time)
+                time.sleep(sleep_time)
+                self.account.renew_tokens()
+            else:
+                return request
+        raise errors.OneDriveError(request)
 
     def _put_file_fragment(self, current_session, chunk, start, end, size):
         headers = {
@@ -283,9 +379,11 @@ class DriveObject:
         }
         request = self.root.account.session.put(current_session.upload_url, data=chunk, headers=headers,
                 ok_status_code=(requests.codes.accepted, requests.codes.ok, requests.codes.created,
+                                requests.codes.requested_range_not_satisfiable,
                                 requests.codes.internal_server_error, requests.codes.bad_gateway,
                                 requests.codes.service_unavailable, requests.codes.gateway_timeout))
-        current_session.update(request.json())
+        if request.status_code != requests.codes.requested_range_not_satisfiable:
+            current_session.update(request.json())
         return request
 
     def put_file(self, filename, data, parent_id=None, parent_path=None,
@@ -324,33 +422,88 @@ class DriveObject:
         else:
             raise errors.OneDriveError(request)
 
-    def download_file(self, file, size, item_id=None, item_path=None):
+    def download_file(self, file, size, item_id=None, item_path=None, hashers=None, offset=0, progress=None):
         """
-        Download the target item to target file object. If the file is too large, download by fragments.
-        :param file file: An open file object available for writing binary data.
+        Download the target item to target file object. If the file is too large, download by fragments. Fragments
+        are fetched concurrently if the drive config allows and the file object is backed by a file descriptor.
+        :param file | None file: An open file object available for writing binary data. If None, the content is only
+        fed to the hash objects.
         :param int size: Expected size of the item.
         :param str | None item_id: ID of the target file.
         :param str | None item_path: Path to the target file.
-        """
-        if size <= self.config.max_get_size_bytes:
-            self.get_file_content(item_id, item_path, file=file)
+        :param [T] | None hashers: (Optional) Hash objects (e.g., hashlib.sha1()) to update with the content in order.
+        :param int offset: (Optional) Number of leading bytes already downloaded. The file object must be positioned
+        right after them.
+        :param (int) -> None | None progress: (Optional) Called with the number of leading bytes completed each time a
+        fragment is written.
+        """
+        if file is None:
+            file = _DiscardedFile()
+        if offset == 0 and size <= self.get_fragment_size.size:
+            self.get_file_content(item_id, item_path, file=file, hashers=hashers)
             return
-        t = 0
-        while t < size:
-            f = t
-            t += self.config.max_get_size_bytes - 1  # Both inclusive.
-            if t >= size:
-                t = size - 1
-            self.get_file_content(item_id, item_path, range_bytes=(f, t), file=file)
-            t += 1
-
-    def get_file_content(self, item_id=None, item_path=None, range_bytes=None, file=None):
+        if self.config.download_concurrency > 1:
+            try:
+                fd = file.fileno()
+            except (AttributeError, io.UnsupportedOperation):
+                fd = None
+            if fd is not None:
+                self._download_ranges_concurrently(fd, size, item_id, item_path, hashers, offset, progress)
+                return
+        f = offset
+        while f < size:
+            t = min(f + self.get_fragment_size.size, size) - 1
+            self._get_fragment(item_id, item_path, (f, t), file, hashers)
+            if progress is not None:
+                progress(t + 1)
+            f = t + 1
+
+    def _split_ranges(self, size, offset=0):
+        """
+        :param int size: Size of the file.
+        :param int offset: Position of the first byte to download.
+        :return [(int, int)]: Ranges of bytes, both inclusive, of the current fragment size.
+        """
+        step = self.get_fragment_size.size
+        return [(f, min(f + step, size) - 1) for f in range(offset, size, step)]
+
+    def _get_fragment(self, item_id, item_path, range_bytes, file, hashers=None):
+        with self.get_fragment_size.measure(range_bytes[1] - range_bytes[0] + 1):
+            self.get_file_content(item_id, item_path, range_bytes=range_bytes, file=file, hashers=hashers)
+
+    def _download_ranges_concurrently(self, fd, size, item_id, item_path, hashers, offset, progress):
+        """
+        Download ranges of the file at the same time and write them to a preallocated file with positional writes.
+        Since ranges complete out of order, hash objects and progress are updated as the leading ranges complete.
+        """
+        os.ftruncate(fd, size)
+        ranges = self._split_ranges(size, offset)
+        with futures.ThreadPoolExecutor(max_workers=self.config.download_concurrency) as executor:
+            jobs = [executor.submit(self._get_fragment, item_id, item_path, r, _PositionalFile(fd, r[0]))
+                    for r in ranges]
+            try:
+                for (f, t), job in zip(ranges, jobs):
+                    job.result()
+                    if hashers is not None:
+                        content = os.pread(fd, t - f + 1, f)
+                        for h in hashers:
+                            h.update(content)
+                    if progress is not None:
+                        progress(t + 1)
+            except Exception:
+                for job in jobs:
+                    job.cancel()
+                raise
+
+    def get_file_content(self, item_id=None, item_path=None, range_bytes=None, file=None, hashers=None):
         """
         Get the content of an item.
         :param str | None item_id: ID of the target file.
         :param str | None item_path: Path to the target file.
         :param (int, int) | None range_bytes: Range of the bytes to download.
-        :param file | None file: An opened file object. If set, write the content there. Otherwise return the content.
+        :param file | None file: An opened file object. If set, stream the content there in chunks of fixed size.
+        Otherwise return the content.
+        :param [T] | None hashers: (Optional) Hash objects to update with the streamed content.
         :rtype: bytes
         """
         uri = self.get_item_uri(item_id, item_path) + '/content'
@@ -360,11 +513,20 @@ class DriveObject:
         else:
             headers = {'Range': 'bytes=%d-%d' % range_bytes}
             ok_status_code = requests.codes.partial
-        request = self.root.account.session.get(uri, headers=headers, ok_status_code=ok_status_code)
-        if file is not None:
-            file.write(request.content)
-        else:
+        if file is None:
+            request = self.root.account.session.get(uri, headers=headers, ok_status_code=ok_status_code)
             return request.content
+        request = self.root.account.session.get(uri, headers=headers, ok_status_code=ok_status_code, stream=True)
+        try:
+            # iter_content turns errors of the connection in the middle of the body into requests exceptions, which
+            # are IOErrors, rather than leaking those of urllib3.
+            for chunk in request.iter_content(self.STREAM_BUFFER_SIZE):
+                file.write(chunk)
+                if hashers is not None:
+                    for h in hashers:
+                        h.update(chunk)
+        finally:
+            request.close()
 
     def delete_item(self, item_id=None, item_path=None):
         """
@@ -454,8 +616,26 @@ class DriveObject:
         request = self.root.account.session.get(uri, params=params)
         return items.ItemCollection(self, request.json())
 
-    def get_changes(self):
-        raise NotImplementedError('The API feature is not used yet.')
+    def get_changes(self, token=None, item_id=None, item_path=None):
+        """
+        Enumerate the items that changed under the target directory (default: root) since the state the token refers
+        to. Deleted items carry a "deleted" facet and may only have an ID.
+        https://github.com/OneDrive/onedrive-api-docs/blob/master/items/view_delta.md
+        :param str | None token: (Optional) Cursor returned by a previous enumeration. None to enumerate all items, or
+        'latest' to only get the current cursor.
+        :param str | None item_id: (Optional) ID of the target directory.
+        :param str | None item_path: (Optional) Path to the target directory.
+        :rtype: onedrivee.drives.items.ItemChangeCollection
+        """
+        uri = self.get_item_uri(item_id, item_path)
+        if item_path is not None:
+            uri += ':'
+        uri += '/view.delta'
+        params = None
+        if token is not None:
+            params = {'token': token}
+        request = self.root.account.session.get(uri, params=params)
+        return items.ItemChangeCollection(self, request.json())
 
     def get_special_dir(self, name):
         raise NotImplementedError('The API feature is not used yet.')
@@ -477,3 +657,30 @@ class DriveObject:
         except ValueError as e:
             cls.logger.warning('Faild to register deserialized drive %s to drive root: %s', drive.drive_id, e)
         return drive
+
+
+class _PositionalFile:
+    """
+    A write-only file-like object that writes to a file descriptor from the given offset on, without moving the
+    file position shared with other writers.
+    """
+
+    def __init__(self, fd, offset):
+        self.fd = fd
+        self.offset = offset
+
+    def write(self, data):
+        data = memoryview(data)
+        while len(data) > 0:
+            written = os.pwrite(self.fd, data, self.offset)
+            data = data[written:]
+            self.offset += written
+
+
+class _DiscardedFile:
+    """
+    A write-only file-like object that drops all data written to it.
+    """
+
+    def write(self, data):
+        pass
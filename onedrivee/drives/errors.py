@@ -17,6 +17,8 @@ class OneDriveError(Exception):
                 self.__class__ = OneDriveTokenExpiredError
             elif self.errno == 'server_internal_error':
                 self.__class__ = OneDriveServerInternalError
+            elif self.errno == 'resyncRequired':
+                self.__class__ = OneDriveResyncRequiredError
         else:
             self.__class__ = OneDriveInvaildRepsonseFormat
             self.build_error_description(bad_request)
@@ -40,6 +42,9 @@ class OneDriveServerInternalError(OneDriveError):
 class OneDriveUnauthorizedError(OneDriveError):
     pass
 
+class OneDriveResyncRequiredError(OneDriveError):
+    pass
+
 class OneDriveInvaildRepsonseFormat(OneDriveError):
     pass
 
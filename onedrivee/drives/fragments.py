@@ -0,0 +1,123 @@
+"""
+Adaptive sizing of the fragments large files are transferred in. Larger fragments cost fewer requests on a fast link,
+while smaller ones lose less work when a slow or flaky link drops a request.
+"""
+
+import threading
+import time
+
+
+class FragmentSizeController:
+    """
+    Learn a fragment size within the bounds given by the drive config. The size doubles after a few consecutive
+    fragments that complete well within TARGET_SECONDS, unless the throughput dropped at the bigger size. It halves
+    when a fragment is slow or fails.
+    """
+
+    TARGET_SECONDS = 20
+    GROW_AFTER = 3
+    # Undo a growth step if it brings throughput below this ratio of what the smaller size achieved.
+    MIN_GROWTH_GAIN = 0.8
+
+    def __init__(self, get_bounds, unit=1):
+        """
+        :param () -> (int, int) get_bounds: Return the minimum and maximum fragment size in bytes.
+        :param int unit: The API only accepts fragment sizes that are multiples of this value.
+        """
+        self._get_bounds = get_bounds
+        self.unit = unit
+        self._size = None
+        self._fast_count = 0
+        self._throughput_before_growth = None
+        self._lock = threading.Lock()
+
+    @property
+    def min_size(self):
+        """
+        :rtype: int
+        """
+        min_size, max_size = self._get_bounds()
+        return self._round(min(min_size, max_size))
+
+    @property
+    def size(self):
+        """
+        Current fragment size, clamped to the bounds.
+        :rtype: int
+        """
+        min_size, max_size = self._get_bounds()
+        size = self._size if self._size is not None else min_size
+        return self._round(max(min(size, max_size), min(min_size, max_size)))
+
+    @size.setter
+    def size(self, v):
+        """
+        :param int v: A learned fragment size, e.g., restored from the last run.
+        """
+        with self._lock:
+            self._size = v
+            self._fast_count = 0
+            self._throughput_before_growth = None
+
+    def _round(self, size):
+        if size < self.unit:
+            return size
+        return size - size % self.unit
+
+    def record_success(self, nbytes, seconds):
+        """
+        :param int nbytes: Size of the fragment transferred.
+        :param float seconds: Time the transfer took, including retries.
+        """
+        throughput = nbytes / max(seconds, 1e-3)
+        with self._lock:
+            size = self.size
+            if seconds > self.TARGET_SECONDS:
+                self._shrink(size)
+            elif self._throughput_before_growth is not None and \
+                    throughput < self._throughput_before_growth * self.MIN_GROWTH_GAIN:
+                self._shrink(size)
+            elif seconds < self.TARGET_SECONDS / 4 and nbytes >= size:
+                self._fast_count += 1
+                if self._fast_count >= self.GROW_AFTER:
+                    self._fast_count = 0
+                    self._throughput_before_growth = throughput
+                    self._size = size * 2
+            else:
+                self._fast_count = 0
+
+    def record_failure(self):
+        """
+        Call when a fragment times out or the server returns a 5xx status.
+        """
+        with self._lock:
+            self._shrink(self.size)
+
+    def _shrink(self, size):
+        self._fast_count = 0
+        self._throughput_before_growth = None
+        self._size = max(size // 2, self.min_size)
+
+    def measure(self, nbytes):
+        """
+        :param int nbytes: Size of the fragment to transfer.
+        :return FragmentTimer: A context manager that records the transfer when it exits.
+        """
+        return FragmentTimer(self, nbytes)
+
+
+class FragmentTimer:
+    def __init__(self, controller, nbytes):
+        self.controller = controller
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.controller.record_success(self.nbytes, time.time() - self.start)
+        else:
+            self.controller.record_failure()
+        return False
@@ -1,3 +1,5 @@
+from urllib import parse as url_parse
+
 from onedrivee.drives import facets
 from onedrivee.drives import resources
 from onedrivee.common.dateparser import str_to_datetime
@@ -38,6 +40,26 @@ class ItemCollection:
         return [OneDriveItem(self._drive, d) for d in self._data['value']]
 
 
+class ItemChangeCollection(ItemCollection):
+    """
+    Pages of changed items returned by a view.delta call. After the last page is fetched, `token` is the cursor to
+    pass to the next enumeration.
+    """
+
+    @property
+    def token(self):
+        """
+        :return str | None: The cursor representing the state after the fetched changes.
+        """
+        if '@delta.token' in self._data:
+            return self._data['@delta.token']
+        if '@odata.deltaLink' in self._data:
+            query = url_parse.parse_qs(url_parse.urlparse(self._data['@odata.deltaLink']).query)
+            if 'token' in query:
+                return query['token'][0]
+        return None
+
+
 class OneDriveItem:
     def __init__(self, drive, data):
         """
@@ -51,6 +73,13 @@ class OneDriveItem:
         else:
             self._fs_info = None
 
+    @property
+    def data(self):
+        """
+        :return dict: The JSON response the item is built from.
+        """
+        return self._data
+
     @property
     def id(self):
         """
@@ -65,6 +94,20 @@ class OneDriveItem:
         """
         return OneDriveItemTypes.FOLDER in self._data
 
+    @property
+    def is_root(self):
+        """
+        :return True | False: True if the item is the root directory of the drive.
+        """
+        return 'root' in self._data
+
+    @property
+    def is_deleted(self):
+        """
+        :return True | False: True if the item is reported deleted by a change enumeration.
+        """
+        return 'deleted' in self._data
+
     @property
     def type(self):
         """
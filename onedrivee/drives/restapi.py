@@ -73,7 +73,7 @@ class ManagedRESTClient:
                 else:
                     raise e
 
-    def get(self, url, params=None, headers=None, ok_status_code=requests.codes.ok, auto_renew=True):
+    def get(self, url, params=None, headers=None, ok_status_code=requests.codes.ok, auto_renew=True, stream=False):
         """
         Perform a HTTP GET request.
         :param str url: URL of the HTTP request.
@@ -81,6 +81,7 @@ class ManagedRESTClient:
         :param dict | None headers: (Optional) Additional headers for the HTTP request.
         :param int ok_status_code: (Optional) Expected status code for the HTTP response.
         :param True | False auto_renew: (Optional) If True, auto recover from expired token error or Internet failure.
+        :param True | False stream: (Optional) If True, do not read the response body until it is accessed.
         :rtype: requests.Response
         """
         args = {'proxies': self.proxies}
@@ -88,6 +89,8 @@ class ManagedRESTClient:
             args['params'] = params
         if headers is not None:
             args['headers'] = headers
+        if stream:
+            args['stream'] = True
         return self.request('get', url, args, ok_status_code=ok_status_code, auto_renew=auto_renew)
 
     def download(self):
@@ -1 +1 @@
-__all__ = ['account_db', 'items_db', 'userconf_db']
+__all__ = ['account_db', 'items_db', 'snapshot_db', 'task_db', 'userconf_db']
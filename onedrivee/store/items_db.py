@@ -1,10 +1,12 @@
 import atexit
+import os
 import sqlite3
+import time
 from urllib import parse as url_parse
 
 from onedrivee.common import logger_factory
 from onedrivee.common import hasher 
-from onedrivee.common.dateparser import datetime_to_str, str_to_datetime
+from onedrivee.common.dateparser import datetime_to_str, str_to_datetime, datetime_to_timestamp
 from onedrivee.common.rwlock import ReadWriteLock
 
 
@@ -23,11 +25,28 @@ class ItemRecordStatuses:
 class ItemRecord:
     def __init__(self, row):
         self.item_id, self.type, self.item_name, self.parent_id, self.parent_path, self.e_tag, self.c_tag, self.size, \
-        self.created_time, self.modified_time, self.status, self.crc32_hash, self.sha1_hash = row
-        self.created_time = str_to_datetime(self.created_time)
-        self.modified_time = str_to_datetime(self.modified_time)
+        self._created_time, self._modified_time, self.status, self.crc32_hash, self.sha1_hash = row
         self.local_path = self.parent_path.split(':', 1)[1] + '/' + self.item_name
 
+    # Most records are only looked up for their tags. Parse timestamps when they are first used.
+    @property
+    def created_time(self):
+        """
+        :rtype: datetime.datetime
+        """
+        if isinstance(self._created_time, str):
+            self._created_time = str_to_datetime(self._created_time)
+        return self._created_time
+
+    @property
+    def modified_time(self):
+        """
+        :rtype: datetime.datetime
+        """
+        if isinstance(self._modified_time, str):
+            self._modified_time = str_to_datetime(self._modified_time)
+        return self._modified_time
+
 
 class ItemStorageManager:
     logger = logger_factory.get_logger('ItemStorageManager')
@@ -71,8 +90,64 @@ class ItemStorage:
         crc32_hash    TEXT,
         sha1_hash     TEXT
       );
+      CREATE TABLE IF NOT EXISTS local_hashes (
+        device        INT,
+        inode         INT,
+        size          INT,
+        mtime_ns      INT,
+        crc32_hash    TEXT,
+        sha1_hash     TEXT,
+        PRIMARY KEY (device, inode) ON CONFLICT REPLACE
+      );
+      CREATE TABLE IF NOT EXISTS remote_hashes (
+        item_id       TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+        ctag          TEXT,
+        sha1_hash     TEXT
+      );
+      CREATE TABLE IF NOT EXISTS partial_downloads (
+        local_path    TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+        item_id       TEXT,
+        ctag          TEXT,
+        size          INT,
+        bytes_done    INT
+      );
+      CREATE TABLE IF NOT EXISTS upload_sessions (
+        local_path    TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+        upload_url    TEXT,
+        expires_at    REAL,
+        size          INT,
+        mtime         REAL,
+        next_ranges   TEXT
+      );
+      CREATE TABLE IF NOT EXISTS drive_state (
+        key   TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+        value TEXT
+      );
     '''
 
+    # Each script upgrades the schema by one version. Databases created before versioning are at version 0 and
+    # already have some of the tables, so the first script must be idempotent. Never edit a released script; append
+    # a new one instead.
+    schema_migrations = [
+        create_table_sql_content,
+        '''
+          CREATE INDEX IF NOT EXISTS items_parent_path_name ON items (parent_path, item_name);
+          CREATE INDEX IF NOT EXISTS items_parent_id ON items (parent_id);
+          CREATE INDEX IF NOT EXISTS items_crc32_hash ON items (crc32_hash);
+          CREATE INDEX IF NOT EXISTS items_sha1_hash ON items (sha1_hash);
+        ''',
+    ]
+
+    DELTA_TOKEN_KEY = 'delta_token'
+    ROOT_ID_KEY = 'root_id'
+    GET_FRAGMENT_SIZE_KEY = 'get_fragment_size'
+    PUT_FRAGMENT_SIZE_KEY = 'put_fragment_size'
+    # Commit a batch of writes once it has this many writes or is this old.
+    BATCH_SIZE = 1000
+    BATCH_SECONDS = 2
+    # A file modified within this interval may be modified again without changing its mtime. Do not cache its hash.
+    RACY_INTERVAL_NS = 2 * 10 ** 9
+
     def __init__(self, db_path, drive):
         """
         :param str db_path: A unique path for the database to store items for the target drive.
@@ -84,16 +159,82 @@ class ItemStorage:
         self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
         self.drive = drive
         self._cursor = self._conn.cursor()
-        self._cursor.execute(ItemStorage.create_table_sql_content)
-        self._conn.commit()
+        self._migrate()
+        self._cursor.execute('PRAGMA journal_mode=WAL')
+        self._cursor.execute('PRAGMA synchronous=NORMAL')
+        self._pending_writes = 0
+        self._batch_started_at = None
+        self._closed = False
+        atexit.register(self.close)
+        self._restore_fragment_sizes()
+
+    def _migrate(self):
+        """
+        Bring the database schema to the latest version. The version is kept in PRAGMA user_version.
+        """
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        for i in range(version, len(self.schema_migrations)):
+            self.logger.debug('Migrating items database of drive "%s" to schema version %d.', self.drive.drive_id, i + 1)
+            self._cursor.executescript('BEGIN;' + self.schema_migrations[i] + 'PRAGMA user_version=%d; COMMIT;' % (i + 1))
+
+    @staticmethod
+    def _subtree_range(path):
+        """
+        All parent paths under the path lie in the returned range, so that they can be found with an index range scan
+        rather than LIKE. '0' is the character right after '/'.
+        :param str path: Remote path of a directory, e.g., '/drive/root:/foo'.
+        :return (str, str): Lower bound (inclusive) and upper bound (exclusive) of the parent paths.
+        """
+        return path + '/', path + '0'
 
     def __del__(self):
         self.close()
 
     def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Do not take the lock. This may run from __del__ while another storage of the drive holds it.
+        self._commit()
         self._cursor.close()
         self._conn.close()
 
+    def _begin_write(self):
+        """
+        Take the write lock and join the open batch, or start one. Writes in a batch share one transaction, so they
+        cost one commit in total. Reads go through the same connection and hence see them before the commit.
+        """
+        self.lock.acquire_write()
+        if not self._conn.in_transaction:
+            self._cursor.execute('BEGIN')
+            self._batch_started_at = time.time()
+
+    def _end_write(self):
+        self._pending_writes += 1
+        if self._is_flush_due():
+            self._commit()
+        self.lock.release_write()
+
+    def _is_flush_due(self):
+        return self._pending_writes >= self.BATCH_SIZE or \
+               (self._batch_started_at is not None and time.time() - self._batch_started_at >= self.BATCH_SECONDS)
+
+    def _commit(self):
+        if self._conn.in_transaction:
+            self._conn.commit()
+        self._pending_writes = 0
+        self._batch_started_at = None
+
+    def flush(self, only_if_due=False):
+        """
+        Commit the open batch of writes.
+        :param True | False only_if_due: If True, commit only if the batch is large or old enough.
+        """
+        self.lock.acquire_write()
+        if not only_if_due or self._is_flush_due():
+            self._commit()
+        self.lock.release_write()
+
     def local_path_to_remote_path(self, path):
         return path.replace(self.drive.config.local_root, self.drive.drive_path + '/root:', 1)
 
@@ -114,6 +255,20 @@ class ItemStorage:
         args = {'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name}
         return self.get_items(args)
 
+    def get_items_by_parent(self, parent_path=None, local_parent_path=None):
+        """
+        Find all records under a directory with one query.
+        :param str parent_path: Path reference of the directory.
+        :param str local_parent_path: Local path to the directory.
+        :return dict[str, dict[str, onedrivee.store.items_db.ItemRecord]]: Records indexed by item name, then by ID.
+        """
+        if local_parent_path is not None:
+            parent_path = self.local_path_to_remote_path(local_parent_path)
+        ret = {}
+        for item_id, record in self.get_items({'parent_path': parent_path}).items():
+            ret.setdefault(record.item_name, {})[item_id] = record
+        return ret
+
     def get_items_by_hash(self, crc32_hash=None, sha1_hash=None):
         """
         Find all qualified records from database whose hash values match either parameter.
@@ -185,20 +340,19 @@ class ItemStorage:
                 sha1_hash = file_facet.hashes.sha1
             else:
                 item_local_path = self.remote_path_to_local_path(parent_path + "/" + item.name)
-                crc32_hash = hasher.crc32_value(item_local_path)
-                sha1_hash = hasher.hash_value(item_local_path)
+                crc32_hash = self.get_local_crc32_hash(item_local_path)
+                sha1_hash = self.get_local_sha1_hash(item_local_path)
         
         created_time_str = datetime_to_str(item.created_time)
         modified_time_str = datetime_to_str(item.modified_time)
-        self.lock.acquire_write()
+        self._begin_write()
         self._cursor.execute(
                 'INSERT OR REPLACE INTO items (item_id, type, item_name, parent_id, parent_path, etag, '
                 'ctag, size, created_time, modified_time, status, crc32_hash, sha1_hash)'
                 ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
                 (item.id, item.type, item.name, parent_ref.id, parent_path, item.e_tag, item.c_tag,
                  item.size, created_time_str, modified_time_str, status, crc32_hash, sha1_hash))
-        self._conn.commit()
-        self.lock.release_write()
+        self._end_write()
 
     def delete_item(self, item_id=None, parent_path=None, item_name=None, local_parent_path=None, is_folder=False):
         """
@@ -212,7 +366,7 @@ class ItemStorage:
         if local_parent_path is not None:
             parent_path = self.local_path_to_remote_path(local_parent_path)
         where, values = self._get_where_clause({'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name})
-        self.lock.acquire_write()
+        self._begin_write()
         if is_folder:
             # Translate ID reference to path and name reference.
             q = self._cursor.execute('SELECT item_id, parent_path, item_name FROM items WHERE ' + where, values)
@@ -221,11 +375,12 @@ class ItemStorage:
                 self.logger.warning('The folder to delete does not exist: %s, %s', where, str(values))
             else:
                 item_id, parent_path, item_name = row
-                self._cursor.execute('DELETE FROM items WHERE parent_id=? OR parent_path LIKE ?',
-                                     (item_id, parent_path + '/' + item_name + '/%'))
+                path = parent_path + '/' + item_name
+                self._cursor.execute('DELETE FROM items WHERE parent_id=? OR parent_path=? OR '
+                                     '(parent_path>=? AND parent_path<?)',
+                                     (item_id, path) + self._subtree_range(path))
         self._cursor.execute('DELETE FROM items WHERE ' + where, values)
-        self._conn.commit()
-        self.lock.release_write()
+        self._end_write()
 
     def update_status(self, status, item_id=None, parent_path=None, item_name=None, local_parent_path=None):
         """
@@ -240,7 +395,248 @@ class ItemStorage:
             parent_path = self.local_path_to_remote_path(local_parent_path)
         where, values = self._get_where_clause({'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name})
         values = (status,) + values
-        self.lock.acquire_write()
+        self._begin_write()
         self._cursor.execute('UPDATE items SET status=? WHERE ' + where, values)
-        self._conn.commit()
-        self.lock.release_write()
+        self._end_write()
+
+    def move_children(self, old_path, new_path):
+        """
+        Rewrite the parent path of all records under a moved directory.
+        :param str old_path: Old remote path of the directory, e.g., '/drive/root:/foo'.
+        :param str new_path: New remote path of the directory.
+        """
+        self._begin_write()
+        self._cursor.execute('UPDATE items SET parent_path=? || substr(parent_path, ?) '
+                             'WHERE parent_path=? OR (parent_path>=? AND parent_path<?)',
+                             (new_path, len(old_path) + 1, old_path) + self._subtree_range(old_path))
+        self._end_write()
+
+    def get_state(self, key):
+        """
+        :param str key: Name of the drive-wise state value.
+        :return str | None: The stored value, or None if not set.
+        """
+        self.lock.acquire_read()
+        row = self._conn.execute('SELECT value FROM drive_state WHERE key=?', (key,)).fetchone()
+        self.lock.release_read()
+        return row[0] if row is not None else None
+
+    def set_state(self, key, value):
+        """
+        :param str key: Name of the drive-wise state value.
+        :param str | None value: The value to store. None to delete the state.
+        """
+        self._begin_write()
+        if value is None:
+            self._cursor.execute('DELETE FROM drive_state WHERE key=?', (key,))
+        else:
+            self._cursor.execute('INSERT OR REPLACE INTO drive_state (key, value) VALUES (?, ?)', (key, value))
+        self._end_write()
+
+    def get_delta_token(self):
+        """
+        :return str | None: Cursor of the last applied change enumeration of the drive.
+        """
+        return self.get_state(self.DELTA_TOKEN_KEY)
+
+    def set_delta_token(self, token):
+        self.set_state(self.DELTA_TOKEN_KEY, token)
+
+    def _restore_fragment_sizes(self):
+        """
+        Start the fragment size controllers of the drive from the sizes learned in the last run.
+        """
+        for key, controller in ((self.GET_FRAGMENT_SIZE_KEY, self.drive.get_fragment_size),
+                                (self.PUT_FRAGMENT_SIZE_KEY, self.drive.put_fragment_size)):
+            value = self.get_state(key)
+            if value is not None:
+                controller.size = int(value)
+
+    def save_fragment_sizes(self):
+        """
+        Save the fragment sizes learned by the drive if they changed.
+        """
+        for key, controller in ((self.GET_FRAGMENT_SIZE_KEY, self.drive.get_fragment_size),
+                                (self.PUT_FRAGMENT_SIZE_KEY, self.drive.put_fragment_size)):
+            value = str(controller.size)
+            if self.get_state(key) != value:
+                self.set_state(key, value)
+
+    def _get_cached_local_hashes(self, st):
+        """
+        :param os.stat_result st: Stat result of the local file.
+        :return (str | None, str | None): Cached CRC32 and SHA-1 hash values of the file, if the file is unchanged.
+        """
+        self.lock.acquire_read()
+        row = self._conn.execute('SELECT size, mtime_ns, crc32_hash, sha1_hash FROM local_hashes '
+                                 'WHERE device=? AND inode=?', (st.st_dev, st.st_ino)).fetchone()
+        self.lock.release_read()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None, None
+        return row[2], row[3]
+
+    def set_local_hashes(self, local_path, crc32_hash=None, sha1_hash=None, st=None):
+        """
+        Cache hash values of a local file against its device, inode, size and mtime.
+        :param str local_path: Path to the local file.
+        :param str | None crc32_hash: CRC32 hash value of the file, if known.
+        :param str | None sha1_hash: SHA-1 hash value of the file, if known.
+        :param os.stat_result | None st: (Optional) Stat result of the file when the hash values were computed.
+        """
+        if st is None:
+            st = os.stat(local_path)
+        if st.st_mtime_ns > time.time() * 1e9 - self.RACY_INTERVAL_NS:
+            return
+        cached_crc32_hash, cached_sha1_hash = self._get_cached_local_hashes(st)
+        if crc32_hash is None:
+            crc32_hash = cached_crc32_hash
+        if sha1_hash is None:
+            sha1_hash = cached_sha1_hash
+        self._begin_write()
+        self._cursor.execute('INSERT OR REPLACE INTO local_hashes (device, inode, size, mtime_ns, crc32_hash, '
+                             'sha1_hash) VALUES (?, ?, ?, ?, ?, ?)',
+                             (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, crc32_hash, sha1_hash))
+        self._end_write()
+
+    def _get_local_hash(self, local_path, index, hash_func, st=None):
+        if st is None:
+            st = os.stat(local_path)
+        hashes = self._get_cached_local_hashes(st)
+        if hashes[index] is not None:
+            return hashes[index]
+        hash_value = hash_func(local_path)
+        # Only cache the value if the file did not change while being hashed.
+        new_st = os.stat(local_path)
+        if (new_st.st_ino, new_st.st_size, new_st.st_mtime_ns) == (st.st_ino, st.st_size, st.st_mtime_ns):
+            if index == 0:
+                self.set_local_hashes(local_path, crc32_hash=hash_value, st=st)
+            else:
+                self.set_local_hashes(local_path, sha1_hash=hash_value, st=st)
+        return hash_value
+
+    def get_local_crc32_hash(self, local_path, st=None):
+        """
+        Get CRC32 hash value of a local file. The file is read only if it changed since the value was cached.
+        :param str local_path: Path to the local file.
+        :param os.stat_result | None st: (Optional) Stat result of the file if the caller has it.
+        :rtype: str
+        """
+        return self._get_local_hash(local_path, 0, hasher.crc32_value, st)
+
+    def get_local_sha1_hash(self, local_path, st=None):
+        """
+        Get SHA-1 hash value of a local file. The file is read only if it changed since the value was cached.
+        :param str local_path: Path to the local file.
+        :param os.stat_result | None st: (Optional) Stat result of the file if the caller has it.
+        :rtype: str
+        """
+        return self._get_local_hash(local_path, 1, hasher.hash_value, st)
+
+    def get_remote_sha1_hash(self, item_id, c_tag):
+        """
+        Get the SHA-1 hash value computed for a remote file that has no hash property.
+        :param str item_id: ID of the remote file.
+        :param str c_tag: Current cTag of the remote file.
+        :return str | None: The hash value if it was computed for the same content version, otherwise None.
+        """
+        self.lock.acquire_read()
+        row = self._conn.execute('SELECT sha1_hash FROM remote_hashes WHERE item_id=? AND ctag=?',
+                                 (item_id, c_tag)).fetchone()
+        self.lock.release_read()
+        return row[0] if row is not None else None
+
+    def set_remote_sha1_hash(self, item_id, c_tag, sha1_hash):
+        """
+        :param str item_id: ID of the remote file.
+        :param str c_tag: cTag of the content version the hash value was computed from.
+        :param str sha1_hash: SHA-1 hash value of the content.
+        """
+        self._begin_write()
+        self._cursor.execute('INSERT OR REPLACE INTO remote_hashes (item_id, ctag, sha1_hash) VALUES (?, ?, ?)',
+                             (item_id, c_tag, sha1_hash))
+        self._end_write()
+
+    def get_partial_download(self, local_path):
+        """
+        :param str local_path: Path to the temporary file of an unfinished download.
+        :return (str, str, int, int) | None: Item ID, cTag, size and the number of leading bytes written, or None if
+        there is no unfinished download to the path.
+        """
+        self.lock.acquire_read()
+        row = self._conn.execute('SELECT item_id, ctag, size, bytes_done FROM partial_downloads WHERE local_path=?',
+                                 (local_path,)).fetchone()
+        self.lock.release_read()
+        return row
+
+    def set_partial_download(self, local_path, item_id, c_tag, size, bytes_done):
+        """
+        Record the progress of a download so that it can be resumed after a restart.
+        :param str local_path: Path to the temporary file being downloaded to.
+        :param str item_id: ID of the remote file.
+        :param str c_tag: cTag of the content version being downloaded.
+        :param int size: Size of the remote file.
+        :param int bytes_done: Number of leading bytes already written to the temporary file.
+        """
+        self._begin_write()
+        self._cursor.execute('INSERT OR REPLACE INTO partial_downloads (local_path, item_id, ctag, size, bytes_done) '
+                             'VALUES (?, ?, ?, ?, ?)', (local_path, item_id, c_tag, size, bytes_done))
+        self._end_write()
+
+    def delete_partial_download(self, local_path):
+        """
+        :param str local_path: Path to the temporary file of a finished or discarded download.
+        """
+        self._begin_write()
+        self._cursor.execute('DELETE FROM partial_downloads WHERE local_path=?', (local_path,))
+        self._end_write()
+
+    def get_upload_session(self, local_path, size, mtime):
+        """
+        :param str local_path: Path to the local file being uploaded.
+        :param int size: Current size of the file.
+        :param float mtime: Current mtime of the file.
+        :return (str, [(int, int | None)]) | None: URL of the upload session and the ranges it expected when last
+        saved, or None if there is no session that is still valid for the current content of the file.
+        """
+        self.lock.acquire_read()
+        row = self._conn.execute('SELECT upload_url, expires_at, size, mtime, next_ranges FROM upload_sessions '
+                                 'WHERE local_path=?', (local_path,)).fetchone()
+        self.lock.release_read()
+        if row is None:
+            return None
+        upload_url, expires_at, saved_size, saved_mtime, next_ranges = row
+        if saved_size != size or saved_mtime != mtime or (expires_at is not None and expires_at <= time.time()):
+            self.delete_upload_session(local_path)
+            return None
+        ranges = []
+        for s in next_ranges.split(','):
+            if s:
+                f, t = s.split('-', 1)
+                ranges.append((int(f), int(t) if t else None))
+        return upload_url, ranges
+
+    def set_upload_session(self, local_path, session, size, mtime):
+        """
+        Save the upload session of a local file so that the upload can be resumed after a restart.
+        :param str local_path: Path to the local file being uploaded.
+        :param onedrivee.drives.resources.UploadSession session: The upload session.
+        :param int size: Size of the file when the upload started.
+        :param float mtime: Mtime of the file when the upload started.
+        """
+        expires_at = getattr(session, 'expires_at', None)
+        if expires_at is not None:
+            expires_at = datetime_to_timestamp(expires_at)
+        next_ranges = ','.join(str(f) + '-' + ('' if t is None else str(t)) for f, t in session.next_ranges)
+        self._begin_write()
+        self._cursor.execute('INSERT OR REPLACE INTO upload_sessions (local_path, upload_url, expires_at, size, '
+                             'mtime, next_ranges) VALUES (?, ?, ?, ?, ?, ?)',
+                             (local_path, session.upload_url, expires_at, size, mtime, next_ranges))
+        self._end_write()
+
+    def delete_upload_session(self, local_path):
+        """
+        :param str local_path: Path to the local file whose upload finished or was abandoned.
+        """
+        self._begin_write()
+        self._cursor.execute('DELETE FROM upload_sessions WHERE local_path=?', (local_path,))
+        self._end_write()
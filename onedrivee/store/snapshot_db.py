@@ -0,0 +1,72 @@
+import sqlite3
+import threading
+import time
+
+from onedrivee.common.local_snapshot import SnapshotEntry
+
+
+class LocalSnapshotStore:
+    """
+    Snapshots of the local tree of each drive, saved when the program stops. A snapshot is taken out of the store when
+    it is read at the next start, so that a run that stops without saving one, e.g., on a crash, is followed by a full
+    merge rather than a comparison with a snapshot that is out of date.
+    """
+
+    create_table_sql_content = '''
+      CREATE TABLE IF NOT EXISTS snapshots (
+        drive_id  TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+        taken_at  REAL NOT NULL
+      );
+      CREATE TABLE IF NOT EXISTS snapshot_entries (
+        drive_id  TEXT NOT NULL,
+        rel_path  TEXT NOT NULL,
+        is_dir    INT NOT NULL,
+        inode     INT NOT NULL,
+        size      INT NOT NULL,
+        mtime_ns  INT NOT NULL,
+        PRIMARY KEY (drive_id, rel_path) ON CONFLICT REPLACE
+      );
+    '''
+
+    def __init__(self, db_path):
+        """
+        :param str db_path: Path to the snapshot database.
+        """
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(self.create_table_sql_content)
+        self._lock = threading.Lock()
+
+    def save(self, drive_id, entries):
+        """
+        Replace the snapshot of a drive.
+        :param str drive_id:
+        :param dict[str, onedrivee.common.local_snapshot.SnapshotEntry] entries: Entries by path relative to the
+        local root of the drive.
+        """
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM snapshot_entries WHERE drive_id=?', (drive_id,))
+            self._conn.executemany('INSERT INTO snapshot_entries (drive_id, rel_path, is_dir, inode, size, mtime_ns) '
+                                   'VALUES (?,?,?,?,?,?)',
+                                   ((drive_id, p, int(e.is_dir), e.inode, e.size, e.mtime_ns)
+                                    for p, e in entries.items()))
+            self._conn.execute('INSERT INTO snapshots (drive_id, taken_at) VALUES (?,?)', (drive_id, time.time()))
+
+    def take(self, drive_id):
+        """
+        Read the snapshot of a drive and remove it from the store.
+        :param str drive_id:
+        :return dict[str, onedrivee.common.local_snapshot.SnapshotEntry] | None: Entries by path relative to the local
+        root of the drive, or None if there is no snapshot of the drive.
+        """
+        with self._lock, self._conn:
+            if self._conn.execute('SELECT taken_at FROM snapshots WHERE drive_id=?', (drive_id,)).fetchone() is None:
+                return None
+            rows = self._conn.execute('SELECT rel_path, is_dir, inode, size, mtime_ns FROM snapshot_entries '
+                                      'WHERE drive_id=?', (drive_id,)).fetchall()
+            self._conn.execute('DELETE FROM snapshots WHERE drive_id=?', (drive_id,))
+            self._conn.execute('DELETE FROM snapshot_entries WHERE drive_id=?', (drive_id,))
+        return {rel_path: SnapshotEntry(bool(is_dir), inode, size, mtime_ns)
+                for rel_path, is_dir, inode, size, mtime_ns in rows}
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,78 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+
+from onedrivee.common import logger_factory
+
+
+class TaskJournal:
+    """
+    Record of the tasks waiting in the task pool, so that work queued before the program stops resumes on the next
+    start without walking the whole tree. A task is recorded when it is queued and dropped when it is handled or
+    cancelled. A task interrupted while it is handled is thus replayed.
+    """
+
+    logger = logger_factory.get_logger('TaskJournal')
+    create_table_sql_content = '''
+      CREATE TABLE IF NOT EXISTS tasks (
+        task_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+        drive_id  TEXT NOT NULL,
+        task_type TEXT NOT NULL,
+        task_dump TEXT NOT NULL,
+        queued_at REAL NOT NULL
+      );
+    '''
+
+    def __init__(self, db_path):
+        """
+        :param str db_path: Path to the journal database.
+        """
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # Losing the last records on a power failure only costs replaying or missing a few tasks.
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(self.create_table_sql_content)
+        self._lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def add(self, drive_id, task_type, task_dump):
+        """
+        :param str drive_id: Id of the drive the task works on.
+        :param str task_type: Name of the task type.
+        :param dict task_dump: Arguments to rebuild the task from.
+        :return int: Id of the record.
+        """
+        with self._lock:
+            return self._conn.execute('INSERT INTO tasks (drive_id, task_type, task_dump, queued_at) VALUES (?,?,?,?)',
+                                      (drive_id, task_type, json.dumps(task_dump), time.time())).lastrowid
+
+    def delete(self, task_id):
+        """
+        :param int task_id:
+        """
+        with self._lock:
+            self._conn.execute('DELETE FROM tasks WHERE task_id=?', (task_id,))
+
+    def get_all(self):
+        """
+        :return [(int, str, str, dict)]: Id, drive id, task type and dump of all recorded tasks, in the order queued.
+        """
+        ret = []
+        with self._lock:
+            rows = self._conn.execute('SELECT task_id, drive_id, task_type, task_dump FROM tasks ORDER BY task_id')
+            for task_id, drive_id, task_type, task_dump in rows.fetchall():
+                try:
+                    ret.append((task_id, drive_id, task_type, json.loads(task_dump)))
+                except ValueError:
+                    self.logger.warning('Drop malformed journal record %d of type "%s".', task_id, task_type)
+                    self._conn.execute('DELETE FROM tasks WHERE task_id=?', (task_id,))
+        return ret
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._conn.close()
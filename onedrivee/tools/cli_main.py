@@ -1,18 +1,21 @@
 import argparse
 import logging
 import os
+import signal
 import sys
 import time
-import psutil#debug
 
 from onedrivee.drives import clients
 from onedrivee.tools import CONFIG_DIR, get_current_user_config
-from onedrivee.common import logger_factory
-from onedrivee.workers import netman, task_worker
-from onedrivee.workers.tasks.task_base import TaskBase
-from onedrivee.workers.tasks.merge_task import MergeDirTask
-from onedrivee.store import account_db, drives_db, items_db
-from onedrivee.workers import task_pool
+from onedrivee.common import local_snapshot, logger_factory
+from onedrivee.workers import fsmonitor, netman, task_worker, worker_pools
+from onedrivee.workers.tasks.task_base import TaskBase, JOURNALED_TASK_TYPES
+from onedrivee.workers.tasks.delta_task import DeltaSyncTask
+from onedrivee.workers.tasks.reconcile_task import LocalReconcileTask
+# Register the journaled task types not imported otherwise.
+from onedrivee.workers.tasks import delete_task, move_task
+from onedrivee.store import account_db, drives_db, items_db, snapshot_db, task_db
+from onedrivee.workers import scheduler, task_pool
 
 logger = None
 user_conf = None
@@ -21,8 +24,11 @@ business_client = None
 account_store = None
 drive_store = None
 task_store = None
+task_journal = None
+snapshot_store = None
 item_store_mgr = None
 network_monitor = netman.NetworkMonitor()
+fs_monitor = None
 task_worker_list = []
 
 
@@ -46,16 +52,25 @@ def fix_log_args(args):
     return args
 
 
-def add_initial_tasks():
+def get_task_base(drive):
+    base = TaskBase(None)
+    base.drive = drive
+    base.items_store = item_store_mgr.get_item_storage(drive)
+    base.task_pool = task_store
+    return base
+
+
+def add_initial_tasks(full_merge=False, reconciled_drive_ids=()):
+    """
+    :param True | False full_merge: Whether to merge the whole drives.
+    :param [str] reconciled_drive_ids: Drives whose local changes were found from the snapshot, and thus need no full
+    merge.
+    """
     all_drives = drive_store.get_all_drives()
     for key, drive in all_drives.items():
         # root_item = drive.get_root_dir(list_children=False)
         # print(root_item._data)
-        base = TaskBase(None)
-        base.drive = drive
-        base.items_store = item_store_mgr.get_item_storage(drive)
-        base.task_pool = task_store
-        task = MergeDirTask(base, '', '')
+        task = DeltaSyncTask(get_task_base(drive), full_merge=full_merge and drive.drive_id not in reconciled_drive_ids)
         if not task_store.has_pending_task(task.local_path):
             task_store.add_task(task)
 
@@ -66,8 +81,88 @@ def load_item_storage():
 
 
 def load_task_storage():
-    global task_store
+    global task_store, task_journal
     task_store = task_pool.TaskPool.get_instance()
+    task_store.set_policy(scheduler.POLICIES[user_conf.task_scheduling_policy]())
+    task_store.set_watermarks(user_conf.task_pool_high_watermark, user_conf.task_pool_low_watermark)
+    task_journal = task_db.TaskJournal(CONFIG_DIR + '/tasks.db')
+    task_store.set_journal(task_journal)
+
+
+def replay_task_journal():
+    """
+    Queue again the tasks left in the journal by the last run.
+    """
+    drives_by_id = {drive.drive_id: drive for drive in drive_store.get_all_drives().values()}
+    count = 0
+    for task_id, drive_id, task_type, task_dump in task_journal.get_all():
+        drive = drives_by_id.get(drive_id)
+        task_class = JOURNALED_TASK_TYPES.get(task_type)
+        if drive is None or task_class is None:
+            logger.warning('Drop journaled task of type "%s" on drive "%s".', task_type, drive_id)
+            task_journal.delete(task_id)
+            continue
+        try:
+            task = task_class.load(get_task_base(drive), task_dump)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning('Drop journaled task of type "%s" that cannot be loaded: %s.', task_type, e)
+            task_journal.delete(task_id)
+            continue
+        task.journal_id = task_id
+        task_store.add_task(task)
+        count += 1
+    logger.info('Replayed %d journaled tasks.', count)
+
+
+def reconcile_local_changes():
+    """
+    Find the local changes made since the last run from the snapshots saved when it stopped.
+    :return [str]: IDs of the drives that had a snapshot.
+    """
+    global snapshot_store
+    snapshot_store = snapshot_db.LocalSnapshotStore(CONFIG_DIR + '/snapshot.db')
+    reconciled_drive_ids = []
+    for drive in drive_store.get_all_drives().values():
+        snapshot = snapshot_store.take(drive.drive_id)
+        if snapshot is None:
+            logger.info('No local snapshot of drive "%s". Merge the whole drive.', drive.drive_id)
+            continue
+        task_store.add_task(LocalReconcileTask(get_task_base(drive), snapshot))
+        reconciled_drive_ids.append(drive.drive_id)
+    return reconciled_drive_ids
+
+
+def save_local_snapshots():
+    """
+    Save a snapshot of the local tree of every drive, to be compared with the tree at the next start. The snapshot
+    counts every local change as synced, so none is saved while tasks that are not journaled, e.g., directory merges,
+    are pending. The next start then merges the drives.
+    """
+    if task_store.has_unjournaled_tasks():
+        logger.info('Tasks not recorded in the journal are pending. Do not save local snapshots.')
+        return
+    for drive in drive_store.get_all_drives().values():
+        try:
+            entries = local_snapshot.scan(drive.config.local_root, drive.config.path_filter)
+            snapshot_store.save(drive.drive_id, entries)
+            logger.info('Saved snapshot of %d local entries of drive "%s".', len(entries), drive.drive_id)
+        except (IOError, OSError) as e:
+            logger.error('Failed to save local snapshot of drive "%s": %s.', drive.drive_id, e)
+
+
+def start_fs_monitor():
+    global fs_monitor
+    fs_monitor = fsmonitor.FileSystemMonitor(drive_store, item_store_mgr, task_store)
+    fs_monitor.start()
+
+
+def stop_fs_monitor():
+    """
+    Stop watching local changes, and queue the tasks of the changes seen so far.
+    """
+    if fs_monitor is not None:
+        fs_monitor.close()
+        fs_monitor.join()
 
 
 def load_user_config():
@@ -91,54 +186,72 @@ def check_config_dir():
 
 
 def start_task_workers():
-    for i in range(user_conf.num_consumers):
-        t = task_worker.TaskConsumer(task_pool=task_store)
+    # The worker pool manager runs all tasks by itself.
+    num_workers = user_conf.num_consumers if user_conf.task_engine == 'threads' else 1
+    for i in range(num_workers):
+        t = new_task_worker()
         t.name = 'W' + str(i)
         task_worker_list.append(t)
         t.start()
 
 
-def refill_tasks():
+def new_task_worker():
+    if user_conf.task_engine == 'pools':
+        return worker_pools.WorkerPoolManager(task_store, user_conf.worker_pool_bounds,
+                                              (1, user_conf.num_consumers))
+    return task_worker.TaskConsumer(task_pool=task_store)
+
+
+def refill_tasks(reconciled_drive_ids=()):
+    """
+    :param [str] reconciled_drive_ids: Drives that need no full merge at start.
+    """
+    next_full_merge_time = 0
     try:
         while True:
             logger.info('Refilling initial tasks...')
-            workers_profile()
-            add_initial_tasks()
+            full_merge = time.time() >= next_full_merge_time
+            if full_merge:
+                next_full_merge_time = time.time() + user_conf.deep_sync_interval_seconds
+            add_initial_tasks(full_merge, reconciled_drive_ids)
+            reconciled_drive_ids = ()
             renew_task_worker_if_need()
-            time.sleep(5 * 60)
+            time.sleep(user_conf.delta_sync_interval_seconds)
     except (KeyboardInterrupt, InterruptedError):
         logger.info('Exiting...')
+        stop_fs_monitor()
+        save_local_snapshots()
         sys.exit(0)
-  
-def workers_profile():
-  for w in task_worker_list:
-    logger.info("name %s, live %s, block %s", w.name, str(w.is_alive()), str(w in network_monitor.conditions))
-  logger.info('network_monitor is die ' + str(not network_monitor.is_alive()))
-  proc = psutil.Process()
-  logger.info('open files: %d', proc.num_fds())
-  for file_name in proc.open_files():
-    logger.info('file: ' + str(file_name))
+
 
 def renew_task_worker_if_need():
     for i in range(len(task_worker_list)):
         if not task_worker_list[i].is_alive():
-            t = task_worker.TaskConsumer(task_pool=task_store)
+            if isinstance(task_worker_list[i], worker_pools.WorkerPoolManager):
+                # The workers of a dead manager would otherwise run on beside those of the new one.
+                task_worker_list[i].stop()
+            t = new_task_worker()
             t.name = task_worker_list[i].name
-            task_worker_list[i] = t 
+            task_worker_list[i] = t
             t.start()
             logger.info('Renew task work %s.', t.name)
 
 
 def main():
     global logger
+    # Stop as on Ctrl-C when stopped by a service manager or kill, so that the local snapshots are saved.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     args = fix_log_args(parse_args())
     logger = logger_factory.get_logger('Main')
     check_config_dir()
     load_user_config()
     load_item_storage()
     load_task_storage()
+    # Start workers first, as replaying more tasks than the high watermark waits for them to drain the pool.
     start_task_workers()
-    refill_tasks()
+    replay_task_journal()
+    start_fs_monitor()
+    refill_tasks(reconcile_local_changes())
 
 
 if __name__ == '__main__':
@@ -7,7 +7,7 @@ from onedrivee.common.utils import OS_USER_NAME, OS_USER_HOME, mkdir, get_conten
 from onedrivee.drives import accounts, clients
 from onedrivee.tools import CONFIG_DIR, get_current_user_config
 from onedrivee.conf import drive_config
-from onedrivee.workers import netman
+from onedrivee.workers import netman, scheduler
 from onedrivee.store import account_db, drives_db
 from onedrivee.common.utils import pretty_print_bytes
 
@@ -137,12 +137,23 @@ def prompt_drive_config(drive):
             raise ValueError('Invalid path "%s"' % local_root)
         except Exception as ex:
             puts(colored.red('Error: ' + str(ex)))
+    drive_config_data['min_get_size_bytes'] = prompt.query('Minimum size, in KB, for a single download request?',
+                                                           default=str(drive_config_data['min_get_size_bytes'] >> 10),
+                                                           validators=[validators.IntegerValidator()]) * 1024
     drive_config_data['max_get_size_bytes'] = prompt.query('Maximum size, in KB, for a single download request?',
                                                            default=str(drive_config_data['max_get_size_bytes'] >> 10),
                                                            validators=[validators.IntegerValidator()]) * 1024
-    drive_config_data['max_put_size_bytes'] = prompt.query('Maximum size, in KB, for a single upload request?',
+    drive_config_data['min_put_size_bytes'] = prompt.query('Minimum size, in KB, for a single upload request '
+                                                           '(rounded down to a multiple of 320)?',
+                                                           default=str(drive_config_data['min_put_size_bytes'] >> 10),
+                                                           validators=[validators.IntegerValidator()]) * 1024
+    drive_config_data['max_put_size_bytes'] = prompt.query('Maximum size, in KB, for a single upload request '
+                                                           '(rounded down to a multiple of 320)?',
                                                            default=str(drive_config_data['max_put_size_bytes'] >> 10),
                                                            validators=[validators.IntegerValidator()]) * 1024
+    drive_config_data['download_concurrency'] = prompt.query('Number of download requests to send at a time for a file?',
+                                                             default=str(drive_config_data['download_concurrency']),
+                                                             validators=[validators.IntegerValidator()])
     try:
         while not prompt.yn('Do you have ignore list files specific to this Drive to add?', default='n'):
             ignore_file_path = prompt.query('Path to the ignore list file (hit [Ctrl+C] to skip): ',
@@ -373,9 +384,25 @@ def edit_sync_params():
     user_conf.num_consumers = prompt.query('Number of worker threads: ',
                                            default=str(user_conf.num_consumers),
                                            validators=[validators.IntegerValidator()])
+    user_conf.task_engine = prompt.query('Task engine (%s): ' % ', '.join(user_conf.TASK_ENGINES),
+                                         default=user_conf.task_engine,
+                                         validators=[validators.OptionValidator(user_conf.TASK_ENGINES)])
+    user_conf.delta_sync_interval_seconds = prompt.query('Number of seconds to wait before next remote change check: ',
+                                                         default=str(user_conf.delta_sync_interval_seconds),
+                                                         validators=[validators.IntegerValidator()])
     user_conf.deep_sync_interval_seconds = prompt.query('Number of seconds to wait before next full scan: ',
                                                         default=str(user_conf.deep_sync_interval_seconds),
                                                         validators=[validators.IntegerValidator()])
+    policy_names = sorted(scheduler.POLICIES.keys())
+    user_conf.task_scheduling_policy = prompt.query('Task scheduling policy (%s): ' % ', '.join(policy_names),
+                                                    default=user_conf.task_scheduling_policy,
+                                                    validators=[validators.OptionValidator(policy_names)])
+    user_conf.task_pool_high_watermark = prompt.query('Number of queued tasks to stop adding more at: ',
+                                                      default=str(user_conf.task_pool_high_watermark),
+                                                      validators=[validators.IntegerValidator()])
+    user_conf.task_pool_low_watermark = prompt.query('Number of queued tasks to resume adding at: ',
+                                                     default=str(user_conf.task_pool_low_watermark),
+                                                     validators=[validators.IntegerValidator()])
     puts()
     puts(colored.green('Workload parameters saved.'))
 
@@ -0,0 +1,116 @@
+"""
+Rules to merge a new task into a queued task on the same item, so that bursts of changes to a path cost as few API
+calls as the final state needs. A rule takes the queued task and the new one, and returns the task to queue in place of
+both: the queued task to drop the new one, another task to replace the queued one, or None to drop both. Rules on a
+new move apply to the task queued on the path it takes the item from. A task queued on the path it moves the item to is
+displaced instead, see displace().
+"""
+
+import os
+
+from onedrivee.workers.tasks.delete_task import DeleteItemTask
+from onedrivee.workers.tasks.merge_task import MergeDirTask
+from onedrivee.workers.tasks.move_task import MoveItemTask
+from onedrivee.workers.tasks.up_task import CreateDirTask, UploadFileTask
+
+RULES = {}
+
+
+def rule(queued_type, new_type):
+    """
+    Decorator to register a rule for a pair of task types.
+    :param type queued_type:
+    :param type new_type:
+    """
+
+    def register(f):
+        RULES[(queued_type, new_type)] = f
+        return f
+
+    return register
+
+
+def origin_path(task):
+    """
+    :param onedrivee.workers.tasks.task_base.TaskBase task:
+    :return str | None: Local path the task takes the item from, if it is not the path of the task.
+    """
+    if isinstance(task, MoveItemTask):
+        return task.old_local_path
+    return None
+
+
+def has_rule(queued, new):
+    """
+    :param onedrivee.workers.tasks.task_base.TaskBase queued:
+    :param onedrivee.workers.tasks.task_base.TaskBase new:
+    :rtype: True | False
+    """
+    return (type(queued), type(new)) in RULES
+
+
+def displace(queued, new):
+    """
+    :param onedrivee.workers.tasks.task_base.TaskBase queued: A queued task, dropped because the new task moves an item
+    to its path.
+    :param MoveItemTask new:
+    :return onedrivee.workers.tasks.task_base.TaskBase | None: A task to queue in place of the queued task, if any.
+    """
+    if isinstance(queued, MoveItemTask):
+        # The item moved there before is overwritten. Delete it from where it was. Since a rename only replaces an
+        # entry of the same type, the entry now at the path tells whether it was a directory.
+        old_rel_parent_path, old_item_name = queued.old_rel_path.rsplit('/', 1)
+        return DeleteItemTask(queued, old_rel_parent_path + '/', old_item_name, os.path.isdir(new.local_path))
+    return None
+
+
+def coalesce(queued, new):
+    """
+    :param onedrivee.workers.tasks.task_base.TaskBase queued: A queued task on the path of the new task, or on its
+    origin path if the new task is a move.
+    :param onedrivee.workers.tasks.task_base.TaskBase new:
+    :return onedrivee.workers.tasks.task_base.TaskBase | None: The task to queue in place of both, or None for neither.
+    """
+    f = RULES.get((type(queued), type(new)))
+    if f is None:
+        # Without a rule, the queued task stands for both.
+        return queued
+    return f(queued, new)
+
+
+@rule(UploadFileTask, UploadFileTask)
+def _upload_upload(queued, new):
+    # The queued upload reads the file when it runs, and thus uploads the final version.
+    return queued
+
+
+@rule(DeleteItemTask, UploadFileTask)
+def _delete_upload(queued, new):
+    # The file was replaced. Upload the new one over the remote item, which keeps its id and history.
+    return new
+
+
+@rule(DeleteItemTask, CreateDirTask)
+def _delete_create_dir(queued, new):
+    # The directory was replaced. Merge it so that the remote content ends up the same as the local one.
+    return MergeDirTask(new, new.rel_parent_path, new.item_name)
+
+
+@rule(UploadFileTask, DeleteItemTask)
+def _upload_delete(queued, new):
+    # The file is gone before it was uploaded. Only the deletion of what the server may have matters.
+    return new
+
+
+@rule(UploadFileTask, MoveItemTask)
+def _upload_move(queued, new):
+    # The file moved before it was uploaded. Upload it where it is now.
+    return UploadFileTask(new, new.rel_parent_path, new.item_name)
+
+
+@rule(MoveItemTask, MoveItemTask)
+def _move_move(queued, new):
+    if queued.old_local_path == new.local_path:
+        # Moved back to where it was.
+        return None
+    return MoveItemTask.from_old_rel_path(new, new.rel_parent_path, new.item_name, queued.old_rel_path)
@@ -0,0 +1,95 @@
+"""
+A single thread that runs callbacks at given times, e.g., to put a task back in the pool after a while. Pending calls
+are kept in a heap, so that scheduling one costs O(log n) and no thread per pending operation.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+from onedrivee.common import logger_factory
+
+
+class DelayedCallScheduler(threading.Thread):
+    logger = logger_factory.get_logger('DelayedCallScheduler')
+    _instance_lock = threading.Lock()
+    # Tell the task pool not to block this thread when it is full, or calls due meanwhile would be late.
+    waits_for_room = False
+
+    @classmethod
+    def get_instance(cls):
+        """
+        :return DelayedCallScheduler: The shared scheduler, started on first use.
+        """
+        with cls._instance_lock:
+            if not hasattr(cls, '_instance'):
+                cls._instance = DelayedCallScheduler()
+                cls._instance.start()
+            return cls._instance
+
+    def __init__(self):
+        super().__init__(name='delayed', daemon=True)
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def call_later(self, delay, func, *args):
+        """
+        Call func(*args) from the scheduler thread after the delay. The call should be quick, as it holds up the calls
+        due after it.
+        :param float delay: Seconds to wait.
+        :param func:
+        :return list: A handle to cancel the call with.
+        """
+        entry = [time.time() + delay, next(self._counter), func, args]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    def cancel(self, handle):
+        """
+        :param list handle: Return value of call_later(). The call is dropped lazily when it is due.
+        """
+        with self._cond:
+            handle[2] = None
+
+    def __len__(self):
+        with self._cond:
+            return sum(1 for e in self._heap if e[2] is not None)
+
+    def _next_due(self):
+        with self._cond:
+            while True:
+                if len(self._heap) == 0:
+                    self._cond.wait()
+                    continue
+                wait_time = self._heap[0][0] - time.time()
+                if wait_time > 0:
+                    self._cond.wait(wait_time)
+                    continue
+                entry = heapq.heappop(self._heap)
+                if entry[2] is not None:
+                    return entry
+
+    def run(self):
+        while True:
+            due_time, seq, func, args = self._next_due()
+            try:
+                func(*args)
+            except Exception:
+                self.logger.error('Error in delayed call %s:\n%s.', func, traceback.format_exc())
+
+
+def add_task_later(delay, task_pool, task):
+    """
+    Add a task to the pool after the delay.
+    :param float delay: Seconds to wait.
+    :param onedrivee.workers.task_pool.TaskPool task_pool:
+    :param onedrivee.workers.tasks.task_base.TaskBase task:
+    :return list: A handle to cancel the call with.
+    """
+    return DelayedCallScheduler.get_instance().call_later(delay, task_pool.add_task, task)
@@ -1,32 +1,173 @@
-import csv
-import os
-import shutil
-import subprocess
+import collections
+import re
 import threading
+import time
 
+from onedrivee.common import inotify
 from onedrivee.common.logger_factory import get_logger
-from onedrivee.common.tasks import TaskBase
-from onedrivee.common.tasks import delete_task, merge_task, move_task, up_task, utils
+from onedrivee.common.path_trie import PathTrie
+from onedrivee.drives.items import OneDriveItemTypes
+from onedrivee.workers import delayed
+from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.workers.tasks import delete_task, merge_task, move_task, up_task, utils
 
 
 def _get_rel_parent_path(drive, local_parent_path):
     """
-    Translate a local path to path relative to drive local root. E.g., '/home/xb/OneDrive/foo.bar' -> '/foo.bar'.
+    Translate a local path to path relative to drive local root. E.g., '/home/xb/OneDrive/foo' -> '/foo/'.
     :param onedrivee.api.drives.DriveObject drive:
     :param str local_parent_path:
-    :return str: Path relative to drive local root.
+    :return str: Path relative to drive local root, ending with '/' as rel_parent_path of tasks does.
     """
-    return local_parent_path.replace(drive.config.local_root, '', 1)
+    return local_parent_path.replace(drive.config.local_root, '', 1) + '/'
 
 
-# TODO: there are still some issues to let a task occupy a path until it's completed.
-# TODO: finish the class.
+class PathEvents:
+    """
+    The events of a batch on one path, folded into the state the path went through.
+    """
+
+    def __init__(self, local_parent_path, ent_name):
+        self.local_parent_path = local_parent_path
+        self.ent_name = ent_name
+        self.is_dir = False
+        # None until known whether the entry existed before the batch.
+        self.existed = None
+        self.exists = True
+        self.created = False
+        self.written = False
+        self.moved_from_cookie = 0
+        self.moved_to_cookie = 0
+        # The entry that was moved here, if its MOVED_FROM event is in the batch, and whether it was.
+        self.move_source = None
+        self.is_move_source = False
+        # Whether the batch has events under the path.
+        self.changed_under = False
+
+    @property
+    def local_path(self):
+        return self.local_parent_path + '/' + self.ent_name
+
+    def add(self, event_str, cookie=0):
+        """
+        :param str event_str: Names of the event flags, e.g., "CREATE,ISDIR".
+        :param int cookie: (Optional) Number shared by the MOVED_FROM and MOVED_TO events of a move.
+        """
+        is_dir = 'ISDIR' in event_str
+        if 'CREATE' in event_str or 'MOVED_TO' in event_str:
+            if self.existed is None:
+                self.existed = False
+            self.exists = True
+            self.is_dir = is_dir
+            self.created = True
+            self.written = False
+            self.moved_to_cookie = cookie if 'MOVED_TO' in event_str else 0
+            self.move_source = None
+        elif 'CLOSE_WRITE' in event_str:
+            if self.existed is None:
+                self.existed = True
+            self.exists = True
+            self.written = True
+        elif 'DELETE' in event_str or 'MOVED_FROM' in event_str:
+            if self.existed is None:
+                self.existed = True
+            self.exists = False
+            self.is_dir = is_dir
+            self.written = False
+            self.moved_to_cookie = 0
+            self.moved_from_cookie = cookie if 'MOVED_FROM' in event_str else 0
+
+
+class EventBatch:
+    """
+    Events collected over a short window, folded per path, so that a burst of changes, e.g., unpacking an archive,
+    yields one task for each path that changed rather than one for each event. MOVED_FROM and MOVED_TO events are
+    paired by their cookie, following chains of moves back to the entry that existed before the batch.
+    """
+
+    def __init__(self):
+        self._paths = collections.OrderedDict()
+        # Entry moved away by the MOVED_FROM event of each cookie whose MOVED_TO event is not seen yet.
+        self._moved_from = {}
+        self.first_event_time = None
+        self.last_event_time = None
+
+    def __len__(self):
+        return len(self._paths)
+
+    def add(self, event_str, local_parent_path, ent_name, cookie=0):
+        """
+        :param str event_str: Names of the event flags, e.g., "CREATE,ISDIR".
+        :param str local_parent_path:
+        :param str ent_name:
+        :param int cookie: (Optional) Number shared by the MOVED_FROM and MOVED_TO events of a move.
+        """
+        now = time.time()
+        if self.first_event_time is None:
+            self.first_event_time = now
+        self.last_event_time = now
+        key = local_parent_path + '/' + ent_name
+        path_events = self._paths.get(key)
+        if path_events is None:
+            path_events = self._paths[key] = PathEvents(local_parent_path, ent_name)
+        origin = path_events.move_source
+        if 'MOVED_FROM' in event_str:
+            if origin is not None:
+                # The entry was itself moved here within the batch. The move starts where it came from.
+                origin.is_move_source = False
+                origin.moved_from_cookie = cookie
+                self._moved_from[cookie] = origin
+            else:
+                self._moved_from[cookie] = path_events
+        elif 'DELETE' in event_str and origin is not None:
+            # Moved and then deleted. Only the deletion of the entry it was moved from is left.
+            origin.is_move_source = False
+            origin.moved_from_cookie = 0
+        path_events.add(event_str, cookie)
+        if 'MOVED_TO' in event_str:
+            source = self._moved_from.pop(cookie, None)
+            if source is path_events:
+                # Moved back to where it was.
+                path_events.created = False
+                path_events.moved_to_cookie = 0
+                path_events.moved_from_cookie = 0
+            elif source is not None:
+                path_events.move_source = source
+                source.is_move_source = True
+
+    def settle(self):
+        """
+        :return [PathEvents]: The paths that changed, entries moved within the batch first, and then the others in the
+        order of their first events. Paths under a directory that was created or removed in the batch are left out,
+        as the change of the directory covers them.
+        """
+        all_paths = PathTrie()
+        covering = PathTrie()
+        for path, path_events in self._paths.items():
+            all_paths[path] = path_events
+            if path_events.is_dir and (path_events.created or not path_events.exists):
+                covering[path] = path_events
+        settled = []
+        for path, path_events in self._paths.items():
+            path_events.changed_under = path_events.is_dir and all_paths.has_descendant(path)
+            if not covering.has_ancestor(path):
+                settled.append(path_events)
+        settled.sort(key=lambda e: e.move_source is None)
+        return settled
+
 
 class FileSystemMonitor(threading.Thread):
     MOVE_DETECTION_DELAY_SEC = 4
     SYNC_PARENT_DELAY_SEC = 60
+    # Emit the tasks of a batch of events when no event came for this long, or when its first event is this old.
+    SETTLE_DELAY_SEC = 1
+    MAX_BATCH_DELAY_SEC = 10
+    # Temporary files of downloads in progress.
+    IGNORED_NAME_PATTERN = re.compile(r'\..*\.!od$')
 
     logger = get_logger('fsmon')
+    # Tell the task pool not to block this thread when it is full, or the kernel event queue could overflow.
+    waits_for_room = False
 
     def __init__(self, drive_store, items_store_manager, task_pool):
         """
@@ -38,18 +179,14 @@ class FileSystemMonitor(threading.Thread):
         self._items_store_man = items_store_manager
         self._task_pool = task_pool
         self._all_drives = drive_store.get_all_drives().values()
-        self._running = False
-        self._delayed_tasks = set()
+        self._watcher = None
+        self._batch = EventBatch()
+        # Entries moved out of a watched directory whose destination is not known yet, by move cookie.
+        self._pending_moves = {}
+        self._pending_moves_lock = threading.Lock()
         self._task_bases = dict()
         self._preprocess_drives()
 
-    def _enqueue_delayed_task(self, task):
-        """
-        :param onedrivee.common.tasks.TaskBase task:
-        """
-        if task in self._delayed_tasks:
-            self._task_pool.add_task(task)
-
     def _find_drive(self, path):
         for d in self._all_drives:
             if path.startswith(d.config.local_root):
@@ -63,23 +200,43 @@ class FileSystemMonitor(threading.Thread):
             task_base.items_store = self._items_store_man.get_item_storage(drive)
             self._task_bases[drive] = task_base
 
-    def _sync_parent_dir_of(self, drive, rel_path):
-        rel_parent_path, dir_name = rel_path.rsplit('/', maxsplit=1)
-        task = merge_task.MergeDirTask(self._task_bases[drive], rel_parent_path=rel_parent_path, item_name=dir_name)
+    def _sync_parent_dir_of(self, drive, rel_parent_path):
+        """
+        Merge the directory of an entry. Subdirectories already synced are left alone, so that a change in a directory
+        does not rescan the subtrees next to it.
+        :param onedrivee.api.drives.DriveObject drive:
+        :param str rel_parent_path: Path of the directory relative to drive local root, e.g., '/' or '/foo/'.
+        """
+        rel_dir_path = rel_parent_path.rstrip('/')
+        if rel_dir_path == '':
+            task = merge_task.MergeDirTask(self._task_bases[drive], rel_parent_path='', item_name='', recursive=False)
+        else:
+            rel_dir_parent_path, dir_name = rel_dir_path.rsplit('/', maxsplit=1)
+            task = merge_task.MergeDirTask(self._task_bases[drive], rel_parent_path=rel_dir_parent_path + '/',
+                                           item_name=dir_name, recursive=False)
         self._task_pool.add_task(task)
 
     def _process_create_dir_event(self, drive, local_parent_path, dir_name):
         """
-        Subroutine to handle the event that a new directory is created.
+        Subroutine to handle the event that a new directory is created. The directory might have name conflict with
+        an existing remote item, and might have been added files to before it was watched. Therefore merge its parent,
+        which creates the remote directory, or merges with an existing one, and uploads its content.
         :param onedrivee.api.drives.DriveObject drive:
         :param str local_parent_path: Local path to the parent of this newly created directory.
         :param str dir_name: Name of the newly created directory.
         """
+        self._sync_parent_dir_of(drive, _get_rel_parent_path(drive, local_parent_path))
+
+    def _process_close_write_event(self, drive, local_parent_path, ent_name):
+        """
+        Subroutine to handle the event that a file opened for writing was closed.
+        :param onedrivee.api.drives.DriveObject drive:
+        :param str local_parent_path:
+        :param str ent_name:
+        """
         rel_parent_path = _get_rel_parent_path(drive, local_parent_path)
-        task = up_task.CreateDirTask(self._task_bases[drive], rel_parent_path=rel_parent_path, item_name=dir_name)
-        task.handle()
-        if task.should_sync_parent:
-            self._sync_parent_dir_of(drive, rel_parent_path)
+        task = up_task.UploadFileTask(self._task_bases[drive], rel_parent_path=rel_parent_path, item_name=ent_name)
+        self._task_pool.add_task(task)
 
     def _process_delete_event(self, drive, local_parent_path, ent_name, is_folder):
         """
@@ -94,88 +251,218 @@ class FileSystemMonitor(threading.Thread):
                                           item_name=ent_name, is_folder=is_folder)
         self._task_pool.add_task(task)
 
-    def _process_move_from_event(self, drive, local_parent_path, ent_name, is_folder):
-        # First try finding the item in database.
+    def _get_record(self, drive, local_parent_path, ent_name, is_folder):
+        """
+        :param onedrivee.api.drives.DriveObject drive:
+        :param str local_parent_path:
+        :param str ent_name:
+        :param True | False is_folder:
+        :return onedrivee.store.items_db.ItemRecord | None: The record of the entry if its type matches.
+        """
+        q = self._task_bases[drive].items_store.get_items_by_id(local_parent_path=local_parent_path, item_name=ent_name)
+        for item_id, record in q.items():
+            if (record.type == OneDriveItemTypes.FOLDER) == is_folder:
+                return record
+        return None
+
+    def _process_move_from_event(self, drive, local_parent_path, ent_name, is_folder, cookie):
+        """
+        Subroutine to handle the event that an entry was moved away, and the entry it was moved to is not known yet.
+        Delete the remote item unless the destination shows up within MOVE_DETECTION_DELAY_SEC.
+        :param onedrivee.api.drives.DriveObject drive:
+        :param str local_parent_path:
+        :param str ent_name:
+        :param True | False is_folder:
+        :param int cookie: Number shared by the MOVED_FROM and MOVED_TO events of the move.
+        """
         rel_parent_path = _get_rel_parent_path(drive, local_parent_path)
-        item_store = self._items_store_man.get_item_storage(drive)
-        q = item_store.get_items_by_id(local_parent_path=local_parent_path, item_name=ent_name)
-        try:
-            item_id, item = q.popitem()
-            if item.is_folder != is_folder:
-                raise KeyError()
-        except KeyError:
-            # If the record does not match, sync the parent after some time.
-            threading.Timer(self.SYNC_PARENT_DELAY_SEC, self._sync_parent_dir_of, (drive, rel_parent_path))
+        if self._get_record(drive, local_parent_path, ent_name, is_folder) is None:
+            # Not known remotely. Sync the parent after some time in case the record is outdated.
+            delayed.DelayedCallScheduler.get_instance().call_later(self.SYNC_PARENT_DELAY_SEC, self._sync_parent_dir_of,
+                                                                   drive, rel_parent_path)
             return
         task = delete_task.DeleteItemTask(parent_task=self._task_bases[drive], rel_parent_path=rel_parent_path,
                                           item_name=ent_name, is_folder=is_folder)
-        task.item_obj = item
-        self._delayed_tasks.add(task)
-        threading.Timer(self.MOVE_DETECTION_DELAY_SEC, self._enqueue_delayed_task, task)
+        with self._pending_moves_lock:
+            handle = delayed.DelayedCallScheduler.get_instance().call_later(self.MOVE_DETECTION_DELAY_SEC,
+                                                                            self._expire_pending_move, cookie)
+            self._pending_moves[cookie] = (task, handle)
 
-    def _convert_delete_dir_to_move(self, drive, local_parent_path, ent_name):
+    def _expire_pending_moves(self):
+        """
+        Delete the remote items of all entries moved away whose destination has not shown up yet.
+        """
+        with self._pending_moves_lock:
+            pending_moves, self._pending_moves = self._pending_moves, {}
+        for task, handle in pending_moves.values():
+            delayed.DelayedCallScheduler.get_instance().cancel(handle)
+            self._task_pool.add_task(task)
 
-        for t in self._delayed_tasks:
-            if isinstance(t, delete_task.DeleteItemTask)
+    def _expire_pending_move(self, cookie):
+        """
+        The destination of a move did not show up. The entry was moved out of the watched directories.
+        :param int cookie:
+        """
+        with self._pending_moves_lock:
+            task, handle = self._pending_moves.pop(cookie, (None, None))
+        if task is not None:
+            self._task_pool.add_task(task)
 
-    def _process_move_to_event(self, drive, local_parent_path, ent_name):
-        local_path = local_parent_path + '/' + ent_name
-        item_store = self._items_store_man.get_item_storage(drive)
-        try:
-            is_folder = os.path.isdir(local_path)
-            for t in self._delayed_tasks:
-                pass
-                # if not isinstance(t, delete_task.DeleteItemTask) or t.local_parent_path != local_parent_path \
-                #        or t.item_name !:
-                #    pass
-                #    continue
-                # if t.item_obj.is_folder == is_folder:
+    def _process_move_event(self, drive, old_local_path, local_parent_path, ent_name, is_folder):
+        """
+        Subroutine to handle an entry moved within a drive. Move the remote item rather than upload the content again.
+        :param onedrivee.api.drives.DriveObject drive:
+        :param str old_local_path: Local path the entry was moved from.
+        :param str local_parent_path: Local path to the directory the entry was moved to.
+        :param str ent_name: New name of the entry.
+        :param True | False is_folder:
+        """
+        old_local_parent_path, old_ent_name = old_local_path.rsplit('/', 1)
+        if self._get_record(drive, old_local_parent_path, old_ent_name, is_folder) is None:
+            # The remote side does not have the entry. Treat it as new.
+            self._process_new_entry(drive, local_parent_path, ent_name, is_folder)
+            return
+        rel_parent_path = _get_rel_parent_path(drive, local_parent_path)
+        task = move_task.MoveItemTask.from_old_rel_path(self._task_bases[drive], rel_parent_path, ent_name,
+                                                        old_local_path.replace(drive.config.local_root, '', 1))
+        self.logger.info('Will move remote item of "%s" to "%s".', old_local_path, task.local_path)
+        self._task_pool.add_task(task)
 
-    def _process_event(self, event_str, local_parent_path, ent_name):
+    def _process_move_to_event(self, drive, local_parent_path, ent_name, is_folder, cookie):
         """
-        The event dispatcher.
-        :param str event_str:
+        Subroutine to handle the event that an entry was moved in, and the entry it was moved from is not in the batch.
+        :param onedrivee.api.drives.DriveObject drive:
         :param str local_parent_path:
         :param str ent_name:
+        :param True | False is_folder:
+        :param int cookie: Number shared by the MOVED_FROM and MOVED_TO events of the move.
         """
-        drive = self._find_drive(local_parent_path)
-        if event_str == 'CREATE,ISDIR':
-            # A new directory was created. The directory might have name conflict with existing item, and might have
-            # been deleted by the time CreateDirTask runs. It might have been added new files to as well. Therefore,
-            # handle this type of event synchronously.
-            # If there is no network, this handle will be blocked. But if no network, tasks will pile up anyway.
+        with self._pending_moves_lock:
+            task, handle = self._pending_moves.pop(cookie, (None, None))
+        if task is None:
+            # Moved in from outside the watched directories.
+            self._process_new_entry(drive, local_parent_path, ent_name, is_folder)
+            return
+        delayed.DelayedCallScheduler.get_instance().cancel(handle)
+        if task.drive is not drive:
+            # Moved across drives. The remote item cannot follow.
+            self._task_pool.add_task(task)
+            self._process_new_entry(drive, local_parent_path, ent_name, is_folder)
+            return
+        self._process_move_event(drive, task.local_path, local_parent_path, ent_name, is_folder)
+
+    def _process_new_entry(self, drive, local_parent_path, ent_name, is_folder):
+        if is_folder:
             self._process_create_dir_event(drive, local_parent_path, ent_name)
-        elif 'CLOSE_WRITE' in event_str:
-            # A file that opened in writable mode was closed. If the file is being uploaded, the current upload session
-            # should be aborted. Also the task to upload that file could have been fetched by a worker and not traceable
-            # in TaskPool.
-            pass
-        elif 'MOVED_FROM' in event_str:
-            # Add delayed move to a queue. Use a new thread to add it to the task queue later.
-            # A better way is to use asyncio, but it is not part of Python 3.3 standard (which adds extra dependency).
-            self._process_move_from_event(drive, local_parent_path, ent_name, 'ISDIR' in event_str)
-        elif 'MOVED_TO' in event_str:
-            self._process_move_to_event(drive, local_parent_path, ent_name)
-        elif 'DELETE' in event_str:
-            self._process_delete_event(drive, local_parent_path, ent_name, 'ISDIR' in event_str)
+        else:
+            self._process_close_write_event(drive, local_parent_path, ent_name)
+
+    def _process_event(self, event_str, local_parent_path, ent_name, cookie=0):
+        """
+        Add an event to the current batch. Tasks are emitted when the batch settles.
+        :param str event_str: Names of the event flags, e.g., "CREATE,ISDIR".
+        :param str local_parent_path:
+        :param str ent_name:
+        :param int cookie: (Optional) Number shared by the MOVED_FROM and MOVED_TO events of a move.
+        """
+        if self._find_drive(local_parent_path) is not None:
+            self._batch.add(event_str, local_parent_path, ent_name, cookie)
+
+    def _process_path_events(self, path_events):
+        """
+        Emit the task for the state a path settled in.
+        :param PathEvents path_events:
+        """
+        local_parent_path, ent_name, is_dir = path_events.local_parent_path, path_events.ent_name, path_events.is_dir
+        drive = self._find_drive(local_parent_path)
+        rel_path = _get_rel_parent_path(drive, local_parent_path) + ent_name
+        if drive.config.path_filter.should_ignore(rel_path, is_dir):
+            return
+        if not path_events.exists:
+            if not path_events.existed:
+                # Created and gone within the batch, e.g., a temporary file.
+                pass
+            elif path_events.is_move_source:
+                # Handled with the entry it was moved to.
+                pass
+            elif path_events.moved_from_cookie:
+                self._process_move_from_event(drive, local_parent_path, ent_name, is_dir, path_events.moved_from_cookie)
+            else:
+                self._process_delete_event(drive, local_parent_path, ent_name, is_dir)
+        elif path_events.move_source is not None:
+            source = path_events.move_source
+            source_drive = self._find_drive(source.local_parent_path)
+            if source_drive is not drive or path_events.written or path_events.changed_under or source.changed_under:
+                # The remote item cannot follow across drives, and content changed around the move must be uploaded
+                # anyway. Delete the old entry and upload the new one.
+                self._process_delete_event(source_drive, source.local_parent_path, source.ent_name, is_dir)
+                self._process_new_entry(drive, local_parent_path, ent_name, is_dir)
+            else:
+                self._process_move_event(drive, source.local_path, local_parent_path, ent_name, is_dir)
+        elif path_events.moved_to_cookie:
+            self._process_move_to_event(drive, local_parent_path, ent_name, is_dir, path_events.moved_to_cookie)
+        elif is_dir:
+            if path_events.created:
+                self._process_create_dir_event(drive, local_parent_path, ent_name)
+        elif path_events.written:
+            # If the file is being uploaded, the upload in progress sends the old content, and this task the new one.
+            self._process_close_write_event(drive, local_parent_path, ent_name)
+
+    def _flush_batch(self):
+        batch, self._batch = self._batch, EventBatch()
+        settled = batch.settle()
+        self.logger.debug('Settled %d paths.', len(settled))
+        for path_events in settled:
+            self._process_path_events(path_events)
+
+    def _get_batch_timeout(self):
+        """
+        :return float | None: Seconds until the current batch should be flushed, or None if it is empty.
+        """
+        if len(self._batch) == 0:
+            return None
+        now = time.time()
+        return max(0, min(self._batch.last_event_time + self.SETTLE_DELAY_SEC,
+                          self._batch.first_event_time + self.MAX_BATCH_DELAY_SEC) - now)
+
+    def _resync_drives(self):
+        """
+        Merge every drive from its root, e.g., after the kernel dropped events.
+        """
+        for drive, task_base in self._task_bases.items():
+            self._task_pool.add_task(merge_task.MergeDirTask(task_base, rel_parent_path='', item_name=''))
 
     def close(self):
-        """ An external thread should call close() and then join() this thread (to finish the last task) to stop. """
-        if self._running:
-            subprocess.call(['kill', '-s', '9', str(self._subp.pid)])
-            self._running = False
+        """
+        An external thread should call close() and then join() this thread to stop. The thread emits the tasks of the
+        events seen so far before it ends.
+        """
+        if self._watcher is not None:
+            self._watcher.close()
 
     def run(self):
-        if not shutil.which('inotifywait'):
-            self.logger.critical('Cannot start file system monitor because command "inotifywait" was not found.')
+        try:
+            self._watcher = inotify.InotifyWatcher()
+        except (IOError, OSError) as e:
+            self.logger.critical('Cannot start file system monitor because inotify is not available: %s.', e)
             return
-        self._running = True
         self.logger.info('Starting.')
-        args = ['inotifywait', '--quiet', '--csv', '-e', 'unmount,create,close_write,delete,move',
-                '--exclude', '\..*\.!od', '-mr'] + [drive.config.local_root for drive in self._all_drives]
-        self._subp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-        reader = csv.reader(self._subp.stdout)
-        for row in reader:
-            local_parent_path, event_str, ent_name = row
-            self._process_event(event_str, local_parent_path, ent_name)
+        for drive in self._all_drives:
+            num_watches = len(self._watcher.add_tree(drive.config.local_root))
+            self.logger.info('Watching %d directories under "%s".', num_watches, drive.config.local_root)
+        while True:
+            events = self._watcher.read_events(self._get_batch_timeout())
+            if self._watcher.closed:
+                break
+            for event in events:
+                if event.mask & inotify.IN_Q_OVERFLOW:
+                    # The batch misses events. Rescanning the drives covers it.
+                    self._batch = EventBatch()
+                    self._resync_drives()
+                elif not self.IGNORED_NAME_PATTERN.match(event.name):
+                    self._process_event(inotify.mask_to_str(event.mask), event.path, event.name, event.cookie)
+            if self._get_batch_timeout() == 0:
+                self._flush_batch()
+        self._flush_batch()
+        self._expire_pending_moves()
         self.logger.info('Stopped.')
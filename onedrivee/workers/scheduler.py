@@ -0,0 +1,257 @@
+"""
+Order in which queued tasks are handed to workers. Tasks are split into queues by a policy. Queues share the workers
+by weight, and each queue serves the task of the lowest rank first.
+"""
+
+import heapq
+import itertools
+import time
+
+
+class SchedulingPolicy:
+    """
+    The default policy. Quick changes like deletes and moves go first, transfers next, and directory merges, which
+    mostly produce more tasks, last. No queue is starved since each gets a share of pops by its weight.
+    """
+
+    # A queue with twice the weight is popped twice as often while both have tasks.
+    WEIGHTS = {'change': 4, 'transfer': 2, 'merge': 1}
+    DEFAULT_WEIGHT = 2
+    # Within a queue, a task is ranked as if it was queued one second later per this many bytes it transfers. A large
+    # file thus yields to smaller ones queued after it, but only for a bounded time.
+    RANK_BYTES_PER_SECOND = 1048576
+
+    def classify(self, task):
+        """
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        :return str: Name of the queue for the task.
+        """
+        return task.scheduling_class
+
+    def weight(self, queue_name):
+        """
+        :param str queue_name:
+        :rtype: int
+        """
+        return self.WEIGHTS.get(queue_name, self.DEFAULT_WEIGHT)
+
+    def rank(self, task, now):
+        """
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        :param float now: Time the task is queued.
+        :return float: Tasks of lower rank are served first within a queue.
+        """
+        return now + task.size_hint / self.RANK_BYTES_PER_SECOND
+
+
+class SmallFilesFirstPolicy(SchedulingPolicy):
+    """
+    Give transfers of small files their own queue with the largest share, so that they are not stuck behind large
+    ones.
+    """
+
+    WEIGHTS = {'change': 4, 'small_transfer': 8, 'transfer': 1, 'merge': 1}
+    SMALL_FILE_BYTES = 4194304
+
+    def classify(self, task):
+        queue_name = super().classify(task)
+        if queue_name == 'transfer' and task.size_hint <= self.SMALL_FILE_BYTES:
+            return 'small_transfer'
+        return queue_name
+
+
+POLICIES = {
+    'fair': SchedulingPolicy,
+    'small_files_first': SmallFilesFirstPolicy,
+}
+
+
+class TaskScheduler:
+    """
+    Weighted fair queuing over per-queue heaps by stride scheduling. Each queue has a pass value that advances by
+    STRIDE / weight every time it is popped, and the non-empty queue of the smallest pass is served next. Push and pop
+    cost O(log n). The scheduler is not thread-safe.
+    """
+
+    STRIDE = 1 << 20
+
+    def __init__(self, policy=None):
+        """
+        :param SchedulingPolicy | None policy: (Optional) The policy. Use SchedulingPolicy by default.
+        """
+        self.policy = policy if policy is not None else SchedulingPolicy()
+        self._queues = {}
+        self._counts = {}
+        self._passes = {}
+        self._entries = {}
+        self._counter = itertools.count()
+        self._global_pass = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, task):
+        return id(task) in self._entries
+
+    def __iter__(self):
+        """
+        Iterate over queued tasks in no particular order.
+        """
+        return (entry[2] for entry in list(self._entries.values()))
+
+    def count(self, queue_name=None):
+        """
+        :param str | None queue_name: (Optional) Count only tasks in this queue.
+        :return int: Number of queued tasks.
+        """
+        if queue_name is None:
+            return len(self._entries)
+        return self._counts.get(queue_name, 0)
+
+    def push(self, task):
+        """
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        :return str: Name of the queue the task is put in.
+        """
+        queue_name = self.policy.classify(task)
+        entry = [self.policy.rank(task, time.time()), next(self._counter), task, queue_name]
+        if self._counts.get(queue_name, 0) == 0:
+            # A queue that was idle does not get credit for the time it had nothing to do.
+            self._passes[queue_name] = max(self._passes.get(queue_name, 0),
+                                           self._global_pass + self.STRIDE / self.policy.weight(queue_name))
+            self._queues.setdefault(queue_name, [])
+            self._counts[queue_name] = 0
+        heapq.heappush(self._queues[queue_name], entry)
+        self._counts[queue_name] += 1
+        self._entries[id(task)] = entry
+        return queue_name
+
+    def active_queues(self, skip_queues=(), only_queues=None):
+        """
+        :param tuple[str] skip_queues: (Optional) Leave out the queues of these names.
+        :param tuple[str] | None only_queues: (Optional) Consider only the queues of these names.
+        :return list[str]: Names of the queues that have tasks.
+        """
+        return [name for name, count in self._counts.items()
+                if count > 0 and name not in skip_queues and (only_queues is None or name in only_queues)]
+
+    def pop(self, task_class=None, skip_queues=(), only_queues=None):
+        """
+        :param type | None task_class: (Optional) Pop the first task of this type. This scans all queued tasks.
+        :param tuple[str] skip_queues: (Optional) Do not pop tasks from the queues of these names.
+        :param tuple[str] | None only_queues: (Optional) Only pop tasks from the queues of these names.
+        :return onedrivee.workers.tasks.task_base.TaskBase | None: The next task, or None if there is none.
+        """
+        if task_class is not None:
+            entries = [e for e in self._entries.values() if isinstance(e[2], task_class)]
+            if len(entries) == 0:
+                return None
+            task = min(entries, key=lambda e: (e[0], e[1]))[2]
+            self.remove(task)
+            return task
+        active = self.active_queues(skip_queues, only_queues)
+        if len(active) == 0:
+            return None
+        queue_name = min(active, key=lambda name: self._passes[name])
+        queue = self._queues[queue_name]
+        entry = heapq.heappop(queue)
+        while entry[2] is None:
+            entry = heapq.heappop(queue)
+        task = entry[2]
+        del self._entries[id(task)]
+        self._counts[queue_name] -= 1
+        self._global_pass = self._passes[queue_name]
+        self._passes[queue_name] += self.STRIDE / self.policy.weight(queue_name)
+        return task
+
+    def remove(self, task):
+        """
+        Remove a queued task. Its heap entry is dropped lazily when it reaches the top.
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        """
+        entry = self._entries.pop(id(task), None)
+        if entry is not None:
+            entry[2] = None
+            self._counts[entry[3]] -= 1
+            if self._counts[entry[3]] == 0:
+                self._queues[entry[3]] = []
+
+
+class DriveFairScheduler:
+    """
+    Share pops equally among drives by stride scheduling over a TaskScheduler per drive, so that the backlog of one
+    drive does not hold up the others. Within a drive, tasks are ordered by the policy as before.
+    """
+
+    STRIDE = TaskScheduler.STRIDE
+
+    def __init__(self, policy=None):
+        """
+        :param SchedulingPolicy | None policy: (Optional) The policy. Use SchedulingPolicy by default.
+        """
+        self.policy = policy if policy is not None else SchedulingPolicy()
+        self._schedulers = {}
+        self._passes = {}
+        self._global_pass = 0
+
+    def __len__(self):
+        return sum(len(s) for s in self._schedulers.values())
+
+    def __contains__(self, task):
+        scheduler = self._schedulers.get(task.drive.drive_id)
+        return scheduler is not None and task in scheduler
+
+    def __iter__(self):
+        """
+        Iterate over queued tasks in no particular order.
+        """
+        return (t for s in list(self._schedulers.values()) for t in s)
+
+    def count(self, queue_name=None):
+        """
+        :param str | None queue_name: (Optional) Count only tasks in this queue.
+        :return int: Number of queued tasks of all drives.
+        """
+        return sum(s.count(queue_name) for s in self._schedulers.values())
+
+    def push(self, task):
+        """
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        :return str: Name of the queue the task is put in.
+        """
+        drive_id = task.drive.drive_id
+        scheduler = self._schedulers.get(drive_id)
+        if scheduler is None:
+            scheduler = self._schedulers[drive_id] = TaskScheduler(self.policy)
+        if len(scheduler) == 0:
+            # A drive gets no credit for the time it was idle, but it is served next.
+            self._passes[drive_id] = max(self._passes.get(drive_id, 0), self._global_pass)
+        return scheduler.push(task)
+
+    def pop(self, task_class=None, skip_queues=(), only_queues=None):
+        """
+        :param type | None task_class: (Optional) Pop the first task of this type.
+        :param tuple[str] skip_queues: (Optional) Do not pop tasks from the queues of these names.
+        :param tuple[str] | None only_queues: (Optional) Only pop tasks from the queues of these names.
+        :return onedrivee.workers.tasks.task_base.TaskBase | None: The next task, or None if there is none.
+        """
+        if task_class is not None:
+            candidates = [drive_id for drive_id, s in self._schedulers.items() if len(s) > 0]
+        else:
+            candidates = [drive_id for drive_id, s in self._schedulers.items()
+                          if len(s.active_queues(skip_queues, only_queues)) > 0]
+        for drive_id in sorted(candidates, key=lambda d: self._passes[d]):
+            task = self._schedulers[drive_id].pop(task_class, skip_queues, only_queues)
+            if task is not None:
+                self._global_pass = self._passes[drive_id]
+                self._passes[drive_id] += self.STRIDE
+                return task
+        return None
+
+    def remove(self, task):
+        """
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        """
+        scheduler = self._schedulers.get(task.drive.drive_id)
+        if scheduler is not None:
+            scheduler.remove(task)
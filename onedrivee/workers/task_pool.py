@@ -1,4 +1,12 @@
+import collections
+import itertools
 import threading
+import time
+
+from onedrivee.common.path_trie import PathTrie
+from onedrivee.workers import coalescing
+from onedrivee.workers.scheduler import DriveFairScheduler
+from onedrivee.workers.tasks.task_base import is_journaled
 
 
 class TaskPool:
@@ -6,66 +14,417 @@ class TaskPool:
     An in-memory storage singleton for tasks.
     """
 
+    # Queues of tasks that mostly add more tasks, like directory merges. They wait while the pool is full.
+    EXPANSION_QUEUES = ('merge',)
+
     @classmethod
     def get_instance(cls):
         if not hasattr(cls, '_instance'):
             cls._instance = TaskPool()
         return cls._instance
 
-    def __init__(self):
-        self.tasks_by_path = {}
-        self.queued_tasks = []
+    def __init__(self, policy=None, high_watermark=None, low_watermark=None):
+        """
+        :param onedrivee.workers.scheduler.SchedulingPolicy | None policy: (Optional) Policy to order tasks by.
+        :param int | None high_watermark: (Optional) See set_watermarks().
+        :param int | None low_watermark: (Optional) See set_watermarks().
+        """
+        self.tasks_by_path = PathTrie()
+        self._scheduler = DriveFairScheduler(policy)
         self.semaphore = threading.Semaphore(0)
         self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        # Consumers that only take tasks of one queue wait on the condition of that queue.
+        self._queue_ready = collections.defaultdict(lambda: threading.Condition(self._lock))
+        self._full = False
+        # The newest task added on the path of a task being handled that holds it, by path. See _release_hold().
+        self._parked = {}
+        self._journal = None
+        # Journal writes queued under the lock, as (whether to add, task), and written without it by _write_journal().
+        self._journal_ops = collections.deque()
+        self._journal_lock = threading.Lock()
+        # Number of popped tasks not recorded in the journal that are not completed yet.
+        self._num_unjournaled_in_flight = 0
+        self.set_watermarks(high_watermark, low_watermark)
+
+    def set_watermarks(self, high_watermark, low_watermark=None):
+        """
+        Bound the number of queued tasks. The pool is full from when it reaches the high watermark until it drops to
+        the low watermark. While full, add_task blocks callers other than task consumers, and tasks of expansion queues
+        are popped only if nothing else is queued, so that traversal goes on only as fast as workers drain the pool.
+        :param int | None high_watermark: None for no bound.
+        :param int | None low_watermark: (Optional) Default to half of the high watermark.
+        """
+        with self._lock:
+            if high_watermark is not None and (low_watermark is None or low_watermark > high_watermark):
+                low_watermark = high_watermark // 2
+            self._high_watermark = high_watermark
+            self._low_watermark = low_watermark
+            self._update_fullness()
+
+    def _update_fullness(self):
+        count = len(self._scheduler)
+        if self._high_watermark is None or count <= self._low_watermark:
+            if self._full:
+                self._full = False
+                self._room.notify_all()
+                for queue_name in self.EXPANSION_QUEUES:
+                    self._queue_ready[queue_name].notify_all()
+        elif count >= self._high_watermark:
+            self._full = True
+
+    def is_full(self):
+        """
+        :rtype: True | False
+        """
+        with self._lock:
+            return self._full
+
+    def _wait_for_room(self):
+        consumer = threading.current_thread()
+        if not getattr(consumer, 'waits_for_room', True):
+            # Threads that relay local changes would lose them while blocked, e.g. when the inotify queue overflows.
+            return
+        if getattr(consumer, 'is_task_consumer', False):
+            # Consumers waiting for room could all wait on each other. Let them drain the pool in place instead.
+            if self.is_full():
+                consumer.help_drain()
+            return
+        with self._lock:
+            while self._full:
+                self._room.wait()
+
+    def set_journal(self, journal):
+        """
+        Record tasks of journaled types in the journal from now on.
+        :param onedrivee.store.task_db.TaskJournal journal:
+        """
+        self._journal = journal
+
+    def set_policy(self, policy):
+        """
+        Order tasks by a new policy, including those already queued.
+        :param onedrivee.workers.scheduler.SchedulingPolicy policy:
+        """
+        with self._lock:
+            queued_tasks = list(self._scheduler)
+            self._scheduler = DriveFairScheduler(policy)
+            for t in queued_tasks:
+                self._scheduler.push(t)
+            for cond in self._queue_ready.values():
+                cond.notify_all()
+
+    def queue_names(self):
+        """
+        :return list[str]: Names of the queues the scheduling policy puts tasks in.
+        """
+        return sorted(self._scheduler.policy.WEIGHTS)
 
     def add_task(self, task):
         """
-        Add a task to internal storage. It will not add if there is already a task on the path.
+        Add a task to internal storage. It will not add if there is already a task on the path, and waits until a task
+        being handled on the path releases it. Block while the pool is full, unless called from a task consumer or a
+        thread whose waits_for_room attribute is False.
         :param onedrivee.common.tasks.TaskBase task: The task to add.
         """
+        self._wait_for_room()
         self._lock.acquire()
-        if task.local_path in self.tasks_by_path:
-            self._lock.release()
-            return
-        self.queued_tasks.append(task)
-        self.tasks_by_path[task.local_path] = task
+        dropped = []
+        displaced = self._displace(task, dropped)
+        added = 0
+        coalesced = self._coalesce(task, dropped)
+        for t in (coalesced, displaced):
+            if t is None:
+                continue
+            if t.local_path in self.tasks_by_path:
+                if t is coalesced and self.tasks_by_path[t.local_path] not in self._scheduler:
+                    self._park(t, dropped)
+                    continue
+                self._forget_task(t)
+                dropped.append(t)
+            else:
+                self._push(t)
+                added += 1
+        self._update_fullness()
         self._lock.release()
-        self.semaphore.release()
+        self._write_journal()
+        for _ in range(added):
+            self.semaphore.release()
+        self._notify_dropped(dropped)
+
+    def _push(self, task):
+        if self._journal is not None and task.journal_id is None and is_journaled(task):
+            self._journal_ops.append((True, task))
+        queue_name = self._scheduler.push(task)
+        self.tasks_by_path[task.local_path] = task
+        self._update_fullness()
+        self._queue_ready[queue_name].notify()
+
+    def _park(self, task, dropped):
+        """
+        Keep a task on the path of a task being handled until the latter releases the path. A task parked before on
+        the path is replaced, since the newer task reflects the latest change.
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        :param [onedrivee.workers.tasks.task_base.TaskBase] dropped: The replaced task is appended to it.
+        """
+        old = self._parked.get(task.local_path)
+        if old is not None:
+            self._forget_task(old)
+            dropped.append(old)
+        if self._journal is not None and task.journal_id is None and is_journaled(task):
+            self._journal_ops.append((True, task))
+        self._parked[task.local_path] = task
+
+    def _release_hold(self, task):
+        """
+        Free the path held by a task being handled, and queue the task parked on it, if any. Call with the lock.
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        :return True | False: Whether a parked task is queued, in which case the caller releases the semaphore.
+        """
+        if self.tasks_by_path.get(task.local_path) is not task:
+            return False
+        del self.tasks_by_path[task.local_path]
+        parked = self._parked.pop(task.local_path, None)
+        if parked is None:
+            return False
+        self._push(parked)
+        return True
+
+    def _remove_queued(self, task):
+        self._scheduler.remove(task)
+        del self.tasks_by_path[task.local_path]
+        self._forget_task(task)
+        # Take back the permit released for the task, as pop_task_nowait() does, so that no consumer wakes up for it.
+        self.semaphore.acquire(blocking=False)
+
+    @staticmethod
+    def _notify_dropped(tasks):
+        # Called without the lock, since tasks may update the items database.
+        for t in tasks:
+            t.on_dropped()
+
+    def _displace(self, task, dropped):
+        """
+        Take out the queued task on the path the task moves an item to, since the item replaces what was there.
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        :param [onedrivee.workers.tasks.task_base.TaskBase] dropped: The queued task is appended to it.
+        :return onedrivee.workers.tasks.task_base.TaskBase | None: A task to add in place of the queued task, if any.
+        """
+        if coalescing.origin_path(task) is None:
+            return None
+        queued = self.tasks_by_path.get(task.local_path)
+        if queued is None or queued not in self._scheduler:
+            return None
+        self._remove_queued(queued)
+        dropped.append(queued)
+        return coalescing.displace(queued, task)
+
+    def _coalesce(self, task, dropped):
+        """
+        Merge the task with the queued task on its path or, if it moves an item, on the path it takes the item from.
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        :param [onedrivee.workers.tasks.task_base.TaskBase] dropped: Tasks whose work is dropped are appended to it.
+        :return onedrivee.workers.tasks.task_base.TaskBase | None: The task to add, or None if there is none.
+        """
+        origin_path = coalescing.origin_path(task)
+        if origin_path is None:
+            queued = self.tasks_by_path.get(task.local_path)
+        else:
+            queued = self.tasks_by_path.get(origin_path)
+            if queued is not None and not coalescing.has_rule(queued, task):
+                return task
+        if queued is None or queued not in self._scheduler:
+            # Nothing is queued, or the task is being handled.
+            return task
+        ret = coalescing.coalesce(queued, task)
+        for t in (queued, task):
+            # A move replaced by another move of the same item is carried on.
+            if t is not ret and (ret is None or coalescing.origin_path(t) != coalescing.origin_path(ret)):
+                dropped.append(t)
+        if ret is queued:
+            self._forget_task(task)
+            return None
+        self._remove_queued(queued)
+        if ret is not task:
+            self._forget_task(task)
+        return ret
 
     def pop_task(self, task_class=None):
         """
-        Pop the oldest task. It's required that the caller first acquire the semaphore.
+        Pop the task to handle next. It's required that the caller first acquire the semaphore.
         :param task_class: (Optional) Pop the first task of this given type.
         :return onedrivee.common.tasks.TaskBase | None: The first qualified task, or None.
         """
-        self._lock.acquire()
-        ret = None
-        if len(self.queued_tasks) > 0:
-            if task_class is None:
-                ret = self.queued_tasks.pop(0)
+        with self._lock:
+            if self._full and task_class is None:
+                ret = self._scheduler.pop(skip_queues=self.EXPANSION_QUEUES)
+                if ret is None:
+                    ret = self._scheduler.pop()
             else:
-                for t in self.queued_tasks:
-                    if isinstance(t, task_class):
-                        ret = t
-                        self.queued_tasks.remove(t)
-                        break
-        if ret is not None and not ret.should_hold:
-            del self.tasks_by_path[ret.local_path]
-        self._lock.release()
+                ret = self._scheduler.pop(task_class)
+            self._on_popped(ret)
+            return ret
+
+    def pop_task_nowait(self):
+        """
+        Pop the next task not in an expansion queue, if there is one. The semaphore is acquired for the caller.
+        :return onedrivee.common.tasks.TaskBase | None: The task, or None.
+        """
+        if not self.semaphore.acquire(blocking=False):
+            return None
+        with self._lock:
+            ret = self._scheduler.pop(skip_queues=self.EXPANSION_QUEUES)
+            if ret is None:
+                self.semaphore.release()
+            self._on_popped(ret)
+            return ret
+
+    def pop_task_of_queue(self, queue_name, timeout=None, cancel=None):
+        """
+        Wait for and pop the next task of a queue. Unlike pop_task(), the caller does not acquire the semaphore.
+        :param str queue_name: Name of the queue.
+        :param float | None timeout: (Optional) Seconds to wait at most.
+        :param threading.Event | None cancel: (Optional) Stop waiting once it is set and wake_queue_consumers() called.
+        :return onedrivee.common.tasks.TaskBase | None: The task, or None on timeout or cancellation.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while not self._is_queue_ready(queue_name):
+                if cancel is not None and cancel.is_set():
+                    return None
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._queue_ready[queue_name].wait(remaining)
+            ret = self._scheduler.pop(only_queues=(queue_name,))
+            self._on_popped(ret)
+        # Take the permit released for the task, so that consumers of all queues do not wake up for it in vain.
+        self.semaphore.acquire(blocking=False)
         return ret
 
+    def wake_queue_consumers(self):
+        """
+        Wake up all consumers waiting in pop_task_of_queue(), so that those cancelled return.
+        """
+        with self._lock:
+            for cond in self._queue_ready.values():
+                cond.notify_all()
+
+    def _is_queue_ready(self, queue_name):
+        count = self._scheduler.count(queue_name)
+        if self._full and queue_name in self.EXPANSION_QUEUES:
+            # Same as pop_task(), hold back expansions while there is anything else to do.
+            return count > 0 and count == len(self._scheduler)
+        return count > 0
+
+    def _on_popped(self, task):
+        if task is not None:
+            if not is_journaled(task):
+                self._num_unjournaled_in_flight += 1
+            if not task.should_hold:
+                del self.tasks_by_path[task.local_path]
+            self._update_fullness()
+            if self._full:
+                for queue_name in self.EXPANSION_QUEUES:
+                    self._queue_ready[queue_name].notify()
+
+    def complete_task(self, task):
+        """
+        Call when a popped task has been handled.
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        """
+        with self._lock:
+            if not is_journaled(task):
+                self._num_unjournaled_in_flight -= 1
+            self._forget_task(task)
+            # A task that holds its path may fail before it clears the hold.
+            requeued = task.should_hold and self._release_hold(task)
+        self._write_journal()
+        if requeued:
+            self.semaphore.release()
+
+    def has_unjournaled_tasks(self):
+        """
+        :return True | False: Whether tasks not recorded in the journal are queued or being handled. Their work is lost
+        if the program stops now.
+        """
+        with self._lock:
+            return self._num_unjournaled_in_flight > 0 or any(
+                not is_journaled(t) for t in itertools.chain(self._scheduler, self._parked.values()))
+
+    def _forget_task(self, task):
+        if self._journal is not None and (task.journal_id is not None or is_journaled(task)):
+            self._journal_ops.append((False, task))
+
+    def _write_journal(self):
+        """
+        Apply the journal writes queued so far. Call without the lock, so that SQLite does not hold up other threads.
+        """
+        with self._journal_lock:
+            while self._journal_ops:
+                add, task = self._journal_ops.popleft()
+                if add:
+                    if task.journal_id is None:
+                        task.journal_id = self._journal.add(task.drive.drive_id, type(task).__name__, task.dump())
+                elif task.journal_id is not None:
+                    self._journal.delete(task.journal_id)
+                    task.journal_id = None
+
+    def num_queued_tasks(self, queue_name=None):
+        """
+        :param str | None queue_name: (Optional) Count only tasks in this queue.
+        :return int: Number of tasks waiting to be popped.
+        """
+        with self._lock:
+            return self._scheduler.count(queue_name)
+
     def has_pending_task(self, local_path):
         with self._lock:
             return local_path in self.tasks_by_path
 
+    def has_pending_task_under(self, local_path):
+        """
+        :param str local_path:
+        :return True | False: Whether there is a pending task on the path or any path under it.
+        """
+        with self._lock:
+            return local_path in self.tasks_by_path or self.tasks_by_path.has_descendant(local_path)
+
+    def has_pending_task_above(self, local_path):
+        """
+        :param str local_path:
+        :return True | False: Whether there is a pending task on any ancestor directory of the path.
+        """
+        with self._lock:
+            return self.tasks_by_path.has_ancestor(local_path)
+
     def clear_hold(self, task):
-        if task.local_path in self.tasks_by_path and self.tasks_by_path[task.local_path] is task:
-            with self._lock:
-                del self.tasks_by_path[task.local_path]
+        """
+        Let tasks be queued on the path of a task being handled, starting with the one parked on it, if any.
+        :param onedrivee.workers.tasks.task_base.TaskBase task:
+        """
+        with self._lock:
+            requeued = self._release_hold(task)
+        self._write_journal()
+        if requeued:
+            self.semaphore.release()
 
     def remove_children_tasks(self, local_parent_path):
+        """
+        Remove queued and parked tasks on the path and all paths under it. Tasks being handled are left alone.
+        :param str local_parent_path:
+        """
+        dropped = []
         with self._lock:
-            for t in self.queued_tasks[:]:
-                if t.local_path.startswith(local_parent_path):
-                    self.queued_tasks.remove(t)
-                    del self.tasks_by_path[t.local_path]
+            for path, t in self.tasks_by_path.items_under(local_parent_path):
+                if t in self._scheduler:
+                    self._remove_queued(t)
+                    dropped.append(t)
+                elif path in self._parked:
+                    # Parked tasks are on paths held by tasks being handled.
+                    parked = self._parked.pop(path)
+                    self._forget_task(parked)
+                    dropped.append(parked)
+            self._update_fullness()
+        self._write_journal()
+        self._notify_dropped(dropped)
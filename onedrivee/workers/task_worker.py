@@ -6,6 +6,8 @@ from onedrivee.common import logger_factory
 class TaskConsumer(threading.Thread):
     terminate_sign = threading.Event()
     logger = logger_factory.get_logger('TaskConsumer')
+    # Tell the task pool not to block this thread when it is full. See TaskPool.add_task.
+    is_task_consumer = True
 
     def __init__(self, task_pool):
         """
@@ -14,6 +16,7 @@ class TaskConsumer(threading.Thread):
         super().__init__()
         self.daemon = True
         self.task_pool = task_pool
+        self._helping = False
 
     def run(self):
         self.logger.debug('Started.')
@@ -22,10 +25,55 @@ class TaskConsumer(threading.Thread):
             if self.terminate_sign.is_set():
                 break
             task = self.task_pool.pop_task()
-            self.logger.debug('Acquired task of type "%s" on parent "%s", name "%s".',
-                              type(task).__name__, task.local_parent_path, task.item_name)
-            task.handle()
+            if task is None:
+                # The task the semaphore was released for has been removed from the pool.
+                continue
+            self._handle_task(task)
         self.logger.debug('Stopped.')
 
+    def _handle_task(self, task):
+        handle_task(self.task_pool, task, self.logger)
+
+    def help_drain(self):
+        """
+        Handle queued tasks other than expansions in place while the pool is full. The pool calls it when the task
+        being handled adds tasks to a full pool.
+        """
+        if self._helping:
+            return
+        self._helping = True
+        try:
+            drain_in_place(self.task_pool, self.logger)
+        finally:
+            self._helping = False
+
+
+def handle_task(task_pool, task, logger):
+    """
+    Handle a task popped from the pool and record it done.
+    :param onedrivee.workers.task_pool.TaskPool task_pool:
+    :param onedrivee.workers.tasks.task_base.TaskBase task:
+    :param logging.Logger logger:
+    """
+    logger.debug('Acquired task of type "%s" on parent "%s", name "%s".',
+                 type(task).__name__, task.local_parent_path, task.item_name)
+    task.handle()
+    task_pool.complete_task(task)
+    # Commit database writes of finished tasks in batches, but leave none pending once the pool runs dry.
+    task.items_store.flush(only_if_due=task_pool.num_queued_tasks() > 0)
+
+
+def drain_in_place(task_pool, logger):
+    """
+    Handle queued tasks other than expansions in the calling thread while the pool is full.
+    :param onedrivee.workers.task_pool.TaskPool task_pool:
+    :param logging.Logger logger:
+    """
+    while task_pool.is_full():
+        task = task_pool.pop_task_nowait()
+        if task is None:
+            break
+        handle_task(task_pool, task, logger)
+
 
 TaskConsumer.terminate_sign.clear()
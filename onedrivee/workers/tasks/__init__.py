@@ -1 +1 @@
-__all__ = ['task_base', 'copy_task', 'delete_task', 'down_task', 'merge_task', 'move_task', 'up_task', 'utils']
+__all__ = ['task_base', 'copy_task', 'delete_task', 'delta_task', 'down_task', 'merge_task', 'move_task', 'up_task', 'utils']
@@ -1,14 +1,13 @@
 import os
-import threading
 import traceback
-from time import sleep
 
 from onedrivee.drives import errors
 from onedrivee.drives import options
 from onedrivee.drives import resources
-from onedrivee.wokers.tasks.task_base import TaskBase
-from onedrivee.wokers.tasks.up_task import UploadFileTask
-from onedrivee.store.items_db import ItemRecordStatuses
+from onedrivee.workers import delayed
+from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.workers.tasks.up_task import UploadFileTask
+from onedrivee.store.items_db import ItemRecord, ItemRecordStatuses
 
 
 class AsyncCopyItemTask(TaskBase):
@@ -17,25 +16,29 @@ class AsyncCopyItemTask(TaskBase):
         :param TaskBase parent_task:
         :param str rel_parent_path:
         :param str item_name:
-        :param onedrivee.api.items.OneDriveItem from_item:
+        :param onedrivee.api.items.OneDriveItem | onedrivee.store.items_db.ItemRecord from_item: The item to copy, or
+        its database record.
         """
         super().__init__(parent_task)
         self.rel_parent_path = rel_parent_path
         self.item_name = item_name
-        self._from_item = from_item
+        self._from_item_id = from_item.item_id if isinstance(from_item, ItemRecord) else from_item.id
 
     def handle(self):
         try:
             new_parent_reference = resources.ItemReference.build(path=self.remote_parent_path)
-            async_status = self.drive.copy_item(dest_reference=new_parent_reference, item_id=self._from_item.id,
+            async_status = self.drive.copy_item(dest_reference=new_parent_reference, item_id=self._from_item_id,
                                                 new_name=self.item_name)
             self.task_pool.add_task(AsyncCopyMonitorTask(self, async_status))
         except errors.OneDriveError as e:
-            self.logger.error('API error copying item "%s" to "%s":\n%s.', self._from_item.id, self.remote_path, traceback.format_exc())
+            self.logger.error('API error copying item "%s" to "%s":\n%s.', self._from_item_id, self.remote_path, traceback.format_exc())
 
 
 class AsyncCopyMonitorTask(TaskBase):
-    POLLING_INTERVAL_SEC = 60
+    # Wait this long before the first recheck, and twice as long before each next one up to MAX_POLLING_INTERVAL_SEC.
+    # Small copies are thus noticed soon, while large ones cost few requests.
+    POLLING_INTERVAL_SEC = 2
+    MAX_POLLING_INTERVAL_SEC = 120
 
     def __init__(self, parent_task, async_status):
         """
@@ -46,12 +49,13 @@ class AsyncCopyMonitorTask(TaskBase):
         self.rel_parent_path = parent_task.rel_parent_path
         self.item_name = parent_task.item_name
         self._async_status = async_status
+        self._num_rechecks = 0
 
     def put_back(self):
-        self.logger.info('Copy for file "%s" is still in progress. Recheck in %d sec.',
-                         self.local_path, self.POLLING_INTERVAL_SEC)
-        sleep(self.POLLING_INTERVAL_SEC)
-        self.task_pool.add_task(self)
+        interval = min(self.POLLING_INTERVAL_SEC * 2 ** self._num_rechecks, self.MAX_POLLING_INTERVAL_SEC)
+        self._num_rechecks += 1
+        self.logger.info('Copy for file "%s" is still in progress. Recheck in %d sec.', self.local_path, interval)
+        delayed.add_task_later(interval, self.task_pool, self)
 
     def handle(self):
         try:
@@ -72,8 +76,6 @@ class AsyncCopyMonitorTask(TaskBase):
                 self.logger.info('Successfully copied file "%s" to server', self.local_path)
             else:
                 # Put the task back to task pool.
-                th = threading.Thread(target=self.put_back, args=())
-                th.daemon = True
-                th.start()
+                self.put_back()
         except errors.OneDriveError as e:
             self.logger.error('API error when polling copy status for file "%s":\n%s.', self.local_path, traceback.format_exc())
@@ -1,9 +1,10 @@
 import traceback
 
 from onedrivee.drives import errors
-from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.workers.tasks.task_base import TaskBase, journaled
 
 
+@journaled
 class DeleteItemTask(TaskBase):
     def __init__(self, parent_task, rel_parent_path, item_name, is_folder):
         """
@@ -17,6 +18,13 @@ class DeleteItemTask(TaskBase):
         self.item_name = item_name
         self.is_folder = is_folder
 
+    def dump(self):
+        return {'rel_parent_path': self.rel_parent_path, 'item_name': self.item_name, 'is_folder': self.is_folder}
+
+    @classmethod
+    def load(cls, parent_task, data):
+        return cls(parent_task, data['rel_parent_path'], data['item_name'], data['is_folder'])
+
     def handle(self):
         try:
             self.drive.delete_item(item_path=self.remote_path)
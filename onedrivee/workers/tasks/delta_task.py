@@ -0,0 +1,225 @@
+import os
+import traceback
+from urllib import parse as url_parse
+
+from send2trash import send2trash
+
+from onedrivee.common.utils import mkdir
+from onedrivee.drives import errors
+from onedrivee.drives.items import OneDriveItemTypes
+from onedrivee.common.dateparser import datetime_to_timestamp, compare_timestamps
+from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.workers.tasks.down_task import DownloadFileTask
+from onedrivee.workers.tasks.merge_task import MergeDirTask
+from onedrivee.workers.tasks.up_task import UploadFileTask
+from onedrivee.workers.tasks.utils import append_hostname, stat_file
+from onedrivee.store.items_db import ItemRecordStatuses
+
+
+class DeltaSyncTask(TaskBase):
+    """
+    Apply the remote changes made since the last sync to the local repository. The API calls it costs is proportional
+    to the number of changed items rather than the size of the drive. If the drive has never been synced, or the
+    server asks for a resync, fall back to a full MergeDirTask on root.
+    """
+
+    scheduling_class = 'merge'
+
+    def __init__(self, parent_task, full_merge=False):
+        """
+        :param TaskBase parent_task: Base task.
+        :param True | False full_merge: If True, merge the whole drive instead of applying changes.
+        """
+        super().__init__(parent_task)
+        self.rel_parent_path = ''
+        self.item_name = ''
+        self.path_filter = self.drive.config.path_filter
+        self._needs_full_merge = full_merge
+
+    def handle(self):
+        token = self.items_store.get_delta_token()
+        if token is None or self._needs_full_merge:
+            self._start_full_sync()
+            return
+        try:
+            changes = self.drive.get_changes(token=token)
+            while changes.has_next:
+                for item in changes.get_next():
+                    self._apply_change(item)
+            if self._needs_full_merge:
+                self._start_full_sync()
+            elif changes.token is not None:
+                self.items_store.set_delta_token(changes.token)
+        except errors.OneDriveResyncRequiredError:
+            self.logger.info('Server requires a full resync of drive "%s".', self.drive.drive_id)
+            self.items_store.set_delta_token(None)
+            self._start_full_sync()
+        except (IOError, OSError) as e:
+            self.logger.error('IO error when applying remote changes:\n%s.', traceback.format_exc())
+        except errors.OneDriveError as e:
+            self.logger.error('API error when fetching remote changes:\n%s.', traceback.format_exc())
+
+    def _start_full_sync(self):
+        """
+        Take the current cursor before merging the whole tree so that changes made during the merge are replayed by
+        the next DeltaSyncTask.
+        """
+        try:
+            root_item = self.drive.get_root_dir(list_children=False)
+            self.items_store.set_state(self.items_store.ROOT_ID_KEY, root_item.id)
+            token = self.drive.get_changes(token='latest').token
+        except errors.OneDriveError as e:
+            self.logger.error('API error when fetching latest change cursor:\n%s.', traceback.format_exc())
+            return
+        self.logger.info('Start full sync of drive "%s".', self.drive.drive_id)
+        self.items_store.set_delta_token(token)
+        self.task_pool.add_task(MergeDirTask(self, '', ''))
+
+    def _resolve_parent_path(self, item):
+        """
+        Change enumeration does not include parent paths. Resolve it from the parent's record instead.
+        :param onedrivee.drives.items.OneDriveItem item:
+        :return str | None: Remote path of the item's parent, or None if it cannot be resolved.
+        """
+        parent_ref = item.parent_reference
+        if parent_ref is None:
+            return None
+        if 'path' in parent_ref.data:
+            return url_parse.unquote(parent_ref.path)
+        if parent_ref.id == self.items_store.get_state(self.items_store.ROOT_ID_KEY):
+            return self.drive.drive_path + '/root:'
+        q = self.items_store.get_items_by_id(item_id=parent_ref.id)
+        if len(q) == 0:
+            return None
+        parent_id, parent_record = q.popitem()
+        return parent_record.parent_path + '/' + parent_record.item_name
+
+    def _get_record(self, item_id):
+        q = self.items_store.get_items_by_id(item_id=item_id)
+        if len(q) == 0:
+            return None
+        item_id, record = q.popitem()
+        return record
+
+    def _apply_change(self, item):
+        """
+        Dispatch a changed item to the proper subroutine.
+        :param onedrivee.drives.items.OneDriveItem item:
+        """
+        if item.is_root:
+            self.items_store.set_state(self.items_store.ROOT_ID_KEY, item.id)
+            return
+        record = self._get_record(item.id)
+        if item.is_deleted:
+            self._apply_delete(record)
+            return
+        parent_path = self._resolve_parent_path(item)
+        if parent_path is None:
+            self.logger.info('Cannot resolve parent of changed item "%s". Will merge the whole drive.', item.id)
+            self._needs_full_merge = True
+            return
+        rel_parent_path = parent_path.split(':', 1)[1]
+        rel_path = rel_parent_path + '/' + item.name
+        if self.path_filter.should_ignore(rel_path, item.is_folder):
+            return
+        item_local_path = self.drive.config.local_root + rel_path
+        if self.task_pool.has_pending_task(item_local_path):
+            self.logger.debug('Skip remote change on "%s" because a local task is pending.', item_local_path)
+            return
+        is_moved = record is not None and record.local_path != rel_path
+        if is_moved:
+            record = self._apply_move(record, parent_path + '/' + item.name)
+        if item.is_folder:
+            self._apply_folder_change(item, parent_path, item_local_path)
+            if is_moved and record is None:
+                # Descendants of a moved folder are not enumerated. Merge the folder to bring them back.
+                self.task_pool.add_task(MergeDirTask(self, rel_parent_path + '/', item.name))
+        else:
+            self._apply_file_change(item, parent_path, rel_parent_path + '/', item_local_path, record)
+
+    def _apply_delete(self, record):
+        """
+        :param onedrivee.store.items_db.ItemRecord | None record: Record of the deleted item.
+        """
+        if record is None:
+            return
+        item_local_path = self.drive.config.local_root + record.local_path
+        if self.task_pool.has_pending_task_under(item_local_path):
+            self.logger.info('Item "%s" was deleted remotely but has a pending local task. Skip.', item_local_path)
+            return
+        is_folder = record.type == OneDriveItemTypes.FOLDER
+        try:
+            if os.path.exists(item_local_path):
+                send2trash(item_local_path)
+            self.items_store.delete_item(item_id=record.item_id, is_folder=is_folder)
+            if is_folder:
+                self.task_pool.remove_children_tasks(item_local_path)
+            self.logger.info('Deleted local entry "%s" as it was deleted remotely.', item_local_path)
+        except (IOError, OSError) as e:
+            self.logger.error('An error occurred when deleting local item "%s":\n%s.', item_local_path,
+                              traceback.format_exc())
+
+    def _apply_move(self, record, new_remote_path):
+        """
+        Move the local entry of a record to where the remote item now is.
+        :param onedrivee.store.items_db.ItemRecord record:
+        :param str new_remote_path: New remote path of the item.
+        :return onedrivee.store.items_db.ItemRecord | None: The record if the local entry was moved, otherwise None.
+        """
+        old_local_path = self.drive.config.local_root + record.local_path
+        new_local_path = self.items_store.remote_path_to_local_path(new_remote_path)
+        if not os.path.exists(old_local_path) or os.path.exists(new_local_path) or \
+                self.task_pool.has_pending_task_under(old_local_path):
+            return None
+        try:
+            os.rename(old_local_path, new_local_path)
+            if record.type == OneDriveItemTypes.FOLDER:
+                self.items_store.move_children(record.parent_path + '/' + record.item_name, new_remote_path)
+            self.logger.info('Moved local entry "%s" to "%s".', old_local_path, new_local_path)
+            return record
+        except (IOError, OSError) as e:
+            self.logger.error('An error occurred when moving local item "%s":\n%s.', old_local_path,
+                              traceback.format_exc())
+            return None
+
+    def _apply_folder_change(self, item, parent_path, item_local_path):
+        if not os.path.isdir(item_local_path):
+            if os.path.exists(item_local_path):
+                self.logger.info('Type conflict on path "%s". Keep both.', item_local_path)
+                self._rename_existing(item_local_path)
+            self.logger.info('Creating directory "%s".', item_local_path)
+            mkdir(item_local_path)
+        self.items_store.update_item(item, ItemRecordStatuses.OK, parent_path)
+
+    def _apply_file_change(self, item, parent_path, rel_parent_path, item_local_path, record):
+        if not os.path.exists(item_local_path):
+            self.logger.info('Will download file "%s".', item_local_path)
+        elif record is not None and record.c_tag == item.c_tag:
+            # Content is intact. Only metadata or location changed.
+            self.items_store.update_item(item, ItemRecordStatuses.OK, parent_path)
+            return
+        elif record is None or not self._is_intact(item_local_path, record):
+            # Both sides changed since last sync. Keep both.
+            self.logger.info('File "%s" changed on both sides. Keep both.', item_local_path)
+            self._rename_existing(item_local_path)
+        else:
+            self.logger.info('File "%s" changed remotely since last sync. Download.', item_local_path)
+        self.task_pool.add_task(DownloadFileTask(self, rel_parent_path=rel_parent_path, item=item))
+
+    @staticmethod
+    def _is_intact(item_local_path, record):
+        """
+        Whether or not the local file is untouched since it was recorded.
+        :param str item_local_path:
+        :param onedrivee.store.items_db.ItemRecord record:
+        :rtype: True | False
+        """
+        file_size, file_mtime = stat_file(item_local_path)
+        return file_size == record.size and \
+               compare_timestamps(file_mtime, datetime_to_timestamp(record.modified_time)) == 0
+
+    def _rename_existing(self, item_local_path):
+        resolved_path = append_hostname(item_local_path)
+        if os.path.isfile(resolved_path):
+            rel_parent_path, resolved_name = resolved_path[len(self.drive.config.local_root):].rsplit('/', 1)
+            self.task_pool.add_task(UploadFileTask(self, rel_parent_path + '/', resolved_name))
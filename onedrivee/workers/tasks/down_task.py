@@ -1,3 +1,4 @@
+import hashlib
 import os
 import traceback
 
@@ -5,7 +6,8 @@ from onedrivee.common.utils import OS_USER_ID, OS_USER_GID
 from onedrivee.drives import errors
 from onedrivee.common import hasher
 from onedrivee.common.dateparser import datetime_to_timestamp
-from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.drives.items import OneDriveItem
+from onedrivee.workers.tasks.task_base import TaskBase, journaled
 from onedrivee.store.items_db import ItemRecordStatuses
 
 
@@ -13,7 +15,10 @@ def get_tmp_filename(name):
     return '.' + name + '.!od'
 
 
+@journaled
 class DownloadFileTask(TaskBase):
+    scheduling_class = 'transfer'
+
     def __init__(self, parent_task, rel_parent_path, item):
         """
         :param TaskBase parent_task: Base task.
@@ -25,18 +30,43 @@ class DownloadFileTask(TaskBase):
         self._item = item
         self._item_name = item.name
 
+    def dump(self):
+        return {'rel_parent_path': self.rel_parent_path, 'item_data': self._item.data}
+
+    @classmethod
+    def load(cls, parent_task, data):
+        return cls(parent_task, data['rel_parent_path'], OneDriveItem(parent_task.drive, data['item_data']))
+
+    @property
+    def size_hint(self):
+        return self._item.size
+
     def handle(self):
         local_item_tmp_path = self.local_parent_path + get_tmp_filename(self.item_name)
         try:
-            with open(local_item_tmp_path, 'wb') as f:
-                self.drive.download_file(file=f, size=self._item.size, item_id=self._item.id)
-            local_sha1 =  hasher.hash_value(local_item_tmp_path)
+            sha1 = hashlib.sha1()
+            crc32 = hasher.Crc32()
+            offset = self._get_resume_offset(local_item_tmp_path, [sha1, crc32])
+            with open(local_item_tmp_path, 'r+b' if offset > 0 else 'wb') as f:
+                if offset > 0:
+                    self.logger.info('Resume downloading "%s" from byte %d.', self.local_path, offset)
+                    f.truncate(offset)
+                    f.seek(offset)
+                self.drive.download_file(file=f, size=self._item.size, item_id=self._item.id, hashers=[sha1, crc32],
+                                         offset=offset,
+                                         progress=lambda done: self.items_store.set_partial_download(
+                                             local_item_tmp_path, self._item.id, self._item.c_tag, self._item.size,
+                                             done))
+            self.items_store.delete_partial_download(local_item_tmp_path)
+            self.items_store.save_fragment_sizes()
+            local_sha1 = sha1.hexdigest().upper()
             item_sha1 = None
             if self._item.file_props is not None and self._item.file_props.hashes is not None:
                 item_sha1 = self._item.file_props.hashes.sha1
             if item_sha1 is None:
                 self.logger.warn('Remote file %s has not sha1 property, we keep the file but cannot check correctness of it',
                       self.local_path)
+                self.items_store.set_remote_sha1_hash(self._item.id, self._item.c_tag, local_sha1)
             elif local_sha1 != item_sha1:
                 self.logger.error('Mismatch hash of download file %s : remote:%s,%d  local:%s %d', self.local_path,
                      self._item.file_props.hashes.sha1, self._item.size, local_sha1, os.path.getsize(local_item_tmp_path))
@@ -45,8 +75,36 @@ class DownloadFileTask(TaskBase):
             t = datetime_to_timestamp(self._item.modified_time)
             os.utime(self.local_path, (t, t))
             os.chown(self.local_path, OS_USER_ID, OS_USER_GID)
-            self.items_store.update_item(self._item, ItemRecordStatuses.DOWNLOADED)
+            self.items_store.set_local_hashes(self.local_path, crc32_hash=crc32.hexdigest(), sha1_hash=local_sha1)
+            self.items_store.update_item(self._item, ItemRecordStatuses.DOWNLOADED, self.remote_parent_path)
         except (IOError, OSError) as e:
             self.logger.error('An IO error occurred when downloading "%s":\n%s.', self.local_path, traceback.format_exc())
         except errors.OneDriveError as e:
             self.logger.error('An API error occurred when downloading "%s":\n%s.', self.local_path, traceback.format_exc())
+
+    def _get_resume_offset(self, local_item_tmp_path, hashers):
+        """
+        Find out how much of the file was downloaded before the task was interrupted, and feed that part to the hash
+        objects. The partial file is used only if the remote file has not changed since.
+        :param str local_item_tmp_path: Path to the temporary file.
+        :param [T] hashers: Hash objects to update with the existing content.
+        :return int: Number of bytes to skip. 0 means downloading from the beginning.
+        """
+        partial = self.items_store.get_partial_download(local_item_tmp_path)
+        if partial is None:
+            return 0
+        item_id, c_tag, size, bytes_done = partial
+        if item_id != self._item.id or c_tag != self._item.c_tag or size != self._item.size or \
+                not os.path.isfile(local_item_tmp_path) or os.path.getsize(local_item_tmp_path) < bytes_done:
+            self.items_store.delete_partial_download(local_item_tmp_path)
+            return 0
+        with open(local_item_tmp_path, 'rb') as f:
+            remaining = bytes_done
+            while remaining > 0:
+                data = f.read(min(remaining, 1048576))
+                if not data:
+                    break
+                remaining -= len(data)
+                for h in hashers:
+                    h.update(data)
+        return bytes_done
@@ -1,4 +1,6 @@
+import hashlib
 import os
+import stat
 import traceback
 
 from send2trash import send2trash
@@ -8,22 +10,35 @@ from onedrivee.drives import errors
 from onedrivee.common import hasher
 from onedrivee.common.dateparser import datetime_to_timestamp, compare_timestamps
 from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.workers.tasks.copy_task import AsyncCopyItemTask
 from onedrivee.workers.tasks.delete_task import DeleteItemTask
 from onedrivee.workers.tasks.down_task import DownloadFileTask
+from onedrivee.workers.tasks.move_task import MoveItemTask
 from onedrivee.workers.tasks.up_task import UpdateMetadataTask
 from onedrivee.workers.tasks.up_task import UploadFileTask
-from onedrivee.workers.tasks.utils import append_hostname, stat_file
+from onedrivee.workers.tasks.utils import append_hostname
 from onedrivee.workers.tasks.utils import unpack_first_item as _unpack_first_item
 from onedrivee.store.items_db import ItemRecordStatuses
 
 
 
 class MergeDirTask(TaskBase):
-    def __init__(self, parent_task, rel_parent_path, item_name):
+    scheduling_class = 'merge'
+
+    def __init__(self, parent_task, rel_parent_path, item_name, recursive=True):
+        """
+        :param TaskBase parent_task:
+        :param str rel_parent_path:
+        :param str item_name:
+        :param True | False recursive: (Optional) If False, only merge the subdirectories that are new on either side.
+        """
         super().__init__(parent_task)
         self.rel_parent_path = rel_parent_path
         self.item_name = item_name
+        self.recursive = recursive
         self.path_filter = self.drive.config.path_filter
+        self._records_by_name = {}
+        self._local_stats = {}
 
     def handle(self):
         """
@@ -35,6 +50,7 @@ class MergeDirTask(TaskBase):
         try:
             all_local_items = self._list_local_items()
             all_remote_items = self.drive.get_children(item_path=self.remote_path)
+            self._records_by_name = self.items_store.get_items_by_parent(parent_path=self.remote_path)
         except (IOError, OSError) as e:
             self.logger.error('Error occurred when synchronizing "%s":\n%s.', self.local_path, traceback.format_exc())
             return
@@ -47,16 +63,49 @@ class MergeDirTask(TaskBase):
         for local_item_name in all_local_items:
             self._analyze_local_item(local_item_name)
 
+    def _get_records(self, item_name):
+        """
+        :param str item_name: Name of an entry in the directory.
+        :return dict[str, onedrivee.store.items_db.ItemRecord]: Records of the entry, loaded when the merge started,
+        indexed by item ID.
+        """
+        return self._records_by_name.get(item_name, {})
+
+    def _get_local_stat(self, item_name):
+        """
+        :param str item_name: Name of an entry in the directory.
+        :return os.stat_result | None: Status of the entry, taken when the directory was listed, or None if it does
+        not exist.
+        """
+        st = self._local_stats.get(item_name)
+        if st is not None:
+            return st
+        try:
+            return os.stat(self.local_path + '/' + item_name)
+        except (IOError, OSError):
+            return None
+
     def _list_local_items(self):
         """
-        List all names under the task working directory.
+        List all names under the task working directory, and keep the status of each entry so that the analysis
+        stats no entry again.
         :return [str]: A list of entry names.
         """
         ent_list = set()
         ent_count = {}
-        for ent in os.listdir(self.local_path):
+        self._local_stats = {}
+        with os.scandir(self.local_path) as it:
+            dir_entries = list(it)
+        for dir_entry in dir_entries:
+            ent = dir_entry.name
             ent_path = self.local_path + '/' + ent
-            is_dir = os.path.isdir(ent_path)
+            try:
+                # Follow symbolic links, as the rest of the merge does.
+                st = dir_entry.stat()
+            except (IOError, OSError):
+                # Gone already, or a broken link.
+                continue
+            is_dir = stat.S_ISDIR(st.st_mode)
             filename, ext = os.path.splitext(ent)
             if self.path_filter.should_ignore(self.rel_path + '/' + ent, is_dir) or ext == '.!od':
                 continue
@@ -74,6 +123,7 @@ class MergeDirTask(TaskBase):
             else:
                 ent_count[ent_lower] = 0
             ent_list.add(ent)
+            self._local_stats[ent] = st
         return ent_list
 
     def _analyze_remote_item(self, remote_item, all_local_items):
@@ -84,8 +134,9 @@ class MergeDirTask(TaskBase):
         :param [str] all_local_items: All remaining untouched local items.
         """
         item_local_path = self.local_path + '/' + remote_item.name
-        q = self.items_store.get_items_by_id(parent_path=self.remote_path, item_name=remote_item.name)
-        exists = os.path.exists(item_local_path)
+        q = self._get_records(remote_item.name)
+        st = self._get_local_stat(remote_item.name)
+        exists = st is not None
         has_record = len(q) > 0
         if has_record:
           item_id, item_record = _unpack_first_item(q)
@@ -96,7 +147,10 @@ class MergeDirTask(TaskBase):
         elif has_record and not exists:
             # There is record but the file is gone.
             item_id, item_record = _unpack_first_item(q)
-            if item_id == remote_item.id and remote_item.c_tag == item_record.c_tag \
+            if item_record.status == ItemRecordStatuses.MOVING:
+                # The file was found elsewhere locally, and a task moves the remote item there.
+                self.logger.debug('File "%s" is being moved on server. Skip.', item_local_path)
+            elif item_id == remote_item.id and remote_item.c_tag == item_record.c_tag \
                     and remote_item.e_tag == item_record.e_tag:
                 # Same record. The file is probably deleted when daemon is off.
                 self._create_delete_item_task(item_local_path, remote_item)
@@ -107,7 +161,7 @@ class MergeDirTask(TaskBase):
         else:
             # The entry exists locally.
             # First solve possible type conflict.
-            is_dir = os.path.isdir(item_local_path)
+            is_dir = stat.S_ISDIR(st.st_mode)
             if is_dir != remote_item.is_folder:
                 self.logger.info('Type conflict on path "%s". One side is file and the other is dir.', item_local_path)
                 self._move_existing_and_download(item_local_path, remote_item, all_local_items, q)
@@ -118,9 +172,10 @@ class MergeDirTask(TaskBase):
                     self.items_store.update_item(remote_item, ItemRecordStatuses.OK, self.local_path)
                 else:
                     self.logger.debug('Directory "%s" has intact record.', item_local_path)
-                # add a MergeDirTask for the dir item
-                self.logger.info('Add a MergeDirTask for directory "%s"', item_local_path)
-                self._create_merge_dir_task(remote_item.name, remote_item)
+                if self.recursive or not has_record:
+                    # add a MergeDirTask for the dir item
+                    self.logger.info('Add a MergeDirTask for directory "%s"', item_local_path)
+                    self._create_merge_dir_task(remote_item.name, remote_item)
             else:
                 # Both sides are files. Examine file attributes.
                 need_update = not has_record
@@ -131,8 +186,8 @@ class MergeDirTask(TaskBase):
                     self.logger.info('Fix database record for file "%s".',
                                      item_local_path)
                     self.items_store.update_item(remote_item, ItemRecordStatuses.OK, self.local_path)
-                file_size, file_mtime = stat_file(item_local_path)
-                if self._have_equal_hash(item_local_path, remote_item):
+                file_mtime = st.st_mtime
+                if self._have_equal_hash(item_local_path, remote_item, st):
                     # Same file name. Same size. Same mtime. Guess they are the same for laziness.
                     self.logger.info('File "%s" seems fine.', item_local_path)
                 else:
@@ -163,6 +218,7 @@ class MergeDirTask(TaskBase):
         try:
             resolved_name = append_hostname(item_local_path)
             all_local_items.add(resolved_name)
+            self._local_stats.pop(remote_item.name, None)
             if len(q) > 0:
                 self.items_store.delete_item(parent_path=self.remote_path, item_name=remote_item.name)
             self._create_download_task(item_local_path, remote_item)
@@ -212,9 +268,10 @@ class MergeDirTask(TaskBase):
         Analyze what to do with a local item that isn't found remotely. Assume that the item passes ignore list.
         :param str local_item_name: Name of the local item.
         """
-        q = self.items_store.get_items_by_id(item_name=local_item_name, parent_path=self.remote_path)
+        q = self._get_records(local_item_name)
         p = self.local_path + '/' + local_item_name
-        is_dir = os.path.isdir(p)
+        st = self._get_local_stat(local_item_name)
+        is_dir = st is not None and stat.S_ISDIR(st.st_mode)
         if len(q) > 0:
             # The item was on the server before, but now seems gone.
             item_id, item = _unpack_first_item(q)
@@ -229,10 +286,53 @@ class MergeDirTask(TaskBase):
                 self.logger.info('The entry has been removed in remote. Delete the local one "%s".', p)
                 self._send_path_to_trash(local_item_name, p)
         else:
-            # The item has no record before. Probably new so upload it.
-            # TODO: This can be made a little smarter by examining hash.
-            self.logger.info('The item %s has no database record. Upload local entry "%s".', local_item_name, p)
-            self._create_upload_task(local_item_name, is_dir)
+            # The item has no record before. Probably new so upload it, unless it is a copy of a remote file.
+            if is_dir or not self._create_copy_or_move_task(local_item_name, p, st):
+                self.logger.info('The item %s has no database record. Upload local entry "%s".', local_item_name, p)
+                self._create_upload_task(local_item_name, is_dir)
+
+    def _create_copy_or_move_task(self, local_item_name, local_path, st=None):
+        """
+        If a new local file has the size and SHA-1 hash of a known remote file, let the server copy that file, or move
+        it if it is gone from its local path, rather than upload the same bytes again. Files small enough for a single
+        upload request are not worth hashing for this.
+        :param str local_item_name: Name of the local file.
+        :param str local_path: Path to the local file.
+        :param os.stat_result | None st: (Optional) Status of the local file, if known.
+        :return True | False: True if a task was created in place of the upload, or if there is nothing to upload.
+        """
+        try:
+            if st is None:
+                st = os.stat(local_path)
+            if st.st_size <= self.drive.put_fragment_size.min_size:
+                return False
+            sha1_hash = self.items_store.get_local_sha1_hash(local_path, st)
+        except FileNotFoundError:
+            self.logger.debug('New file "%s" is gone before it was hashed.', local_path)
+            return True
+        except (IOError, OSError) as e:
+            self.logger.error('IO error when hashing new file "%s":\n%s.', local_path, traceback.format_exc())
+            return False
+        if sha1_hash is None:
+            return False
+        source = None
+        for record in self.items_store.get_items_by_hash(sha1_hash=sha1_hash).values():
+            source_path = self.drive.config.local_root + record.local_path
+            if record.size != st.st_size or source_path == local_path or self.task_pool.has_pending_task(source_path):
+                continue
+            if not os.path.exists(source_path):
+                self.logger.info('File "%s" was moved from "%s". Move the remote item.', local_path, source_path)
+                self.items_store.update_status(ItemRecordStatuses.MOVING, item_id=record.item_id)
+                self.task_pool.add_task(MoveItemTask.from_old_rel_path(self, self.rel_path + '/', local_item_name,
+                                                                       record.local_path))
+                return True
+            if source is None:
+                source = record
+        if source is None:
+            return False
+        self.logger.info('File "%s" is a copy of "%s". Copy the remote item.', local_path, source.local_path)
+        self.task_pool.add_task(AsyncCopyItemTask(self, self.rel_path + '/', local_item_name, source))
+        return True
 
     def _send_path_to_trash(self, local_item_name, local_path):
         try:
@@ -257,9 +357,11 @@ class MergeDirTask(TaskBase):
 
     def _create_remote_dir(self, name):
         try:
-            # FIXME: if self is root, self.item_obj is None:
             if self.item_obj is not None:
                 new_item = self.drive.create_dir(name=name, parent_id=self.item_obj.id)
+            elif self.item_name != '':
+                # The task was not created by the merge of the parent directory, e.g., by the file system monitor.
+                new_item = self.drive.create_dir(name=name, parent_path=self.remote_path)
             else:
                 new_item = self.drive.create_dir(name=name)
             self.items_store.update_item(new_item, ItemRecordStatuses.OK, self.local_path)
@@ -268,13 +370,19 @@ class MergeDirTask(TaskBase):
         except errors.OneDriveError as e:
             self.logger.error('An API error occurred creating remote dir "%s/%s":\n%s.', self.rel_path, name, traceback.format_exc())
 
-    def _have_equal_hash(self, item_local_path, item):
+    def _have_equal_hash(self, item_local_path, item, st=None):
         """
+        Compare the content of a local file and a remote file using the cheapest evidence available. Only if the
+        server provides no usable hash, and no hash was computed for the current cTag before, download the remote file.
         :param str item_local_path:
         :param onedrivee.api.items.OneDriveItem item:
+        :param os.stat_result | None st: (Optional) Status of the local file, if known.
         :return True | False:
         """
-        # TODO: use db to cache recent remote and local hash
+        local_size = st.st_size if st is not None else os.path.getsize(item_local_path)
+        if local_size != item.size:
+            self.logger.debug('File %s: remote size: %d, local size: %d', item_local_path, item.size, local_size)
+            return False
         if item.file_props is not None and item.file_props.hashes is not None:
             # itme_sha may be None here.
             item_sha1 = item.file_props.hashes.sha1
@@ -282,34 +390,38 @@ class MergeDirTask(TaskBase):
         else:
             item_sha1 = None
             item_crc32 = None
+        if item_sha1 is None and item_crc32 is not None:
+            local_crc32 = self.items_store.get_local_crc32_hash(item_local_path, st)
+            self.logger.debug('File %s: remote crc32: %s, local crc32: %s', item_local_path, item_crc32, local_crc32)
+            if hasher.crc32_matches(local_crc32, item_crc32):
+                return True
+            # The CRC32 encoding of the server is not guaranteed. Do not trust a mismatch.
+        if item_sha1 is None:
+            item_sha1 = self.items_store.get_remote_sha1_hash(item.id, item.c_tag)
         if item_sha1 is None:
             item_sha1 = self._computing_remote_hash_locally(item)
-        local_sha1 = hasher.hash_value(item_local_path)
+            if item_sha1 is not None:
+                self.items_store.set_remote_sha1_hash(item.id, item.c_tag, item_sha1)
+        local_sha1 = self.items_store.get_local_sha1_hash(item_local_path, st)
 
         self.logger.debug('File %s: remote: %s,%d, local: %s,%d', item_local_path, item_sha1, item.size, local_sha1,
-            os.path.getsize(item_local_path))
-
-        if item_crc32 is not None:
-            self.logger.debug('Crc32 of file %s: remote:%s, local:%s', item_local_path, item_crc32,
-                hasher.crc32_value(item_local_path))
+                          local_size)
         return  item_sha1 == local_sha1
 
     def _computing_remote_hash_locally(self, item):
         """
-        we download it as a temp file and compute its hash
-        then upload the hash value
+        Stream the remote file through a hash object without storing it.
         :param onedrivee.api.items.OneDriveItem item:
         :return remote file's hash value
         """
-        local_item_tmp_path = self.local_parent_path + '.' + item.name + '.!od.hash'
         try:
             self.logger.debug('Compite hash value of remote file "%s" locally.', item.name)
-            with open(local_item_tmp_path, 'wb') as f:
-                self.drive.download_file(file=f, size=item.size, item_id=item.id)
-                item_sha1 =  hasher.hash_value(local_item_tmp_path)
-                os.remove(local_item_tmp_path)
-                return item_sha1
+            sha1 = hashlib.sha1()
+            self.drive.download_file(file=None, size=item.size, item_id=item.id, hashers=[sha1])
+            return sha1.hexdigest().upper()
         except (IOError, OSError) as e:
-            self.logger.error('An IO error occurred when updating remote item hash "%s":\n%s.', local_item_tmp_path, traceback.format_exc())
+            self.logger.error('An IO error occurred when computing remote item hash "%s":\n%s.',
+                              self.local_path + '/' + item.name, traceback.format_exc())
         except errors.OneDriveError as e:
-            self.logger.error('An API error occurred when updating remote item hash "%s":\n%s.', local_item_tmp_path, traceback.format_exc())
+            self.logger.error('An API error occurred when computing remote item hash "%s":\n%s.',
+                              self.local_path + '/' + item.name, traceback.format_exc())
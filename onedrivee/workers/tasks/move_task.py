@@ -1,11 +1,14 @@
+import os
 import traceback
 
 from onedrivee.drives import errors
 from onedrivee.drives import resources
-from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.workers.tasks.task_base import TaskBase, journaled
+from onedrivee.workers.tasks.up_task import UploadFileTask
 from onedrivee.store.items_db import ItemRecordStatuses
 
 
+@journaled
 class MoveItemTask(TaskBase):
     def __init__(self, parent_task, rel_parent_path, item_name, move_from_task):
         """
@@ -19,11 +22,73 @@ class MoveItemTask(TaskBase):
         self.item_name = item_name
         self._old_remote_item_path = move_from_task.remote_path
 
+    @classmethod
+    def from_old_rel_path(cls, parent_task, rel_parent_path, item_name, old_rel_path):
+        """
+        :param TaskBase parent_task:
+        :param str rel_parent_path:
+        :param str item_name:
+        :param str old_rel_path: Path, relative to the repository root, the item is moved from.
+        :rtype: MoveItemTask
+        """
+        old_rel_parent_path, old_item_name = old_rel_path.rsplit('/', 1)
+        move_from_task = TaskBase(parent_task)
+        move_from_task.rel_parent_path = old_rel_parent_path + '/'
+        move_from_task.item_name = old_item_name
+        return cls(parent_task, rel_parent_path, item_name, move_from_task)
+
+    @property
+    def old_rel_path(self):
+        return self._old_remote_item_path.split(':', 1)[1]
+
+    @property
+    def old_local_path(self):
+        return self.drive.config.local_root + self.old_rel_path
+
+    def dump(self):
+        return {'rel_parent_path': self.rel_parent_path, 'item_name': self.item_name, 'old_rel_path': self.old_rel_path}
+
+    @classmethod
+    def load(cls, parent_task, data):
+        return cls.from_old_rel_path(parent_task, data['rel_parent_path'], data['item_name'], data['old_rel_path'])
+
     def handle(self):
         try:
             new_parent_reference = resources.ItemReference.build(path=self.remote_parent_path)
             item = self.drive.update_item(item_path=self._old_remote_item_path, new_name=self.item_name,
                                           new_parent_reference=new_parent_reference)
             self.items_store.update_item(item, ItemRecordStatuses.OK)
+            if item.is_folder:
+                self.items_store.move_children(self._old_remote_item_path, self.remote_path)
         except errors.OneDriveError as e:
             self.logger.error('API error moving "%s" to "%s":\n%s.', self._old_remote_item_path, self.remote_path, traceback.format_exc())
+            self._clear_moving_status()
+            self._create_upload_task()
+
+    def on_dropped(self):
+        self._clear_moving_status()
+
+    def _clear_moving_status(self):
+        """
+        Let merges of the old parent directory handle the item again, now that it will not be moved.
+        """
+        old_local_parent_path, old_item_name = self.old_local_path.rsplit('/', 1)
+        q = self.items_store.get_items_by_id(local_parent_path=old_local_parent_path, item_name=old_item_name)
+        for item_id, record in q.items():
+            if record.status == ItemRecordStatuses.MOVING:
+                self.items_store.update_status(ItemRecordStatuses.OK, item_id=item_id)
+
+    def _create_upload_task(self):
+        """
+        Upload the entry at the new path, since the remote item could not be moved there.
+        """
+        if os.path.isdir(self.local_path):
+            # MergeDirTask creates move tasks, so import it only here.
+            from onedrivee.workers.tasks.merge_task import MergeDirTask
+            task = MergeDirTask(self, self.rel_parent_path, self.item_name)
+        elif os.path.isfile(self.local_path):
+            task = UploadFileTask(self, self.rel_parent_path, self.item_name)
+        else:
+            return
+        self.logger.info('Upload "%s" instead.', self.local_path)
+        self.task_pool.add_task(task)
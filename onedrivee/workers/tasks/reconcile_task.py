@@ -0,0 +1,63 @@
+from onedrivee.common import local_snapshot
+from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.workers.tasks.merge_task import MergeDirTask
+from onedrivee.workers.tasks.move_task import MoveItemTask
+from onedrivee.store.items_db import ItemRecordStatuses
+
+
+class LocalReconcileTask(TaskBase):
+    """
+    Find the local changes made while the program was not running by comparing the local tree with the snapshot saved
+    when it stopped. Moved entries are moved on the server, and only the directories whose content changed otherwise
+    are merged. Remote changes are left to DeltaSyncTask.
+    """
+
+    scheduling_class = 'merge'
+
+    def __init__(self, parent_task, snapshot):
+        """
+        :param TaskBase parent_task: Base task.
+        :param dict[str, onedrivee.common.local_snapshot.SnapshotEntry] snapshot: Snapshot of the local tree saved
+        when the program stopped.
+        """
+        super().__init__(parent_task)
+        self.rel_parent_path = ''
+        self.item_name = ''
+        self._snapshot = snapshot
+
+    @property
+    def local_path(self):
+        # The task covers the whole drive, as DeltaSyncTask does. Key it in the task pool by a path no entry can have,
+        # so that the delta sync of the drive can be queued at the same time.
+        return self.drive.config.local_root + '/\0reconcile'
+
+    def handle(self):
+        local_root = self.drive.config.local_root
+        current = local_snapshot.scan(local_root, self.drive.config.path_filter)
+        moves, dirty_dirs = local_snapshot.diff(self._snapshot, current)
+        self.logger.info('Found %d moved entries and %d changed directories under "%s" since last run.',
+                         len(moves), len(dirty_dirs), local_root)
+        for old_rel_path, new_rel_path in moves:
+            self._create_move_task(old_rel_path, new_rel_path)
+        for rel_dir_path in sorted(dirty_dirs):
+            self._create_merge_dir_task(rel_dir_path)
+
+    def _create_move_task(self, old_rel_path, new_rel_path):
+        old_rel_parent_path, old_item_name = old_rel_path.rsplit('/', 1)
+        rel_parent_path, item_name = new_rel_path.rsplit('/', 1)
+        # Keep the merge of the old parent directory, if any, from deleting the item before it is moved.
+        self.items_store.update_status(ItemRecordStatuses.MOVING,
+                                       local_parent_path=self.drive.config.local_root + old_rel_parent_path,
+                                       item_name=old_item_name)
+        task = MoveItemTask.from_old_rel_path(self, rel_parent_path + '/', item_name, old_rel_path)
+        self.logger.info('Will move remote item of "%s" to "%s".', task.old_local_path, task.local_path)
+        self.task_pool.add_task(task)
+
+    def _create_merge_dir_task(self, rel_dir_path):
+        if rel_dir_path == '':
+            task = MergeDirTask(self, '', '', recursive=False)
+        else:
+            rel_parent_path, dir_name = rel_dir_path.rsplit('/', 1)
+            task = MergeDirTask(self, rel_parent_path + '/', dir_name, recursive=False)
+        if not self.task_pool.has_pending_task(task.local_path):
+            self.task_pool.add_task(task)
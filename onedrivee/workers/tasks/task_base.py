@@ -1,8 +1,30 @@
 from onedrivee.common import logger_factory
 
+# Task types whose queued tasks are recorded in the task journal, by type name. See onedrivee.store.task_db.
+JOURNALED_TASK_TYPES = {}
+
+
+def journaled(task_type):
+    """
+    Class decorator to record queued tasks of the type in the task journal. The type must implement dump() and load().
+    :param type task_type:
+    """
+    JOURNALED_TASK_TYPES[task_type.__name__] = task_type
+    return task_type
+
+
+def is_journaled(task):
+    """
+    :param TaskBase task:
+    :rtype: True | False
+    """
+    return JOURNALED_TASK_TYPES.get(type(task).__name__) is type(task)
+
 
 class TaskBase:
     logger = logger_factory.get_logger('Tasks')
+    # Name of the scheduler queue for tasks of this type. See onedrivee.workers.scheduler.
+    scheduling_class = 'change'
 
     def __init__(self, parent_task=None):
         """
@@ -11,6 +33,8 @@ class TaskBase:
         """
         self._hold = False
         self._item = None
+        # Id of the task in the task journal, or None if it is not recorded.
+        self.journal_id = None
         if parent_task is not None:
             self.drive = parent_task.drive
             self.items_store = parent_task.items_store
@@ -129,7 +153,36 @@ class TaskBase:
         """
         self._hold = v
 
+    @property
+    def size_hint(self):
+        """
+        Number of bytes the task is expected to transfer, used to schedule it.
+        :rtype: int
+        """
+        return 0
+
+    def dump(self):
+        """
+        :return dict: Arguments to rebuild the task by load(). Only journaled task types implement it.
+        """
+        raise NotImplementedError('Subclass should override this stub.')
+
+    @classmethod
+    def load(cls, parent_task, data):
+        """
+        :param TaskBase parent_task: Base task.
+        :param dict data: Return value of dump().
+        :rtype: TaskBase
+        """
+        raise NotImplementedError('Subclass should override this stub.')
+
     def handle(self):
         raise NotImplementedError('Subclass should override this stub.')
 
+    def on_dropped(self):
+        """
+        Called when the task is taken out of the task pool without being handled, e.g., when merged into another task.
+        """
+        pass
+
 
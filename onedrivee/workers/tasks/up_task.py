@@ -4,8 +4,8 @@ import traceback
 from onedrivee.drives import errors
 from onedrivee.drives import facets
 from onedrivee.drives.options import NameConflictBehavior
-from onedrivee.common.dateparser import timestamp_to_datetime
-from onedrivee.workers.tasks.task_base import TaskBase
+from onedrivee.common.dateparser import datetime_to_timestamp, timestamp_to_datetime
+from onedrivee.workers.tasks.task_base import TaskBase, journaled
 from onedrivee.store.items_db import ItemRecordStatuses
 
 
@@ -38,18 +38,47 @@ class CreateDirTask(UpTaskBase):
             self.should_sync_parent = True
 
 
+@journaled
 class UploadFileTask(UpTaskBase):
+    scheduling_class = 'transfer'
+
     def __init__(self, parent_task, rel_parent_path, item_name, conflict_behavior=NameConflictBehavior.REPLACE):
         super().__init__(parent_task, rel_parent_path, item_name, conflict_behavior)
         self.should_hold = True
+        self._size_hint = None
+
+    def dump(self):
+        return {'rel_parent_path': self.rel_parent_path, 'item_name': self.item_name,
+                'conflict_behavior': self._conflict_behavior}
+
+    @classmethod
+    def load(cls, parent_task, data):
+        return cls(parent_task, data['rel_parent_path'], data['item_name'], data['conflict_behavior'])
+
+    @property
+    def size_hint(self):
+        if self._size_hint is None:
+            try:
+                self._size_hint = os.path.getsize(self.local_path)
+            except OSError:
+                self._size_hint = 0
+        return self._size_hint
 
     def handle(self):
         try:
             size = os.path.getsize(self.local_path)
+            upload_url = None
+            progress = None
+            if size > self.drive.put_fragment_size.min_size:
+                # The file is uploaded by fragments. Save the session so that the upload can be resumed.
+                upload_url, progress = self._prepare_upload_session(size)
             with open(self.local_path, 'rb') as f:
                 item = self.drive.upload_file(
                         filename=self.item_name, data=f, size=size, parent_path=self.remote_parent_path,
-                        conflict_behavior=self._conflict_behavior)
+                        conflict_behavior=self._conflict_behavior, upload_url=upload_url, progress=progress)
+                if progress is not None:
+                    self.items_store.delete_upload_session(self.local_path)
+                    self.items_store.save_fragment_sizes()
                 modified_time = timestamp_to_datetime(os.path.getmtime(self.local_path))
                 fs_info = facets.FileSystemInfoFacet(modified_time=modified_time)
                 item = self.drive.update_item(item_id=item.id, new_file_system_info=fs_info)
@@ -61,7 +90,23 @@ class UploadFileTask(UpTaskBase):
             self.logger.error('API error when uploading "%s":\n%s.', self.local_path, traceback.format_exc())
         self.task_pool.clear_hold(self)
 
+    def _prepare_upload_session(self, size):
+        """
+        Look for a saved upload session of the file so that a large upload interrupted before can be resumed.
+        :param int size: Size of the file.
+        :return (str | None, (onedrivee.drives.resources.UploadSession) -> None): URL of the session to resume, if any,
+        and the callback to save the session as the upload progresses.
+        """
+        mtime = os.path.getmtime(self.local_path)
+        upload_url = None
+        saved_session = self.items_store.get_upload_session(self.local_path, size, mtime)
+        if saved_session is not None:
+            upload_url, next_ranges = saved_session
+            self.logger.info('Resume uploading "%s" from ranges %s.', self.local_path, next_ranges)
+        return upload_url, lambda session: self.items_store.set_upload_session(self.local_path, session, size, mtime)
 
+
+@journaled
 class UpdateMetadataTask(UpTaskBase):
     def __init__(self, parent_task, rel_parent_path, item_name, new_mtime):
         super().__init__(parent_task, rel_parent_path, item_name, None)
@@ -69,6 +114,14 @@ class UpdateMetadataTask(UpTaskBase):
             new_mtime = timestamp_to_datetime(new_mtime)
         self._new_mtime = new_mtime
 
+    def dump(self):
+        return {'rel_parent_path': self.rel_parent_path, 'item_name': self.item_name,
+                'new_mtime': datetime_to_timestamp(self._new_mtime)}
+
+    @classmethod
+    def load(cls, parent_task, data):
+        return cls(parent_task, data['rel_parent_path'], data['item_name'], timestamp_to_datetime(data['new_mtime']))
+
     def handle(self):
         try:
             fs_info = facets.FileSystemInfoFacet(modified_time=self._new_mtime)
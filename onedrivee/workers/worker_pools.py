@@ -0,0 +1,171 @@
+"""
+Pools of TaskConsumer threads per scheduling queue, e.g., one for quick changes, one for transfers and one for directory
+merges. A backlog in one queue then cannot occupy the workers of the others, and each pool is sized to its own load.
+Fairness among drives is left to the task pool, which serves the drives in turn within every queue.
+"""
+
+import math
+import threading
+import time
+
+from onedrivee.common import logger_factory
+from onedrivee.workers import task_worker
+
+
+class PoolWorker(task_worker.TaskConsumer):
+    """
+    A consumer that only takes tasks of one queue, and leaves when it has been idle for long.
+    """
+
+    def __init__(self, manager, queue_name):
+        """
+        :param WorkerPoolManager manager:
+        :param str queue_name: Name of the queue to take tasks from.
+        """
+        super().__init__(manager.task_pool)
+        self.manager = manager
+        self.queue_name = queue_name
+
+    def run(self):
+        self.logger.debug('Started.')
+        while not self.terminate_sign.is_set() and not self.manager.stopping.is_set():
+            task = self.task_pool.pop_task_of_queue(self.queue_name, timeout=self.manager.IDLE_SECONDS,
+                                                    cancel=self.manager.stopping)
+            if task is None:
+                if self.manager.retire(self):
+                    break
+                continue
+            start_time = time.time()
+            self._handle_task(task)
+            self.manager.record_latency(self.queue_name, time.time() - start_time)
+        self.logger.debug('Stopped.')
+
+
+class WorkerPoolManager(threading.Thread):
+    """
+    Every SCALE_INTERVAL_SECONDS, grow each pool toward the number of workers that drain its queue within
+    TARGET_DRAIN_SECONDS at the observed task latency. Workers idle for IDLE_SECONDS leave, down to the lower bound of
+    the pool.
+    """
+
+    logger = logger_factory.get_logger('WorkerPoolManager')
+    SCALE_INTERVAL_SECONDS = 5
+    TARGET_DRAIN_SECONDS = 60
+    IDLE_SECONDS = 60
+    # Weight of the latest sample in the moving average of task latency.
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, task_pool, bounds, default_bounds):
+        """
+        :param onedrivee.workers.task_pool.TaskPool task_pool:
+        :param dict[str, (int, int)] bounds: Minimum and maximum number of workers by queue name.
+        :param (int, int) default_bounds: Bounds for queues not in bounds.
+        """
+        super().__init__()
+        self.daemon = True
+        self.task_pool = task_pool
+        self.bounds = bounds
+        self.default_bounds = default_bounds
+        self._workers = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+        # Set by stop(). Workers leave once they finish the task at hand.
+        self.stopping = threading.Event()
+
+    def get_bounds(self, queue_name):
+        """
+        :param str queue_name:
+        :rtype: (int, int)
+        """
+        min_workers, max_workers = self.bounds.get(queue_name, self.default_bounds)
+        return max(min_workers, 0), max(min_workers, max_workers, 1)
+
+    def num_workers(self, queue_name):
+        """
+        :param str queue_name:
+        :rtype: int
+        """
+        with self._lock:
+            return len(self._workers.get(queue_name, ()))
+
+    def record_latency(self, queue_name, seconds):
+        """
+        :param str queue_name:
+        :param float seconds: Time a task of the queue took to handle.
+        """
+        with self._lock:
+            latency = self._latencies.get(queue_name)
+            if latency is None:
+                self._latencies[queue_name] = seconds
+            else:
+                self._latencies[queue_name] = latency + (seconds - latency) * self.LATENCY_SMOOTHING
+
+    def desired_workers(self, queue_name):
+        """
+        :param str queue_name:
+        :return int: Number of workers the pool of the queue should have, within its bounds.
+        """
+        min_workers, max_workers = self.get_bounds(queue_name)
+        depth = self.task_pool.num_queued_tasks(queue_name)
+        with self._lock:
+            latency = self._latencies.get(queue_name)
+        if latency is None:
+            # Nothing is known about the tasks yet. Give each queued task a worker.
+            wanted = depth
+        else:
+            wanted = math.ceil(depth * latency / self.TARGET_DRAIN_SECONDS)
+        return min(max(wanted, min_workers), max_workers)
+
+    def scale(self):
+        """
+        Start workers for pools below the number desired. Pools shrink by idle workers retiring instead.
+        """
+        for queue_name in self.task_pool.queue_names():
+            wanted = self.desired_workers(queue_name)
+            with self._lock:
+                workers = self._workers.setdefault(queue_name, [])
+                workers[:] = [w for w in workers if w.is_alive()]
+                while len(workers) < wanted:
+                    w = PoolWorker(self, queue_name)
+                    w.name = '%s-%d' % (queue_name, len(workers))
+                    workers.append(w)
+                    w.start()
+                    self.logger.debug('Started worker "%s".', w.name)
+
+    def retire(self, worker):
+        """
+        Called by an idle worker. Let it leave if the pool is above its lower bound, or if the manager is stopping.
+        :param PoolWorker worker:
+        :return True | False: True if the worker should stop.
+        """
+        min_workers, max_workers = self.get_bounds(worker.queue_name)
+        with self._lock:
+            workers = self._workers.get(worker.queue_name, [])
+            if self.stopping.is_set():
+                if worker in workers:
+                    workers.remove(worker)
+                return True
+            if len(workers) <= min_workers or worker not in workers:
+                return False
+            workers.remove(worker)
+        self.logger.debug('Retired idle worker "%s".', worker.name)
+        return True
+
+    def run(self):
+        self.logger.debug('Started.')
+        while not task_worker.TaskConsumer.terminate_sign.is_set() and not self.stopping.is_set():
+            self.scale()
+            self.stopping.wait(self.SCALE_INTERVAL_SECONDS)
+        self.logger.debug('Stopped.')
+
+    def stop(self):
+        """
+        Stop scaling and wait for the workers of all pools to leave. Workers handling a task finish it first.
+        """
+        self.stopping.set()
+        with self._lock:
+            workers = [w for pool in self._workers.values() for w in pool]
+        self.task_pool.wake_queue_consumers()
+        for w in workers:
+            w.join()
+        self.logger.debug('Stopped %d workers.', len(workers))
@@ -1,8 +1,11 @@
+import hashlib
 import io
+import tempfile
 import unittest
 
 import requests_mock
 from requests import codes
+from urllib3.exceptions import ProtocolError
 
 from onedrivee.api import drives
 from onedrivee.api import facets
@@ -72,7 +75,20 @@ class TestDriveObject(unittest.TestCase):
                                  self.drive.get_item_uri(None, 'foo/bar') + '/view.search?q=try&select=name,size',
                                  {'item_path': 'foo/bar', 'keyword': 'try', 'select': ['name', 'size']})
 
-    def assert_create_dir(self, should_request_url, parent_id=None):
+    def test_get_changes(self):
+        self.use_item_collection('get_changes', self.drive.get_item_uri(None, None) + '/view.delta?token=abc',
+                                 {'token': 'abc'})
+
+    def test_get_changes_token(self):
+        with requests_mock.Mocker() as mock:
+            mock.get(self.drive.get_item_uri(None, None) + '/view.delta?token=latest',
+                     json={'value': [], '@odata.deltaLink': 'https://foo/view.delta?token=def'})
+            changes = self.drive.get_changes(token='latest')
+            self.assertListEqual([], changes.get_next())
+            self.assertFalse(changes.has_next)
+            self.assertEqual('def', changes.token)
+
+    def assert_create_dir(self, should_request_url, parent_id=None, parent_path=None):
         """
         https://github.com/OneDrive/onedrive-api-docs/blob/master/items/create.md
         """
@@ -88,7 +104,8 @@ class TestDriveObject(unittest.TestCase):
                 return get_data('new_dir_item.json')
 
             mock.post(should_request_url, json=callback)
-            item = self.drive.create_dir(name=folder_name, parent_id=parent_id, conflict_behavior=conflict_behavior)
+            item = self.drive.create_dir(name=folder_name, parent_id=parent_id, conflict_behavior=conflict_behavior,
+                                         parent_path=parent_path)
             self.assertIsInstance(item, items.OneDriveItem)
 
     def test_create_dir_in_root(self):
@@ -98,6 +115,10 @@ class TestDriveObject(unittest.TestCase):
         self.assert_create_dir(self.drive.drive_uri + self.drive.drive_path + '/items/parent_id/children',
                                parent_id='parent_id')
 
+    def test_create_subdir_by_path(self):
+        self.assert_create_dir(self.drive.drive_uri + self.drive.drive_path + '/root:/foo:/children',
+                               parent_path=self.drive.drive_path + '/root:/foo')
+
     def assert_delete_item(self, url_part, **kwargs):
         with requests_mock.Mocker() as mock:
             mock.delete(self.drive.drive_uri + self.drive.drive_path + url_part, status_code=codes.no_content)
@@ -159,6 +180,19 @@ class TestDriveObject(unittest.TestCase):
             self.drive.download_file(file=output, size=len(data), item_id='123')
             self.assertEqual(data, output.getvalue())
 
+    def test_download_connection_lost(self):
+        """ A connection lost in the middle of the body is reported as an IOError. """
+        self.drive.config = drive_config.DriveConfig({'max_get_size_bytes': 10})
+
+        class BrokenBody(io.BytesIO):
+            def read(self, *args, **kwargs):
+                raise ProtocolError('Connection broken.')
+
+        with requests_mock.Mocker() as mock:
+            mock.get(self.drive.get_item_uri(item_id='123', item_path=None) + '/content', body=BrokenBody(),
+                     status_code=codes.ok)
+            self.assertRaises(IOError, self.drive.download_file, file=io.BytesIO(), size=5, item_id='123')
+
     def test_download_large_file(self):
         self.drive.config = drive_config.DriveConfig({'max_get_size_bytes': 2})
         in_data = b'12345'
@@ -177,6 +211,43 @@ class TestDriveObject(unittest.TestCase):
             self.drive.download_file(file=output, size=len(in_data), item_id='123')
         self.assertEqual(in_data, output.getvalue())
 
+    def test_download_large_file_resume(self):
+        self.drive.config = drive_config.DriveConfig({'max_get_size_bytes': 2})
+        in_data = b'12345'
+        output = io.BytesIO()
+        output.write(in_data[:2])
+        expected_ranges = ['2-3', '4-4']
+        progress = []
+        with requests_mock.Mocker() as mock:
+            def callback(request, context):
+                self.assertEqual('bytes=' + expected_ranges.pop(0), request.headers['Range'])
+                f, t = request.headers['Range'].split('=', 1)[1].split('-')
+                context.status_code = codes.partial
+                return in_data[int(f): int(t) + 1]
+
+            mock.get(self.drive.get_item_uri(item_id='123', item_path=None) + '/content', content=callback)
+            self.drive.download_file(file=output, size=len(in_data), item_id='123', offset=2,
+                                     progress=progress.append)
+        self.assertEqual(in_data, output.getvalue())
+        self.assertEqual([4, 5], progress)
+
+    def test_download_large_file_concurrently(self):
+        self.drive.config = drive_config.DriveConfig({'max_get_size_bytes': 2, 'download_concurrency': 3})
+        in_data = b'12345'
+        sha1 = hashlib.sha1()
+        with requests_mock.Mocker() as mock, tempfile.TemporaryFile() as output:
+            def callback(request, context):
+                f, t = request.headers['Range'].split('=', 1)[1].split('-')
+                context.status_code = codes.partial
+                return in_data[int(f): int(t) + 1]
+
+            mock.get(self.drive.get_item_uri(item_id='123', item_path=None) + '/content', content=callback)
+            self.drive.download_file(file=output, size=len(in_data), item_id='123', hashers=[sha1])
+            self.assertEqual(3, mock.call_count)
+            output.seek(0)
+            self.assertEqual(in_data, output.read())
+        self.assertEqual(hashlib.sha1(in_data).hexdigest(), sha1.hexdigest())
+
     def test_upload_small_file(self):
         self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 10})
         in_fd = io.BytesIO(b'12345')
@@ -229,6 +300,27 @@ class TestDriveObject(unittest.TestCase):
                                    conflict_behavior=options.NameConflictBehavior.RENAME)
             self.assertEqual(input.getvalue(), output.getvalue())
 
+    def test_upload_large_file_resume(self):
+        self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 2})
+        session_url = 'https://foo/bar/accept_data'
+        input = io.BytesIO(b'12345')
+        output = io.BytesIO()
+        expected_ranges = ['bytes 2-3/5', 'bytes 4-4/5']
+        sessions = []
+        with requests_mock.Mocker() as mock:
+            def accept_data(request, context):
+                self.assertEqual(expected_ranges.pop(0), request.headers['Content-Range'])
+                output.write(request.body)
+                context.status_code = codes.accepted
+                return {'nextExpectedRanges': ['4-']}
+
+            mock.get(session_url, json={'expirationDateTime': '2020-01-01T00:00:00.0Z', 'nextExpectedRanges': ['2-']})
+            mock.put(session_url, json=accept_data)
+            self.drive.upload_file('test', data=input, size=5, parent_id='123', upload_url=session_url,
+                                   progress=lambda s: sessions.append(s.next_ranges))
+            self.assertEqual(b'345', output.getvalue())
+        self.assertEqual([[(2, None)], [(4, None)], [(4, None)]], sessions)
+
     def test_copy_item(self):
         new_parent = resources.ItemReference.build(id='123abc', path='/foo/bar')
         new_name = '456.doc'
@@ -0,0 +1,55 @@
+import unittest
+
+from onedrivee.api import fragments
+
+
+class TestFragmentSizeController(unittest.TestCase):
+    def setUp(self):
+        self.bounds = (100, 1000)
+        self.controller = fragments.FragmentSizeController(lambda: self.bounds)
+
+    def test_initial_size(self):
+        self.assertEqual(100, self.controller.size)
+        self.bounds = (100, 50)
+        self.assertEqual(50, self.controller.size)
+
+    def test_grow(self):
+        for i in range(self.controller.GROW_AFTER):
+            self.controller.record_success(100, 0.1)
+        self.assertEqual(200, self.controller.size)
+
+    def test_grow_within_bounds(self):
+        self.controller.size = 800
+        for i in range(self.controller.GROW_AFTER):
+            self.controller.record_success(800, 0.1)
+        self.assertEqual(1000, self.controller.size)
+
+    def test_shrink(self):
+        self.controller.size = 800
+        self.controller.record_failure()
+        self.assertEqual(400, self.controller.size)
+        self.controller.record_success(400, self.controller.TARGET_SECONDS + 1)
+        self.assertEqual(200, self.controller.size)
+        self.controller.record_failure()
+        self.controller.record_failure()
+        self.assertEqual(100, self.controller.size)
+
+    def test_revert_growth_if_slower(self):
+        for i in range(self.controller.GROW_AFTER):
+            self.controller.record_success(100, 0.1)
+        self.controller.record_success(200, 1)
+        self.assertEqual(100, self.controller.size)
+
+    def test_unit(self):
+        controller = fragments.FragmentSizeController(lambda: (700, 2000), unit=320)
+        self.assertEqual(640, controller.size)
+        with controller.measure(640):
+            pass
+        with self.assertRaises(ValueError):
+            with controller.measure(640):
+                raise ValueError()
+        self.assertEqual(640, controller.size)
+
+
+if __name__ == '__main__':
+    unittest.main()
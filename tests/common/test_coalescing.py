@@ -0,0 +1,137 @@
+import unittest
+
+from onedrivee.workers.task_pool import TaskPool
+from onedrivee.workers.tasks.delete_task import DeleteItemTask
+from onedrivee.workers.tasks.merge_task import MergeDirTask
+from onedrivee.workers.tasks.move_task import MoveItemTask
+from onedrivee.workers.tasks.up_task import CreateDirTask, UploadFileTask
+from tests import mock
+from tests.factory.tasks_factory import get_sample_task_base
+
+
+class TestCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.base = get_sample_task_base()
+        self.pool = TaskPool()
+
+    def pop_all(self):
+        ret = []
+        while self.pool.num_queued_tasks() > 0:
+            ret.append(self.pool.pop_task())
+        return ret
+
+    def num_permits(self):
+        ret = 0
+        while self.pool.semaphore.acquire(blocking=False):
+            ret += 1
+        return ret
+
+    def move(self, old_rel_path, item_name):
+        return MoveItemTask.from_old_rel_path(self.base, '/', item_name, old_rel_path)
+
+    def test_upload_upload(self):
+        first = UploadFileTask(self.base, '/', 'a')
+        self.pool.add_task(first)
+        self.pool.add_task(UploadFileTask(self.base, '/', 'a'))
+        self.assertEqual(1, self.num_permits())
+        self.assertEqual([first], self.pop_all())
+
+    def test_upload_while_uploading(self):
+        """ A file changed while it is uploaded is uploaded again when the upload in flight releases the path. """
+        first = UploadFileTask(self.base, '/', 'a')
+        self.pool.add_task(first)
+        self.assertIs(first, self.pool.pop_task_nowait())
+        second = UploadFileTask(self.base, '/', 'a')
+        self.pool.add_task(second)
+        third = UploadFileTask(self.base, '/', 'a')
+        self.pool.add_task(third)
+        self.assertEqual(0, self.num_permits())
+        self.assertEqual([], self.pop_all())
+        self.pool.clear_hold(first)
+        self.assertEqual(1, self.num_permits())
+        self.assertEqual([third], self.pop_all())
+
+    def test_parked_task_requeued_on_completion(self):
+        """ A task parked on a path is queued even if the task in flight fails before it clears its hold. """
+        first = UploadFileTask(self.base, '/', 'a')
+        self.pool.add_task(first)
+        self.pool.pop_task()
+        delete = DeleteItemTask(self.base, '/', 'a', False)
+        self.pool.add_task(delete)
+        self.pool.complete_task(first)
+        self.assertEqual([delete], self.pop_all())
+
+    def test_delete_upload(self):
+        self.pool.add_task(DeleteItemTask(self.base, '/', 'a', False))
+        upload = UploadFileTask(self.base, '/', 'a')
+        self.pool.add_task(upload)
+        self.assertEqual([upload], self.pop_all())
+
+    def test_delete_create_dir(self):
+        self.pool.add_task(DeleteItemTask(self.base, '/', 'a', True))
+        self.pool.add_task(CreateDirTask(self.base, '/', 'a'))
+        tasks = self.pop_all()
+        self.assertEqual(1, len(tasks))
+        self.assertIsInstance(tasks[0], MergeDirTask)
+        self.assertEqual('/a', tasks[0].rel_path)
+
+    def test_move_move(self):
+        self.pool.add_task(self.move('/a', 'b'))
+        self.pool.add_task(self.move('/b', 'c'))
+        tasks = self.pop_all()
+        self.assertEqual([('/a', '/c')], [(t.old_rel_path, t.rel_path) for t in tasks])
+
+    def test_move_back(self):
+        self.pool.add_task(self.move('/a', 'b'))
+        self.pool.add_task(self.move('/b', 'a'))
+        self.assertEqual(0, self.num_permits())
+        self.assertEqual([], self.pop_all())
+        self.assertFalse(self.pool.has_pending_task_under(self.base.drive.config.local_root))
+
+    def test_dropped_move(self):
+        """ Moves dropped by coalescing are told so, unless another move of the same item replaces them. """
+        moves = [self.move('/a', 'b'), self.move('/b', 'c')]
+        for t in moves:
+            t.on_dropped = mock.Mock()
+            self.pool.add_task(t)
+        moves[0].on_dropped.assert_not_called()
+        moves[1].on_dropped.assert_called_once_with()
+        chained = self.pool.tasks_by_path[self.base.drive.config.local_root + '/c']
+        chained.on_dropped = mock.Mock()
+        self.pool.add_task(self.move('/c', 'a'))
+        chained.on_dropped.assert_called_once_with()
+
+    def test_upload_move(self):
+        self.pool.add_task(UploadFileTask(self.base, '/', 'b'))
+        self.pool.add_task(self.move('/b', 'c'))
+        tasks = self.pop_all()
+        self.assertEqual([(UploadFileTask, '/c')], [(type(t), t.rel_path) for t in tasks])
+
+    def test_move_over_upload(self):
+        """ A file moved over a file waiting for upload replaces the upload. """
+        self.pool.add_task(UploadFileTask(self.base, '/', 'c'))
+        move = self.move('/b', 'c')
+        self.pool.add_task(move)
+        self.assertEqual([move], self.pop_all())
+
+    def test_move_over_move(self):
+        """ A file moved over a file moved before deletes the item of the latter. """
+        self.pool.add_task(self.move('/a', 'c'))
+        move = self.move('/b', 'c')
+        with mock.patch('os.path.isdir', return_value=False):
+            self.pool.add_task(move)
+        self.assertEqual(2, self.num_permits())
+        tasks = self.pop_all()
+        self.assertIn(move, tasks)
+        self.assertCountEqual([(DeleteItemTask, '/a'), (MoveItemTask, '/c')], [(type(t), t.rel_path) for t in tasks])
+
+    def test_no_rule_at_origin(self):
+        delete = DeleteItemTask(self.base, '/', 'b', False)
+        self.pool.add_task(delete)
+        move = self.move('/b', 'c')
+        self.pool.add_task(move)
+        self.assertCountEqual([delete, move], self.pop_all())
+
+
+if __name__ == '__main__':
+    unittest.main()
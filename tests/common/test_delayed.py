@@ -0,0 +1,41 @@
+import threading
+import unittest
+
+from onedrivee.workers.delayed import DelayedCallScheduler
+
+
+class TestDelayedCallScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = DelayedCallScheduler.get_instance()
+
+    def test_order(self):
+        calls = []
+        done = threading.Event()
+        self.scheduler.call_later(0.03, done.set)
+        self.scheduler.call_later(0.02, calls.append, 'second')
+        self.scheduler.call_later(0.01, calls.append, 'first')
+        self.assertTrue(done.wait(1))
+        self.assertEqual(['first', 'second'], calls)
+
+    def test_cancel(self):
+        calls = []
+        done = threading.Event()
+        handle = self.scheduler.call_later(0.01, calls.append, 'cancelled')
+        self.scheduler.call_later(0.02, done.set)
+        self.scheduler.cancel(handle)
+        self.assertTrue(done.wait(1))
+        self.assertEqual([], calls)
+
+    def test_error(self):
+        done = threading.Event()
+        self.scheduler.call_later(0, lambda: 1 / 0)
+        self.scheduler.call_later(0.01, done.set)
+        self.assertTrue(done.wait(1))
+
+    def test_singleton(self):
+        self.assertIs(self.scheduler, DelayedCallScheduler.get_instance())
+        self.assertTrue(self.scheduler.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
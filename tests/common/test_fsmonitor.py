@@ -0,0 +1,120 @@
+import unittest
+
+from onedrivee.workers import fsmonitor
+from onedrivee.workers.tasks.delete_task import DeleteItemTask
+from onedrivee.workers.tasks.merge_task import MergeDirTask
+from onedrivee.workers.tasks.move_task import MoveItemTask
+from onedrivee.workers.tasks.up_task import UploadFileTask
+from tests import mock
+from tests.factory.db_factory import get_sample_item_storage_manager
+from tests.factory.drive_factory import get_sample_drive_object
+
+
+class TestFileSystemMonitorBatch(unittest.TestCase):
+    def setUp(self):
+        self.drive = get_sample_drive_object()
+        self.root = self.drive.config.local_root
+        drive_store = mock.Mock()
+        drive_store.get_all_drives = mock.Mock(return_value={self.drive.drive_id: self.drive})
+        self.task_pool = mock.Mock()
+        self.monitor = fsmonitor.FileSystemMonitor(drive_store, get_sample_item_storage_manager(), self.task_pool)
+
+    def _settle(self, events):
+        for event in events:
+            self.monitor._process_event(*event)
+        self.monitor._flush_batch()
+        return [(type(c[0][0]), c[0][0].local_path) for c in self.task_pool.add_task.call_args_list]
+
+    def test_burst(self):
+        """ A new directory and its content, and a file written many times, settle into one task each. """
+        tasks = self._settle([
+            ('CREATE,ISDIR', self.root, 'a'),
+            ('CREATE', self.root + '/a', 'f'),
+            ('CLOSE_WRITE,CLOSE', self.root + '/a', 'f'),
+            ('CREATE,ISDIR', self.root + '/a', 'b'),
+            ('CREATE', self.root, 'g'),
+            ('CLOSE_WRITE,CLOSE', self.root, 'g'),
+            ('CLOSE_WRITE,CLOSE', self.root, 'g')])
+        self.assertListEqual([(MergeDirTask, self.root), (UploadFileTask, self.root + '/g')], tasks)
+
+    def test_temporary_file(self):
+        """ A file created and deleted within the batch costs nothing. """
+        tasks = self._settle([
+            ('CREATE', self.root + '/x', '.f.swp'),
+            ('CLOSE_WRITE,CLOSE', self.root + '/x', '.f.swp'),
+            ('DELETE', self.root + '/x', '.f.swp')])
+        self.assertListEqual([], tasks)
+
+    def test_delete(self):
+        tasks = self._settle([
+            ('CLOSE_WRITE,CLOSE', self.root + '/x', 'f'),
+            ('DELETE', self.root + '/x', 'f'),
+            ('DELETE,ISDIR', self.root, 'x')])
+        self.assertListEqual([(DeleteItemTask, self.root + '/x')], tasks)
+
+    def test_create_dir_in_subdir(self):
+        tasks = self._settle([('CREATE,ISDIR', self.root + '/x/y', 'z')])
+        self.assertListEqual([(MergeDirTask, self.root + '/x/y')], tasks)
+        # Only the new directory is merged in full, not the subdirectories next to it.
+        self.assertFalse(self.task_pool.add_task.call_args[0][0].recursive)
+
+
+class TestFileSystemMonitorMoves(TestFileSystemMonitorBatch):
+    def setUp(self):
+        super().setUp()
+        # Every entry is known remotely.
+        self.monitor._get_record = mock.Mock(return_value=mock.Mock())
+
+    def _move(self, old_name, new_name, cookie, event_str=''):
+        return [('MOVED_FROM' + event_str, self.root, old_name, cookie),
+                ('MOVED_TO' + event_str, self.root, new_name, cookie)]
+
+    def test_move(self):
+        """ A move within the batch becomes a move of the remote item. """
+        tasks = self._settle(self._move('a', 'b', 1, ',ISDIR') + [('CREATE', self.root, 'c')])
+        self.assertListEqual([(MoveItemTask, self.root + '/b')], tasks)
+        self.assertEqual(self.root + '/a', self.task_pool.add_task.call_args[0][0].old_local_path)
+
+    def test_move_chain(self):
+        """ Moves of an entry one after another become one move. """
+        tasks = self._settle(self._move('a', 'b', 1) + self._move('b', 'c', 2))
+        self.assertListEqual([(MoveItemTask, self.root + '/c')], tasks)
+        self.assertEqual(self.root + '/a', self.task_pool.add_task.call_args[0][0].old_local_path)
+
+    def test_move_back(self):
+        self.assertListEqual([], self._settle(self._move('a', 'b', 1) + self._move('b', 'a', 2)))
+
+    def test_move_and_delete(self):
+        tasks = self._settle(self._move('a', 'b', 1) + [('DELETE', self.root, 'b')])
+        self.assertListEqual([(DeleteItemTask, self.root + '/a')], tasks)
+
+    def test_move_and_write(self):
+        """ A file written after the move is uploaded rather than moved. """
+        tasks = self._settle(self._move('a', 'b', 1) + [('CLOSE_WRITE,CLOSE', self.root, 'b')])
+        self.assertListEqual([(DeleteItemTask, self.root + '/a'), (UploadFileTask, self.root + '/b')], tasks)
+
+    def test_move_across_batches(self):
+        """ The deletion of an entry moved away waits for the entry it was moved to. """
+        events = self._move('a', 'b', 1)
+        self.assertListEqual([], self._settle(events[:1]))
+        self.assertEqual(1, len(self.monitor._pending_moves))
+        self.assertListEqual([(MoveItemTask, self.root + '/b')], self._settle(events[1:]))
+        self.assertEqual(0, len(self.monitor._pending_moves))
+
+    def test_expire_pending_moves(self):
+        """ When the monitor stops, entries moved away whose destination is not known yet are deleted. """
+        self.assertListEqual([], self._settle(self._move('a', 'b', 1)[:1]))
+        self.monitor._expire_pending_moves()
+        self.assertListEqual([(DeleteItemTask, self.root + '/a')],
+                             [(type(c[0][0]), c[0][0].local_path) for c in self.task_pool.add_task.call_args_list])
+        self.assertEqual(0, len(self.monitor._pending_moves))
+
+    def test_move_unknown_entry(self):
+        """ An entry the remote side does not have is uploaded. """
+        self.monitor._get_record = mock.Mock(return_value=None)
+        tasks = self._settle(self._move('a', 'b', 1))
+        self.assertListEqual([(UploadFileTask, self.root + '/b')], tasks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,6 +23,18 @@ class TestHasher(unittest.TestCase):
     def test_sha1(self):
         self.assert_func(hasher.hash_value, {}, '430CE34D020724ED75A196DFC2AD67C77772D169')
 
+    def test_crc32_matches(self):
+        self.assertTrue(hasher.crc32_matches('62177901', '01791762'))
+        self.assertTrue(hasher.crc32_matches('62177901', 'AXkXYg=='))
+        self.assertFalse(hasher.crc32_matches('62177901', '01791763'))
+        self.assertFalse(hasher.crc32_matches('62177901', '!'))
+
+    def test_crc32_incremental(self):
+        h = hasher.Crc32()
+        h.update(b'hello ')
+        h.update(memoryview(b'world!'))
+        self.assertEqual('03B4C26D', h.hexdigest())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from onedrivee.common import inotify
+
+
+class TestInotifyWatcher(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(self.root + '/a/b')
+        self.watcher = inotify.InotifyWatcher()
+        self.watcher.add_tree(self.root)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.root)
+
+    def _read(self):
+        return [(inotify.mask_to_str(e.mask), e.path, e.name) for e in self.watcher.read_events(timeout=1)]
+
+    def test_add_tree(self):
+        self.assertEqual(3, len(self.watcher))
+        with open(self.root + '/a/b/f', 'w') as f:
+            f.write('x')
+        self.assertListEqual([('CREATE', self.root + '/a/b', 'f'), ('CLOSE_WRITE', self.root + '/a/b', 'f')],
+                             self._read())
+
+    def test_watch_new_dir(self):
+        """ Directories created in a watched tree are watched before their events are returned. """
+        os.mkdir(self.root + '/c')
+        self.assertListEqual([('CREATE,ISDIR', self.root, 'c')], self._read())
+        os.mkdir(self.root + '/c/d')
+        self.assertListEqual([('CREATE,ISDIR', self.root + '/c', 'd')], self._read())
+        self.assertEqual(5, len(self.watcher))
+
+    def test_move_dir(self):
+        """ A directory moved within the tree keeps the paths of its subtree right, with one move cookie. """
+        os.rename(self.root + '/a', self.root + '/z')
+        events = self.watcher.read_events(timeout=1)
+        self.assertListEqual(['MOVED_FROM,ISDIR', 'MOVED_TO,ISDIR'], [inotify.mask_to_str(e.mask) for e in events])
+        self.assertEqual(events[0].cookie, events[1].cookie)
+        os.mkdir(self.root + '/z/b/c')
+        self.assertListEqual([('CREATE,ISDIR', self.root + '/z/b', 'c')], self._read())
+
+    def test_move_dir_out(self):
+        """ A directory moved out of the tree is no longer watched. """
+        outside = tempfile.mkdtemp()
+        try:
+            self.watcher.MOVE_PAIRING_SECONDS = 0.05
+            os.rename(self.root + '/a', outside + '/a')
+            self.assertListEqual([('MOVED_FROM,ISDIR', self.root, 'a')], self._read())
+            # The MOVED_TO event could still come in the next read.
+            self.assertEqual(3, len(self.watcher))
+            self.assertListEqual([], self._read())
+            self.assertEqual(1, len(self.watcher))
+        finally:
+            shutil.rmtree(outside)
+
+    def test_move_dir_across_reads(self):
+        """ The events of a move read apart still pair up, so the moved directory stays watched. """
+        root_wd = self.watcher._wd_by_entry[(None, self.root)]
+        a_wd = self.watcher._wd_by_entry[(root_wd, 'a')]
+
+        def pack(mask, name):
+            name = name.encode() + b'\0' * 4
+            return inotify._EVENT_HEADER.pack(root_wd, mask | inotify.IN_ISDIR, 7, len(name)) + name
+
+        self.watcher._parse(bytearray(pack(inotify.IN_MOVED_FROM, 'a')))
+        self.watcher._expire_moves()
+        self.watcher._parse(bytearray(pack(inotify.IN_MOVED_TO, 'z')))
+        self.assertEqual(3, len(self.watcher))
+        self.assertEqual(self.root + '/z', self.watcher.get_path(a_wd))
+
+    def test_close(self):
+        """ Closing the watcher wakes up the thread waiting for events. """
+        results = []
+        t = threading.Thread(target=lambda: results.append(self.watcher.read_events()))
+        t.start()
+        self.watcher.close()
+        t.join(1)
+        self.assertFalse(t.is_alive())
+        self.assertTrue(self.watcher.closed)
+        self.assertListEqual([], self.watcher.read_events())
+
+
+if __name__ == '__main__':
+    unittest.main()
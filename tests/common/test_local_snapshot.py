@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from onedrivee.common import local_snapshot
+from onedrivee.common.local_snapshot import SnapshotEntry
+
+
+def _dir(inode):
+    return SnapshotEntry(True, inode, 4096, 0)
+
+
+def _file(inode, size=1, mtime_ns=0):
+    return SnapshotEntry(False, inode, size, mtime_ns)
+
+
+class TestScan(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_scan(self):
+        os.makedirs(self.root + '/a/b')
+        for path in ('/a/f', '/a/b/g', '/a/.g.!od'):
+            with open(self.root + path, 'w') as f:
+                f.write('xyz')
+        entries = local_snapshot.scan(self.root)
+        self.assertSetEqual({'/a', '/a/b', '/a/f', '/a/b/g'}, set(entries))
+        self.assertTrue(entries['/a/b'].is_dir)
+        st = os.stat(self.root + '/a/f')
+        self.assertEqual(SnapshotEntry(False, st.st_ino, 3, st.st_mtime_ns), entries['/a/f'])
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.old = {'/a': _dir(1), '/a/f': _file(2), '/a/b': _dir(3), '/a/b/g': _file(4), '/h': _file(5)}
+
+    def _diff(self, changes, removed=()):
+        new = dict(self.old)
+        for p in removed:
+            del new[p]
+        new.update(changes)
+        return local_snapshot.diff(self.old, new)
+
+    def test_unchanged(self):
+        self.assertEqual(([], set()), self._diff({}))
+
+    def test_changed_files(self):
+        """ Written, created and deleted files make their directories merged. """
+        self.assertEqual(([], {'/a', '/a/b'}), self._diff({'/a/f': _file(2, mtime_ns=1), '/a/b/i': _file(6)}))
+        self.assertEqual(([], {''}), self._diff({}, removed=['/h']))
+
+    def test_new_and_deleted_dirs(self):
+        """ A new or deleted directory is merged from its parent only. """
+        self.assertEqual(([], {''}), self._diff({'/c': _dir(6), '/c/d': _dir(7), '/c/d/e': _file(8)}))
+        self.assertEqual(([], {''}), self._diff({}, removed=['/a', '/a/f', '/a/b', '/a/b/g']))
+
+    def test_moves(self):
+        self.assertEqual(([('/h', '/a/b/h')], set()), self._diff({'/a/b/h': _file(5)}, removed=['/h']))
+        self.assertEqual(([('/a/b', '/b')], set()),
+                         self._diff({'/b': _dir(3), '/b/g': _file(4)}, removed=['/a/b', '/a/b/g']))
+
+    def test_moves_with_changes(self):
+        """ Entries changed around a move are merged on both sides instead. """
+        self.assertEqual(([], {'', '/a/b'}), self._diff({'/a/b/h': _file(5, size=2)}, removed=['/h']))
+        self.assertEqual(([], {'', '/a'}),
+                         self._diff({'/b': _dir(3), '/b/g': _file(4, size=2)}, removed=['/a/b', '/a/b/g']))
+
+
+if __name__ == '__main__':
+    unittest.main()
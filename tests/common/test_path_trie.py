@@ -0,0 +1,47 @@
+import unittest
+
+from onedrivee.common.path_trie import PathTrie
+
+
+class TestPathTrie(unittest.TestCase):
+    def setUp(self):
+        self.trie = PathTrie()
+        for path in ['/a/foo', '/a/foobar', '/a/foo/x', '/a/foo/y/z']:
+            self.trie[path] = path
+
+    def test_get_set_del(self):
+        self.assertEqual(4, len(self.trie))
+        self.assertIn('/a/foo', self.trie)
+        self.assertNotIn('/a', self.trie)
+        self.assertEqual('/a/foo/y/z', self.trie['/a/foo/y/z'])
+        self.assertIsNone(self.trie.get('/a/foo/y'))
+        self.trie['/a/foo'] = 'new'
+        self.assertEqual(4, len(self.trie))
+        self.assertEqual('new', self.trie['/a/foo'])
+        del self.trie['/a/foo/y/z']
+        self.assertEqual(3, len(self.trie))
+        self.assertFalse(self.trie.has_descendant('/a/foo/y'))
+        self.assertRaises(KeyError, self.trie.__delitem__, '/a/foo/y')
+        self.assertRaises(KeyError, self.trie.__getitem__, '/b')
+
+    def test_items_under(self):
+        self.assertEqual(['/a/foo', '/a/foo/x', '/a/foo/y/z'],
+                         sorted(p for p, v in self.trie.items_under('/a/foo')))
+        self.assertEqual(['/a/foo/x'], [p for p, v in self.trie.items_under('/a/foo/x/')])
+        self.assertEqual([], self.trie.items_under('/a/fo'))
+
+    def test_has_descendant(self):
+        self.assertTrue(self.trie.has_descendant('/a'))
+        self.assertTrue(self.trie.has_descendant('/a/foo'))
+        self.assertFalse(self.trie.has_descendant('/a/foobar'))
+        self.assertFalse(self.trie.has_descendant('/b'))
+
+    def test_has_ancestor(self):
+        self.assertTrue(self.trie.has_ancestor('/a/foo/new'))
+        self.assertTrue(self.trie.has_ancestor('/a/foo/y/z'))
+        self.assertFalse(self.trie.has_ancestor('/a/foo'))
+        self.assertFalse(self.trie.has_ancestor('/a/foob/c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import types
+import unittest
+
+from onedrivee.workers import scheduler
+
+
+class FakeTask:
+    def __init__(self, name, scheduling_class='change', size_hint=0, drive_id='drive'):
+        self.name = name
+        self.scheduling_class = scheduling_class
+        self.size_hint = size_hint
+        self.drive = types.SimpleNamespace(drive_id=drive_id)
+
+
+class TestTaskScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = scheduler.TaskScheduler()
+
+    def pop_all(self):
+        ret = []
+        while len(self.scheduler) > 0:
+            ret.append(self.scheduler.pop().name)
+        return ret
+
+    def test_empty(self):
+        self.assertIsNone(self.scheduler.pop())
+
+    def test_rank_by_size(self):
+        self.scheduler.push(FakeTask('large', 'transfer', 1 << 40))
+        self.scheduler.push(FakeTask('small', 'transfer', 1))
+        self.assertEqual(['small', 'large'], self.pop_all())
+
+    def test_weighted_fair(self):
+        for i in range(4):
+            self.scheduler.push(FakeTask('merge', 'merge'))
+            self.scheduler.push(FakeTask('change', 'change'))
+        # Merges get a quarter of the share of changes but are not starved.
+        self.assertEqual(['change', 'change', 'change', 'merge', 'change', 'merge', 'merge', 'merge'], self.pop_all())
+
+    def test_remove(self):
+        tasks = [FakeTask(str(i)) for i in range(3)]
+        for t in tasks:
+            self.scheduler.push(t)
+        self.scheduler.remove(tasks[1])
+        self.assertEqual(2, len(self.scheduler))
+        self.assertEqual(['0', '2'], self.pop_all())
+
+    def test_pop_by_class(self):
+        self.scheduler.push(FakeTask('a'))
+        self.scheduler.push(FakeTask('b', 'merge'))
+        self.assertIsNone(self.scheduler.pop(int))
+        self.assertEqual('a', self.scheduler.pop(FakeTask).name)
+        self.assertEqual(['b'], self.pop_all())
+
+    def test_small_files_first(self):
+        self.scheduler = scheduler.TaskScheduler(scheduler.SmallFilesFirstPolicy())
+        for i in range(2):
+            self.scheduler.push(FakeTask('large', 'transfer', 1 << 30))
+        for i in range(2):
+            self.scheduler.push(FakeTask('small', 'transfer', 1))
+        self.assertEqual(['small', 'small', 'large', 'large'], self.pop_all())
+
+    def test_pop_only_queues(self):
+        self.scheduler.push(FakeTask('change'))
+        self.scheduler.push(FakeTask('merge', 'merge'))
+        self.assertEqual(['change', 'merge'], self.scheduler.active_queues())
+        self.assertEqual('merge', self.scheduler.pop(only_queues=('merge',)).name)
+        self.assertIsNone(self.scheduler.pop(only_queues=('merge',)))
+        self.assertEqual(1, self.scheduler.count('change'))
+
+
+class TestDriveFairScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = scheduler.DriveFairScheduler()
+
+    def test_fair_among_drives(self):
+        busy = [FakeTask('busy', drive_id='busy') for _ in range(4)]
+        for t in busy:
+            self.scheduler.push(t)
+        self.scheduler.pop()
+        # A drive that becomes active gets its turn right away, however long the backlog of another drive is.
+        for _ in range(2):
+            self.scheduler.push(FakeTask('quiet', drive_id='quiet'))
+        self.assertEqual(5, len(self.scheduler))
+        self.assertIn(busy[1], self.scheduler)
+        names = [self.scheduler.pop().name for _ in range(5)]
+        self.assertEqual(['quiet', 'busy', 'quiet', 'busy', 'busy'], names)
+        self.assertIsNone(self.scheduler.pop())
+
+    def test_only_queues(self):
+        self.scheduler.push(FakeTask('a', 'merge', drive_id='a'))
+        self.scheduler.push(FakeTask('b', 'change', drive_id='b'))
+        self.assertEqual(1, self.scheduler.count('merge'))
+        self.assertEqual('a', self.scheduler.pop(only_queues=('merge',)).name)
+        self.assertIsNone(self.scheduler.pop(only_queues=('merge',)))
+
+
+if __name__ == '__main__':
+    unittest.main()
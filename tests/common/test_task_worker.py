@@ -16,6 +16,7 @@ class TestTaskConsumer(unittest.TestCase):
         self.task.drive = get_sample_drive_object()
         self.task.rel_parent_path = '/'
         self.task.item_name = 'foo'
+        self.task.items_store = mock.Mock()
         self.mock_handler = mock.Mock(return_value=None)
         self.task.handle = self.mock_handler
 
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from onedrivee.drives.errors import OneDriveError
+from onedrivee.drives.items import OneDriveItem
+from onedrivee.workers.tasks.delta_task import DeltaSyncTask
+from onedrivee.workers.tasks.down_task import DownloadFileTask
+from onedrivee.workers.tasks.merge_task import MergeDirTask
+from tests import get_data, mock
+from tests.factory.tasks_factory import get_sample_task_base
+
+
+class TestDeltaSyncTask(unittest.TestCase):
+    def setUp(self):
+        self.local_root = tempfile.mkdtemp()
+        self.parent_task = get_sample_task_base()
+        self.parent_task.drive.config.data['local_root'] = self.local_root
+        self.items_store = self.parent_task.items_store
+        self.task_pool = self.parent_task.task_pool
+        self.task = DeltaSyncTask(self.parent_task)
+        self.data = get_data('image_item.json')
+        self.root_id = self.data['parentReference']['id']
+        self.items_store.set_state(self.items_store.ROOT_ID_KEY, self.root_id)
+
+    def tearDown(self):
+        shutil.rmtree(self.local_root)
+
+    def set_changes(self, changed_items, token='new_token'):
+        changes = mock.Mock()
+        changes.has_next = True
+
+        def get_next():
+            changes.has_next = False
+            return [OneDriveItem(self.parent_task.drive, d) for d in changed_items]
+
+        changes.get_next = get_next
+        changes.token = token
+        self.parent_task.drive.get_changes = mock.Mock(return_value=changes)
+
+    def add_record(self, data):
+        self.items_store.update_item(OneDriveItem(self.parent_task.drive, data))
+
+    def test_handle_without_token(self):
+        root_item = mock.Mock()
+        root_item.id = self.root_id
+        self.parent_task.drive.get_root_dir = mock.Mock(return_value=root_item)
+        self.set_changes([], token='latest_token')
+        self.task.handle()
+        self.parent_task.drive.get_changes.assert_called_once_with(token='latest')
+        self.assertEqual('latest_token', self.items_store.get_delta_token())
+        self.assertIsInstance(self.task_pool.pop_task(), MergeDirTask)
+
+    def test_download_new_file(self):
+        self.items_store.set_delta_token('old_token')
+        del self.data['parentReference']['path']
+        self.set_changes([self.data])
+        self.task.handle()
+        self.parent_task.drive.get_changes.assert_called_once_with(token='old_token')
+        self.assertEqual('new_token', self.items_store.get_delta_token())
+        task = self.task_pool.pop_task()
+        self.assertIsInstance(task, DownloadFileTask)
+        self.assertEqual(self.local_root + '/' + self.data['name'], task.local_path)
+
+    def test_delete_file(self):
+        self.items_store.set_delta_token('old_token')
+        self.add_record(self.data)
+        with open(self.local_root + '/' + self.data['name'], 'w'):
+            pass
+        self.set_changes([{'id': self.data['id'], 'deleted': {}}])
+        with mock.patch('onedrivee.workers.tasks.delta_task.send2trash') as m:
+            self.task.handle()
+            m.assert_called_once_with(self.local_root + '/' + self.data['name'])
+        self.assertEqual(0, len(self.items_store.get_items_by_id(item_id=self.data['id'])))
+
+    def test_move_file(self):
+        self.items_store.set_delta_token('old_token')
+        self.add_record(self.data)
+        with open(self.local_root + '/' + self.data['name'], 'w'):
+            pass
+        self.data['name'] = 'renamed.jpg'
+        self.set_changes([self.data])
+        self.task.handle()
+        self.assertTrue(os.path.isfile(self.local_root + '/renamed.jpg'))
+        record = self.items_store.get_items_by_id(item_id=self.data['id'])[self.data['id']]
+        self.assertEqual('renamed.jpg', record.item_name)
+        self.assertIsNone(self.task_pool.pop_task())
+
+    def test_handle_error(self):
+        self.items_store.set_delta_token('old_token')
+        response = mock.Mock()
+        response.json = mock.Mock(return_value=get_data('error_type1.json'))
+        self.parent_task.drive.get_changes = mock.Mock(side_effect=OneDriveError(response))
+        self.task.handle()
+        self.assertEqual('old_token', self.items_store.get_delta_token())
+
+
+if __name__ == '__main__':
+    unittest.main()
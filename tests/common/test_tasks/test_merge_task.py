@@ -1,8 +1,14 @@
 import os
+import stat
 import unittest
 
+from onedrivee.api.items import OneDriveItem
+from onedrivee.common import drive_config
+from onedrivee.common.tasks.copy_task import AsyncCopyItemTask
 from onedrivee.common.tasks.merge_task import MergeDirTask
-from tests import mock
+from onedrivee.common.tasks.move_task import MoveItemTask
+from onedrivee.store.items_db import ItemRecord, ItemRecordStatuses
+from tests import get_data, mock
 from tests.factory.tasks_factory import get_sample_task_base
 
 
@@ -10,6 +16,19 @@ class TestMergeTask(unittest.TestCase):
     def setUp(self):
         self.task = MergeDirTask(get_sample_task_base(), '', '')
 
+    @staticmethod
+    def _scandir(files):
+        """ Mock os.scandir listing entries of the given names, directories if their value is True. """
+        entries = []
+        for name, is_dir in files:
+            entry = mock.Mock()
+            entry.name = name
+            entry.stat = mock.Mock(return_value=mock.Mock(st_mode=stat.S_IFDIR if is_dir else stat.S_IFREG))
+            entries.append(entry)
+        m = mock.MagicMock()
+        m.return_value.__enter__.return_value = iter(entries)
+        return m
+
     def test_list_local_items(self):
         """ list_local_items lists local items, renaming case-INsensitively duplicate ones and applying ignore list."""
         files = {
@@ -20,24 +39,111 @@ class TestMergeTask(unittest.TestCase):
             '.file1.!od': False
         }
         m = mock.Mock(return_value=None)
-        os.listdir = lambda path: sorted(files.keys())
-        os.path.isdir = lambda path: files[path.replace(self.task.local_path + '/', '', 1)]
-        os.rename = m
-        all_local_items = self.task._list_local_items()
+        with mock.patch('os.scandir', self._scandir(sorted(files.items()))), mock.patch('os.rename', m):
+            all_local_items = self.task._list_local_items()
         self.assertSetEqual({'Dir1.xxx', 'dir1 1 (case conflict).xxx', 'dir2', 'file1'}, all_local_items)
         m.assert_called_once_with(self.task.drive.config.local_root + '/' + 'dir1.xxx',
                                   self.task.drive.config.local_root + '/' + 'dir1 1 (case conflict).xxx')
+        # The analysis takes the status of the entries from the listing.
+        self.assertTrue(stat.S_ISDIR(self.task._get_local_stat('dir1 1 (case conflict).xxx').st_mode))
+        self.assertFalse(stat.S_ISDIR(self.task._get_local_stat('file1').st_mode))
 
     def test_list_local_items_error(self):
         """ If a file has naming conflict and fails, ignore it. """
-        files = ['foo', 'Foo']
-        os.listdir = lambda p: files
-        os.path.isdir = lambda p: False
+        files = [('foo', False), ('Foo', False)]
         m = mock.Mock(side_effect=OSError())
-        os.rename = m
-        all_local_items = self.task._list_local_items()
+        with mock.patch('os.scandir', self._scandir(files)), mock.patch('os.rename', m):
+            all_local_items = self.task._list_local_items()
         self.assertSetEqual({'foo'}, all_local_items)
 
+    def test_have_equal_hash_without_remote_hash(self):
+        """ A remote file without hash property is downloaded at most once for each cTag. """
+        data = get_data('image_item.json')
+        del data['file']['hashes']
+        item = OneDriveItem(self.task.drive, data)
+        self.task._computing_remote_hash_locally = mock.Mock(return_value='SHA1')
+        self.task.items_store.get_local_sha1_hash = mock.Mock(return_value='SHA1')
+        with mock.patch('os.path.getsize', return_value=item.size):
+            self.assertTrue(self.task._have_equal_hash('/foo', item))
+            self.assertTrue(self.task._have_equal_hash('/foo', item))
+            self.task._computing_remote_hash_locally.assert_called_once_with(item)
+        with mock.patch('os.path.getsize', return_value=item.size + 1):
+            self.assertFalse(self.task._have_equal_hash('/foo', item))
+
+    def _analyze_remote_dir(self, recursive, has_record):
+        self.task.recursive = recursive
+        item = OneDriveItem(self.task.drive, get_data('folder_item.json'))
+        self.task._records_by_name = {}
+        if has_record:
+            self.task._records_by_name[item.name] = {item.id: ItemRecord((
+                item.id, 'folder', item.name, 'PARENT', self.task.remote_path, 'ETAG', 'CTAG', 0, None, None,
+                ItemRecordStatuses.OK, None, None))}
+        self.task._local_stats[item.name] = mock.Mock(st_mode=stat.S_IFDIR)
+        self.task.items_store.update_item = mock.Mock()
+        self.task._create_merge_dir_task = mock.Mock()
+        self.task._analyze_remote_item(item, set())
+        return self.task._create_merge_dir_task.call_count
+
+    def test_non_recursive_merge(self):
+        """ A non recursive merge leaves synced subdirectories alone, and merges new ones. """
+        self.assertEqual(0, self._analyze_remote_dir(recursive=False, has_record=True))
+        self.assertEqual(1, self._analyze_remote_dir(recursive=False, has_record=False))
+        self.assertEqual(1, self._analyze_remote_dir(recursive=True, has_record=True))
+
+    def _get_record(self, item_name, size):
+        return ItemRecord(('ID_' + item_name, 'file', item_name, 'PARENT', self.task.drive.drive_path + '/root:', 'ETAG',
+                           'CTAG', size, None, None, ItemRecordStatuses.OK, None, 'SHA1'))
+
+    def _create_copy_or_move_task(self, size, records, exists):
+        self.task.items_store.get_local_sha1_hash = mock.Mock(return_value='SHA1')
+        self.task.items_store.get_items_by_hash = mock.Mock(return_value={r.item_id: r for r in records})
+        self.task.items_store.update_status = mock.Mock()
+        self.task.task_pool.add_task = mock.Mock()
+        with mock.patch('os.stat', return_value=mock.Mock(st_size=size)), \
+                mock.patch('os.path.exists', side_effect=exists):
+            return self.task._create_copy_or_move_task('new', self.task.local_path + '/new')
+
+    def test_copy_of_remote_file(self):
+        """ A new file with the size and hash of a remote file is copied on server. """
+        size = self.task.drive.put_fragment_size.min_size + 1
+        record = self._get_record('old', size)
+        self.assertTrue(self._create_copy_or_move_task(size, [record], lambda p: True))
+        task = self.task.task_pool.add_task.call_args[0][0]
+        self.assertIsInstance(task, AsyncCopyItemTask)
+        self.assertEqual(self.task.local_path + '/new', task.local_path)
+        self.task.items_store.get_items_by_hash.assert_called_once_with(sha1_hash='SHA1')
+
+    def test_move_of_remote_file(self):
+        """ A new file with the content of a remote file gone from its local path moves the remote file. """
+        size = self.task.drive.put_fragment_size.min_size + 1
+        record = self._get_record('old', size)
+        self.assertTrue(self._create_copy_or_move_task(size, [record], lambda p: False))
+        task = self.task.task_pool.add_task.call_args[0][0]
+        self.assertIsInstance(task, MoveItemTask)
+        self.assertEqual(self.task.local_path + '/old', task.old_local_path)
+        self.task.items_store.update_status.assert_called_once_with(ItemRecordStatuses.MOVING, item_id='ID_old')
+
+    def test_no_copy_of_other_files(self):
+        """ Small files and files whose size differs from the matching records are uploaded. """
+        size = self.task.drive.put_fragment_size.min_size
+        self.assertFalse(self._create_copy_or_move_task(size, [self._get_record('old', size)], lambda p: True))
+        self.assertFalse(self._create_copy_or_move_task(size + 1, [self._get_record('old', size)], lambda p: True))
+        self.task.task_pool.add_task.assert_not_called()
+
+    def test_no_upload_of_vanished_file(self):
+        self.task.task_pool.add_task = mock.Mock()
+        with mock.patch('os.stat', side_effect=FileNotFoundError()):
+            self.assertTrue(self.task._create_copy_or_move_task('new', self.task.local_path + '/new'))
+        self.task.task_pool.add_task.assert_not_called()
+
+    def test_copy_of_remote_file_uploaded_by_fragments(self):
+        """ Files uploaded by fragments of less than the largest fragment size are copied as well. """
+        self.task.drive.config = drive_config.DriveConfig({'min_put_size_bytes': 327680,
+                                                           'max_put_size_bytes': 3276800})
+        size = self.task.drive.config.max_put_size_bytes
+        self.assertTrue(self._create_copy_or_move_task(size, [self._get_record('old', size)], lambda p: True))
+        self.assertIsInstance(self.task.task_pool.add_task.call_args[0][0], AsyncCopyItemTask)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,50 @@
 import unittest
 
+from onedrivee.api.errors import OneDriveError
+from onedrivee.api.items import OneDriveItem
+from onedrivee.common.tasks.move_task import MoveItemTask
+from onedrivee.common.tasks.up_task import UploadFileTask
+from onedrivee.store.items_db import ItemRecordStatuses
+from tests import get_data
+from tests import mock
+from tests.factory.tasks_factory import get_sample_task_base
+
 
 class TestMoveItemTask(unittest.TestCase):
-    def test_something(self):
-        self.assertEqual(True, True)
+    def setUp(self):
+        parent_task = get_sample_task_base()
+        self.item = OneDriveItem(data=get_data('image_item.json'), drive=parent_task.drive)
+        parent_task.items_store.update_item(self.item, ItemRecordStatuses.MOVING)
+        self.task = MoveItemTask.from_old_rel_path(parent_task, '/', 'new.jpg', '/' + self.item.name)
+        self.task.task_pool.add_task = mock.Mock()
+
+    def get_status(self):
+        return self.task.items_store.get_items_by_id(item_id=self.item.id)[self.item.id].status
+
+    def test_handle(self):
+        moved = OneDriveItem(data=dict(get_data('image_item.json'), name='new.jpg'), drive=self.task.drive)
+        m = mock.Mock(return_value=moved)
+        self.task.drive.update_item = m
+        self.task.handle()
+        self.assertEqual(self.item.parent_reference.path + '/' + self.item.name, m.call_args[1]['item_path'])
+        self.assertEqual('new.jpg', m.call_args[1]['new_name'])
+        self.assertEqual(ItemRecordStatuses.OK, self.get_status())
+        self.task.task_pool.add_task.assert_not_called()
+
+    def test_handle_error(self):
+        """ If the remote item cannot be moved, the new file is uploaded and merges handle the old item again. """
+        error = mock.Mock(json=mock.Mock(return_value={'error': {'code': 'nameAlreadyExists', 'message': 'Exists.'}}))
+        self.task.drive.update_item = mock.Mock(side_effect=OneDriveError(error))
+        with mock.patch('os.path.isdir', return_value=False), mock.patch('os.path.isfile', return_value=True):
+            self.task.handle()
+        self.assertEqual(ItemRecordStatuses.OK, self.get_status())
+        task = self.task.task_pool.add_task.call_args[0][0]
+        self.assertIsInstance(task, UploadFileTask)
+        self.assertEqual(self.task.local_path, task.local_path)
+
+    def test_on_dropped(self):
+        self.task.on_dropped()
+        self.assertEqual(ItemRecordStatuses.OK, self.get_status())
 
 
 if __name__ == '__main__':
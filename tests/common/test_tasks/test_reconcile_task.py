@@ -0,0 +1,47 @@
+import unittest
+
+from onedrivee.common.local_snapshot import SnapshotEntry
+from onedrivee.workers.task_pool import TaskPool
+from onedrivee.workers.tasks.delta_task import DeltaSyncTask
+from onedrivee.workers.tasks.merge_task import MergeDirTask
+from onedrivee.workers.tasks.move_task import MoveItemTask
+from onedrivee.workers.tasks.reconcile_task import LocalReconcileTask
+from onedrivee.store.items_db import ItemRecordStatuses
+from tests import mock
+from tests.factory.tasks_factory import get_sample_task_base
+
+
+class TestLocalReconcileTask(unittest.TestCase):
+    def test_handle(self):
+        snapshot = {'/a': SnapshotEntry(True, 1, 0, 0), '/a/f': SnapshotEntry(False, 2, 1, 0),
+                    '/g': SnapshotEntry(False, 3, 1, 0)}
+        current = {'/a': SnapshotEntry(True, 1, 0, 0), '/a/f': SnapshotEntry(False, 2, 2, 1),
+                   '/h': SnapshotEntry(False, 3, 1, 0)}
+        task = LocalReconcileTask(get_sample_task_base(), snapshot)
+        task.task_pool.add_task = mock.Mock()
+        task.items_store.update_status = mock.Mock()
+        with mock.patch('onedrivee.common.local_snapshot.scan', return_value=current):
+            task.handle()
+        move, merge = [c[0][0] for c in task.task_pool.add_task.call_args_list]
+        self.assertIsInstance(move, MoveItemTask)
+        root = task.drive.config.local_root
+        self.assertEqual((root + '/g', root + '/h'), (move.old_local_path, move.local_path))
+        task.items_store.update_status.assert_called_once_with(
+                ItemRecordStatuses.MOVING, local_parent_path=task.drive.config.local_root, item_name='g')
+        self.assertIsInstance(merge, MergeDirTask)
+        self.assertEqual(root + '/a', merge.local_path)
+        self.assertFalse(merge.recursive)
+
+    def test_queued_with_delta_sync(self):
+        """ The delta sync of the drive can be queued while the task is. """
+        base = get_sample_task_base()
+        base.task_pool = TaskPool()
+        base.task_pool.add_task(LocalReconcileTask(base, {}))
+        delta = DeltaSyncTask(base)
+        self.assertFalse(base.task_pool.has_pending_task(delta.local_path))
+        base.task_pool.add_task(delta)
+        self.assertEqual(2, base.task_pool.num_queued_tasks())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import unittest
 
 from onedrivee.api.errors import OneDriveError
 from onedrivee.api.items import OneDriveItem
+from onedrivee.common import drive_config
 from onedrivee.common.dateparser import timestamp_to_datetime
 from onedrivee.common.tasks.up_task import UpdateMetadataTask
 from onedrivee.common.tasks.up_task import UploadFileTask
@@ -38,6 +39,19 @@ class TestUploadFileTask(TestUpTaskBase):
             self.task.handle()
         self.assertEqual(1, len(self.task.items_store.get_items_by_id(item_id=self.item.id)))
 
+    def test_handle_by_fragments(self):
+        """ A file larger than one upload request saves its upload session and the learned fragment size. """
+        self.task.drive.config = drive_config.DriveConfig({'min_put_size_bytes': 655360,
+                                                           'max_put_size_bytes': 62914560})
+        self.task.items_store.save_fragment_sizes = mock.Mock()
+        m = mock.mock_open()
+        m.return_value = io.BytesIO()
+        with mock.patch('builtins.open', m, create=True), mock.patch('os.path.getsize', return_value=3 << 20), \
+                mock.patch('os.path.getmtime', return_value=123412341234):
+            self.task.handle()
+        self.assertIsNotNone(self.parent_task.drive.upload_file.call_args[1]['progress'])
+        self.task.items_store.save_fragment_sizes.assert_called_once_with()
+
     def test_handle_error(self):
         m = mock.mock_open()
         m.side_effect = OSError()
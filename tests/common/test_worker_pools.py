@@ -0,0 +1,57 @@
+import unittest
+
+from onedrivee.workers.task_pool import TaskPool
+from onedrivee.workers.task_worker import TaskConsumer
+from onedrivee.workers.worker_pools import WorkerPoolManager
+from tests import mock
+
+
+class TestWorkerPoolManager(unittest.TestCase):
+    def setUp(self):
+        TaskConsumer.terminate_sign.clear()
+        self.pool = TaskPool()
+        self.manager = WorkerPoolManager(self.pool, {'merge': (0, 2), 'transfer': (1, 10)}, (1, 3))
+
+    def tearDown(self):
+        TaskConsumer.terminate_sign.set()
+        TaskConsumer.terminate_sign.clear()
+
+    def test_desired_workers(self):
+        self.pool.num_queued_tasks = mock.Mock(return_value=30)
+        # Without latency samples, start as many workers as allowed.
+        self.assertEqual(10, self.manager.desired_workers('transfer'))
+        self.assertEqual(3, self.manager.desired_workers('change'))
+        # 30 tasks of 4 seconds each take 2 workers to drain within a minute.
+        self.manager.record_latency('transfer', 4)
+        self.assertEqual(2, self.manager.desired_workers('transfer'))
+        self.manager.record_latency('transfer', 0)
+        self.assertEqual(2, self.manager.desired_workers('transfer'))
+        self.pool.num_queued_tasks = mock.Mock(return_value=0)
+        self.assertEqual(1, self.manager.desired_workers('transfer'))
+        self.assertEqual(0, self.manager.desired_workers('merge'))
+
+    def test_scale_and_retire(self):
+        self.manager.IDLE_SECONDS = 0.01
+        self.manager.scale()
+        self.assertEqual(0, self.manager.num_workers('merge'))
+        self.assertEqual(1, self.manager.num_workers('transfer'))
+        worker = self.manager._workers['transfer'][0]
+        # The pool does not shrink below its lower bound.
+        self.assertFalse(self.manager.retire(worker))
+        self.manager.bounds['transfer'] = (0, 10)
+        worker.join(timeout=1)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(0, self.manager.num_workers('transfer'))
+
+    def test_stop(self):
+        self.manager.scale()
+        workers = list(self.manager._workers['transfer'])
+        self.assertEqual(1, len(workers))
+        # Idle workers waiting for tasks leave at once, even at the lower bound of their pool.
+        self.manager.stop()
+        self.assertFalse(workers[0].is_alive())
+        self.assertEqual(0, self.manager.num_workers('transfer'))
+
+
+if __name__ == '__main__':
+    unittest.main()
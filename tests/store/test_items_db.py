@@ -1,8 +1,11 @@
+import sqlite3
+import tempfile
 import unittest
 
-from onedrivee.api import items
+from onedrivee.api import items, resources
+from onedrivee.common import drive_config
 from onedrivee.store import items_db
-from tests import get_data
+from tests import get_data, mock
 from tests.factory import drive_factory, db_factory, mock_factory
 
 mock_factory.mock_register()
@@ -108,6 +111,13 @@ class TestItemStorage(unittest.TestCase):
     def test_delete_item_by_remote_path(self):
         self.run_delete_item(1, parent_path='AUTO', item_name='AUTO', is_folder=True)
 
+    def test_get_items_by_parent(self):
+        folder = self.all_items[1]
+        child = self.all_items[2]
+        records = self.itemdb.get_items_by_parent(parent_path=folder.parent_reference.path + '/' + folder.name)
+        self.assertEqual([child.name], list(records.keys()))
+        self.assert_item_record(child, records[child.name])
+
     def test_get_item_by_hash(self):
         item = self.all_items[0]
         records = self.itemdb.get_items_by_hash(crc32_hash=item.file_props.hashes.crc32)
@@ -134,6 +144,91 @@ class TestItemStorage(unittest.TestCase):
         records = self.itemdb.get_items_by_id(**q)
         self.assert_item_record(item, records, items_db.ItemRecordStatuses.MOVING)
 
+    def test_local_hash_cache(self):
+        self.itemdb.RACY_INTERVAL_NS = 0
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'hello world!')
+            f.flush()
+            with mock.patch('onedrivee.common.hasher.hash_value', return_value='SHA1') as m:
+                self.assertEqual('SHA1', self.itemdb.get_local_sha1_hash(f.name))
+                self.assertEqual('SHA1', self.itemdb.get_local_sha1_hash(f.name))
+                m.assert_called_once_with(f.name)
+                # A changed file should be hashed again.
+                f.write(b'!')
+                f.flush()
+                self.itemdb.get_local_sha1_hash(f.name)
+                self.assertEqual(2, m.call_count)
+
+    def test_state(self):
+        self.assertIsNone(self.itemdb.get_delta_token())
+        self.itemdb.set_delta_token('abc')
+        self.assertEqual('abc', self.itemdb.get_delta_token())
+        self.itemdb.set_delta_token(None)
+        self.assertIsNone(self.itemdb.get_delta_token())
+
+    def test_partial_download(self):
+        self.assertIsNone(self.itemdb.get_partial_download('/tmp/.foo.!od'))
+        self.itemdb.set_partial_download('/tmp/.foo.!od', 'abc', 'ctag', 10, 4)
+        self.assertEqual(('abc', 'ctag', 10, 4), self.itemdb.get_partial_download('/tmp/.foo.!od'))
+        self.itemdb.delete_partial_download('/tmp/.foo.!od')
+        self.assertIsNone(self.itemdb.get_partial_download('/tmp/.foo.!od'))
+
+    def test_upload_session(self):
+        session = resources.UploadSession({'uploadUrl': 'https://foo/bar', 'nextExpectedRanges': ['2-3', '6-']})
+        self.itemdb.set_upload_session('/tmp/foo', session, 10, 123.0)
+        self.assertEqual(('https://foo/bar', [(2, 3), (6, None)]),
+                         self.itemdb.get_upload_session('/tmp/foo', 10, 123.0))
+        self.assertIsNone(self.itemdb.get_upload_session('/tmp/foo', 11, 123.0))
+        self.assertIsNone(self.itemdb.get_upload_session('/tmp/foo', 10, 123.0))
+
+    def test_fragment_sizes(self):
+        self.drive.config = drive_config.DriveConfig({'min_get_size_bytes': 10, 'max_get_size_bytes': 100})
+        self.drive.get_fragment_size.size = 40
+        self.itemdb.save_fragment_sizes()
+        self.assertEqual('40', self.itemdb.get_state(self.itemdb.GET_FRAGMENT_SIZE_KEY))
+        self.drive.get_fragment_size.size = None
+        self.itemdb._restore_fragment_sizes()
+        self.assertEqual(40, self.drive.get_fragment_size.size)
+
+    def test_migrate(self):
+        with tempfile.NamedTemporaryFile(suffix='.db') as f:
+            conn = sqlite3.connect(f.name)
+            conn.execute('CREATE TABLE items (item_id TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE, type TEXT, '
+                         'item_name TEXT, parent_id TEXT, parent_path TEXT, etag TEXT, ctag TEXT, size INT, '
+                         'created_time TEXT, modified_time TEXT, status TEXT, crc32_hash TEXT, sha1_hash TEXT)')
+            conn.close()
+            itemdb = items_db.ItemStorage(f.name, self.drive)
+            version = itemdb._conn.execute('PRAGMA user_version').fetchone()[0]
+            indexes = {row[0] for row in itemdb._conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+            itemdb.close()
+        self.assertEqual(len(items_db.ItemStorage.schema_migrations), version)
+        self.assertIn('items_parent_path_name', indexes)
+
+    def test_delete_folder_keeps_siblings(self):
+        folder = self.all_items[1]
+        folder_path = folder.parent_reference.path + '/' + folder.name
+        for i, parent_path in enumerate([folder_path + '/a/b', folder_path + ' bar', folder_path + '0']):
+            self.itemdb._conn.execute('INSERT INTO items (item_id, item_name, parent_id, parent_path) '
+                                      'VALUES (?, ?, ?, ?)', ('x' + str(i), 'x', 'y', parent_path))
+        self.itemdb.delete_item(item_id=folder.id, is_folder=True)
+        q = self.itemdb._conn.execute("SELECT item_id FROM items WHERE item_id LIKE 'x%' ORDER BY item_id")
+        self.assertEqual([('x1',), ('x2',)], q.fetchall())
+
+    def test_batched_writes(self):
+        self.itemdb.flush()
+        with mock.patch.object(self.itemdb, 'BATCH_SECONDS', 3600):
+            self.itemdb.set_delta_token('abc')
+            self.itemdb.set_delta_token('def')
+            self.assertTrue(self.itemdb._conn.in_transaction)
+            self.assertEqual('def', self.itemdb.get_delta_token())
+            self.itemdb.flush(only_if_due=True)
+            self.assertTrue(self.itemdb._conn.in_transaction)
+            self.itemdb.flush()
+            self.assertFalse(self.itemdb._conn.in_transaction)
+        with mock.patch.object(self.itemdb, 'BATCH_SIZE', 1):
+            self.itemdb.set_delta_token('abc')
+            self.assertFalse(self.itemdb._conn.in_transaction)
+
     def test_create_item_db_name(self):
         name = items_db.create_item_db_name(self.drive)
         self.assertIsInstance(name, str)
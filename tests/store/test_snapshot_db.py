@@ -0,0 +1,31 @@
+import unittest
+
+from onedrivee.common.local_snapshot import SnapshotEntry
+from onedrivee.store import snapshot_db
+
+
+class TestLocalSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self.store = snapshot_db.LocalSnapshotStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_save_take(self):
+        entries = {'/a': SnapshotEntry(True, 1, 4096, 100), '/a/b': SnapshotEntry(False, 2, 3, 200)}
+        self.assertIsNone(self.store.take('drive_id'))
+        self.store.save('drive_id', entries)
+        self.store.save('other_id', {})
+        self.assertDictEqual(entries, self.store.take('drive_id'))
+        # A snapshot is only read once.
+        self.assertIsNone(self.store.take('drive_id'))
+        self.assertDictEqual({}, self.store.take('other_id'))
+
+    def test_save_replaces(self):
+        self.store.save('drive_id', {'/a': SnapshotEntry(False, 1, 3, 100)})
+        self.store.save('drive_id', {'/b': SnapshotEntry(False, 2, 3, 100)})
+        self.assertListEqual(['/b'], list(self.store.take('drive_id')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+
+from onedrivee.store import task_db
+
+
+class TestTaskJournal(unittest.TestCase):
+    def setUp(self):
+        self.journal = task_db.TaskJournal(':memory:')
+
+    def tearDown(self):
+        self.journal.close()
+
+    def test_add_get_delete(self):
+        first = self.journal.add('drive_id', 'UploadFileTask', {'item_name': 'a'})
+        second = self.journal.add('drive_id', 'DeleteItemTask', {'item_name': 'b'})
+        self.assertEqual([(first, 'drive_id', 'UploadFileTask', {'item_name': 'a'}),
+                          (second, 'drive_id', 'DeleteItemTask', {'item_name': 'b'})], self.journal.get_all())
+        self.journal.delete(first)
+        self.assertEqual([second], [r[0] for r in self.journal.get_all()])
+
+
+if __name__ == '__main__':
+    unittest.main()
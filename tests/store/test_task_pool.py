@@ -1,6 +1,9 @@
+import threading
 import unittest
 
 from onedrivee.store import task_pool
+from onedrivee.store import task_db
+from onedrivee.workers.tasks.delete_task import DeleteItemTask
 from tests.factory.tasks_factory import get_sample_task_base
 
 
@@ -37,6 +40,104 @@ class TestTaskPool(unittest.TestCase):
         self.task_pool.add_task(self.task_base)
         self.task_pool.remove_children_tasks(self.task_base.drive.config.local_root)
         self.assertFalse(self.task_pool.has_pending_task(self.task_base.local_path))
+        # The permit released for the removed task is taken back.
+        self.assertFalse(self.task_pool.semaphore.acquire(blocking=False))
+
+    def test_delete_children_task_respects_name_boundary(self):
+        self.task_pool.add_task(self.task_base)
+        self.task_pool.remove_children_tasks(self.task_base.local_path[:-1])
+        self.assertTrue(self.task_pool.has_pending_task(self.task_base.local_path))
+        self.assertTrue(self.task_pool.has_pending_task_under(self.task_base.drive.config.local_root))
+        self.assertTrue(self.task_pool.has_pending_task_above(self.task_base.local_path + '/child'))
+        self.assertFalse(self.task_pool.has_pending_task_above(self.task_base.local_path))
+
+    def test_journal(self):
+        journal = task_db.TaskJournal(':memory:')
+        self.task_pool.set_journal(journal)
+        task = DeleteItemTask(self.task_base, '/', 'test', False)
+        self.task_pool.add_task(task)
+        self.assertEqual([(task.journal_id, task.drive.drive_id, 'DeleteItemTask', task.dump())], journal.get_all())
+        # A task queued on the same path is not recorded.
+        self.task_pool.add_task(DeleteItemTask(self.task_base, '/', 'test', False))
+        self.assertEqual(1, len(journal.get_all()))
+        self.assertIs(task, self.task_pool.pop_task())
+        self.task_pool.complete_task(task)
+        self.assertEqual([], journal.get_all())
+        loaded = DeleteItemTask.load(self.task_base, task.dump())
+        self.assertEqual((task.local_path, task.is_folder), (loaded.local_path, loaded.is_folder))
+
+    def test_journal_written_without_lock(self):
+        journal = task_db.TaskJournal(':memory:')
+        locked = []
+        add = journal.add
+        journal.add = lambda *args: locked.append(self.task_pool._lock.locked()) or add(*args)
+        self.task_pool.set_journal(journal)
+        self.task_pool.add_task(DeleteItemTask(self.task_base, '/', 'test', False))
+        self.assertEqual([False], locked)
+
+    def test_has_unjournaled_tasks(self):
+        self.task_pool.add_task(DeleteItemTask(self.task_base, '/', 'test', False))
+        self.assertFalse(self.task_pool.has_unjournaled_tasks())
+        self.task_pool.add_task(self.task_base)
+        self.assertTrue(self.task_pool.has_unjournaled_tasks())
+        tasks = [self.task_pool.pop_task(), self.task_pool.pop_task()]
+        # Popped but still being handled.
+        self.assertTrue(self.task_pool.has_unjournaled_tasks())
+        for task in tasks:
+            self.task_pool.complete_task(task)
+        self.assertFalse(self.task_pool.has_unjournaled_tasks())
+
+    def get_task(self, item_name, scheduling_class):
+        task = get_sample_task_base()
+        task.rel_parent_path = '/'
+        task.item_name = item_name
+        task.scheduling_class = scheduling_class
+        return task
+
+    def test_watermarks(self):
+        pool = task_pool.TaskPool(high_watermark=2, low_watermark=1)
+        pool.add_task(self.get_task('merge', 'merge'))
+        self.assertFalse(pool.is_full())
+        pool.add_task(self.get_task('change', 'change'))
+        self.assertTrue(pool.is_full())
+        # A producer that is not a task consumer waits for the pool to drain to the low watermark.
+        producer = threading.Thread(target=pool.add_task, args=(self.get_task('blocked', 'change'),))
+        producer.start()
+        producer.join(timeout=0.05)
+        self.assertTrue(producer.is_alive())
+        self.assertEqual('change', pool.pop_task_nowait().item_name)
+        producer.join(timeout=1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(2, pool.num_queued_tasks())
+        # Only tasks that do not expand the tree are popped in place.
+        self.assertEqual('blocked', pool.pop_task_nowait().item_name)
+        self.assertIsNone(pool.pop_task_nowait())
+
+    def test_producer_not_waiting_for_room(self):
+        pool = task_pool.TaskPool(high_watermark=1)
+        pool.add_task(self.get_task('change', 'change'))
+        self.assertTrue(pool.is_full())
+        producer = threading.Thread(target=pool.add_task, args=(self.get_task('event', 'change'),))
+        producer.waits_for_room = False
+        producer.start()
+        producer.join(timeout=1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(2, pool.num_queued_tasks())
+
+    def test_pop_task_of_queue(self):
+        pool = task_pool.TaskPool()
+        self.assertIsNone(pool.pop_task_of_queue('change', timeout=0.01))
+        pool.add_task(self.get_task('merge', 'merge'))
+        pool.add_task(self.get_task('change', 'change'))
+        self.assertEqual(1, pool.num_queued_tasks('merge'))
+        self.assertEqual('merge', pool.pop_task_of_queue('merge').item_name)
+        self.assertIsNone(pool.pop_task_of_queue('merge', timeout=0.01))
+        # A consumer waiting on a queue is woken up by a task added to it.
+        consumer = threading.Thread(target=pool.pop_task_of_queue, args=('merge', 1))
+        consumer.start()
+        pool.add_task(self.get_task('merge2', 'merge'))
+        consumer.join(timeout=1)
+        self.assertEqual(1, pool.num_queued_tasks())
 
 
 if __name__ == '__main__':